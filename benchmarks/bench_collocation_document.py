@@ -0,0 +1,49 @@
+"""Per-document throughput of collocation tokenization on wiki_sample_data.json.
+
+Compares the previous implementation of _collocation_document (one regex
+substitution pass per n-gram length, over alternations of up to top_n phrases)
+with the current token-level phrase trie.
+
+    python benchmarks/bench_collocation_document.py
+"""
+from __future__ import print_function
+
+import itertools
+import json
+import os
+import re
+import timeit
+
+from topik.tokenizers.ngrams import _collect_ngrams, _PhraseMatcher
+from topik.tokenizers.simple import _simple_document
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, "topik", "fileio", "tests",
+                    "data", "wiki_sample_data.json")
+
+
+def _previous_collocation_document(text, patterns, min_length=1, stopwords=None):
+    text = ' '.join(_simple_document(text, min_length=min_length, stopwords=stopwords))
+    for pattern in patterns:
+        text = re.sub(pattern, lambda match: match.group(0).replace(' ', '_'), text)
+    return text.split()
+
+
+def main(repeat=3):
+    with open(DATA) as f:
+        corpus = [(number, json.loads(line)["introduction"]) for number, line in enumerate(f)]
+    # every n-gram is a candidate, to get the long alternations a large corpus would give
+    ngrams = _collect_ngrams(corpus, min_freqs=[1, 1, 1])
+    regexes = [re.compile('(%s)' % '|'.join(' '.join(ngram) for ngram in same_length), re.UNICODE)
+               for same_length in ngrams]
+    matcher = _PhraseMatcher(itertools.chain.from_iterable(ngrams))
+    print("{} documents, {} phrases".format(len(corpus), sum(len(same_length) for same_length in ngrams)))
+    for name, func, patterns in [("before", _previous_collocation_document, regexes),
+                                 ("after", lambda text, patterns: patterns.merge(_simple_document(text)),
+                                  matcher)]:
+        seconds = min(timeit.repeat(lambda: [func(text, patterns) for doc_id, text in corpus],
+                                    number=1, repeat=repeat))
+        print("{:<7} {:>10.1f} docs/s".format(name, len(corpus) / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Latency and throughput of ModelOutput.infer on test_data_json_stream.json.
+
+Trains LDA and PLSA on the first half of the sample, then infers topics for the
+other half, one document per call (latency) and in batches (throughput).
+
+    python benchmarks/bench_model_infer.py
+"""
+from __future__ import print_function
+
+import json
+import os
+import timeit
+
+from topik.models import lda, plsa
+from topik.tokenizers.simple import SimpleTokenizer
+from topik.vectorizers import bag_of_words
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, "topik", "fileio", "tests",
+                    "data", "test_data_json_stream.json")
+
+
+def main(ntopics=10, batch_size=1000, repeat=3):
+    with open(DATA) as f:
+        texts = [json.loads(line)["abstract"] for line in f]
+    train, new = texts[:len(texts) // 2], texts[len(texts) // 2:]
+    tokenizer = SimpleTokenizer()
+    vectorized = bag_of_words((number, tokenizer(text)) for number, text in enumerate(train))
+    print("{} training documents, {} new documents, {} topics".format(
+        len(train), len(new), ntopics))
+    for name, model in [("lda", lda(vectorized, ntopics, random_state=42)),
+                        ("plsa", plsa(vectorized, ntopics, seed=42))]:
+        latency = min(timeit.repeat(lambda: [model.infer([text], tokenizer=tokenizer)
+                                             for text in new],
+                                    number=1, repeat=repeat)) / len(new)
+        throughput = len(new) / min(timeit.repeat(
+            lambda: model.infer(new, batch_size=batch_size, tokenizer=tokenizer),
+            number=1, repeat=repeat))
+        print("{:<5} {:>8.2f} ms/doc one at a time {:>10.1f} docs/s in batches of {}".format(
+            name, 1000 * latency, throughput, batch_size))
+
+
+if __name__ == "__main__":
+    main()
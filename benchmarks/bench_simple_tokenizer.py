@@ -0,0 +1,49 @@
+"""Per-document throughput of simple tokenization.
+
+Compares the previous implementation of _simple_document (gensim.utils.tokenize,
+with stopwords tested as given) with the current SimpleTokenizer, using the list of
+stopwords that run_pipeline passes.
+
+    python benchmarks/bench_simple_tokenizer.py
+"""
+from __future__ import print_function
+
+import random
+import timeit
+
+import gensim
+from stop_words import get_stop_words
+
+from topik.tokenizers.simple import _simple_document
+
+
+def _previous_simple_document(text, min_length=1, stopwords=None):
+    if not stopwords:
+        from gensim.parsing.preprocessing import STOPWORDS as stopwords
+    return [word for word in gensim.utils.tokenize(text, lower=True)
+            if word not in stopwords and len(word) >= min_length]
+
+
+def _make_documents(ndocs=2000, words_per_doc=200, seed=42):
+    random.seed(seed)
+    stopwords = get_stop_words("en")
+    words = ["prancercise", "unicorn", "sassy", "retirees", "Frank", "Swank-Tank",
+             "daily", "popular", "pastime", "2016", "class"] + stopwords[:60]
+    return [" ".join(random.choice(words) for _ in range(words_per_doc))
+            for _ in range(ndocs)]
+
+
+def main(repeat=3):
+    documents = _make_documents()
+    stopwords = get_stop_words("en")
+    for name, func in [("before", _previous_simple_document), ("after", _simple_document)]:
+        for stopword_name, stopword_arg in [("gensim STOPWORDS", None), ("stop_words list", stopwords)]:
+            seconds = min(timeit.repeat(
+                lambda: [func(document, stopwords=stopword_arg) for document in documents],
+                number=1, repeat=repeat))
+            print("{:<7} {:<17} {:>10.0f} docs/s".format(name, stopword_name,
+                                                        len(documents) / seconds))
+
+
+if __name__ == "__main__":
+    main()
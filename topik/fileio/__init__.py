@@ -6,6 +6,8 @@ from .in_document_folder import read_document_folder
 from .in_elastic import read_elastic
 from .out_elastic import ElasticSearchOutput
 from .out_memory import InMemoryOutput
+from .out_mmap import MmapOutput
+from .out_sqlite import SQLiteOutput
 
 from ._registry import registered_inputs, registered_outputs, register_input, register_output
 from .project import TopikProject
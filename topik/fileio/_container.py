@@ -0,0 +1,186 @@
+"""Binary container that saved outputs are written to.
+
+Layout::
+
+    MAGIC, format version (uint32)
+    sections, back to back: each one object, pickled on its own
+    manifest: utf-8 json listing the offset and length of every section
+    manifest offset (uint64), manifest length (uint64), MAGIC
+
+The manifest is written last, so sections can be streamed to the file as they
+are encoded, and is found from the end of the file, so opening a container only
+reads the manifest.  Values are decoded when the container is opened; lazy values
+and the sections of collections are decoded when they are first used.
+"""
+import io
+import json
+import os
+import struct
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from six.moves import cPickle as pickle
+
+MAGIC = b"TOPIKDAT"
+VERSION = 1
+_VERSION_FORMAT = "<I"
+_TRAILER_FORMAT = "<QQ"
+_TRAILER_SIZE = struct.calcsize(_TRAILER_FORMAT) + len(MAGIC)
+
+
+class RawSection(object):
+    """Already encoded section, copied to a new container without being decoded"""
+    def __init__(self, data):
+        self.data = data
+
+
+def _encode(value):
+    if isinstance(value, RawSection):
+        return value.data
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def is_container(filename):
+    with io.open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _replace(source, target):
+    """Rename source to target, replacing it.  Python 2 has no os.replace, and its
+    os.rename fails on Windows when target exists."""
+    if hasattr(os, "replace"):
+        os.replace(source, target)
+        return
+    try:
+        os.rename(source, target)
+    except OSError:
+        if not os.path.exists(target):
+            raise
+        os.remove(target)
+        os.rename(source, target)
+
+
+def write_container(filename, header, values, collections, lazy_values=None):
+    """Write a container, replacing filename only once it is complete.
+
+    Parameters
+    ----------
+    filename : str
+        file to write
+    header : dict
+        json-serializable data stored in the manifest itself
+    values : dict of {str: object}
+        each value is stored as a section of its own
+    collections : dict of {str: iterable of (key, object)}
+        named groups of sections.  Keys may be any json-serializable value.
+    lazy_values : dict of {str: object}
+        like values, but only decoded when they are used (see :meth:`ContainerReader.lazy_value`)
+    """
+    partial = filename + ".partial"
+    manifest = dict(header, version=VERSION, values={}, collections={}, lazy_values={})
+    with io.open(partial, "wb") as f:
+        f.write(MAGIC + struct.pack(_VERSION_FORMAT, VERSION))
+
+        def write_section(value):
+            data = _encode(value)
+            offset = f.tell()
+            f.write(data)
+            return [offset, len(data)]
+
+        for name, value in values.items():
+            manifest["values"][name] = write_section(value)
+        for name, value in (lazy_values or {}).items():
+            manifest["lazy_values"][name] = write_section(value)
+        for name, items in collections.items():
+            # a list of pairs rather than a dict: json would turn int keys into strings
+            manifest["collections"][name] = [[key] + write_section(value) for key, value in items]
+        manifest_data = json.dumps(manifest).encode("utf-8")
+        manifest_offset = f.tell()
+        f.write(manifest_data)
+        f.write(struct.pack(_TRAILER_FORMAT, manifest_offset, len(manifest_data)) + MAGIC)
+    # readers of the previous file keep reading it through their open handle (except
+    # on Windows, where it can only be replaced once they are closed)
+    _replace(partial, filename)
+
+
+class ContainerReader(object):
+    """Reads the manifest of a container, and its sections on demand"""
+    def __init__(self, filename):
+        self._file = io.open(filename, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a topik data file.".format(filename))
+        version, = struct.unpack(_VERSION_FORMAT, self._file.read(struct.calcsize(_VERSION_FORMAT)))
+        if version > VERSION:
+            raise ValueError("{} was written by a newer version of topik (format {}, this version "
+                             "reads up to {}).".format(filename, version, VERSION))
+        self._file.seek(-_TRAILER_SIZE, os.SEEK_END)
+        trailer = self._file.read(_TRAILER_SIZE)
+        if not trailer.endswith(MAGIC):
+            raise ValueError("{} is truncated.".format(filename))
+        manifest_offset, manifest_length = struct.unpack(_TRAILER_FORMAT, trailer[:-len(MAGIC)])
+        self.manifest = json.loads(self._read(manifest_offset, manifest_length).decode("utf-8"))
+
+    def _read(self, offset, length):
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def raw(self, location):
+        return RawSection(self._read(*location))
+
+    def load(self, location):
+        return pickle.loads(self._read(*location))
+
+    def value(self, name):
+        return self.load(self.manifest["values"][name])
+
+    def lazy_value(self, name):
+        """:class:`LazySection` of a lazy value, None if there is none of that name"""
+        location = self.manifest.get("lazy_values", {}).get(name)
+        return LazySection(self, location) if location is not None else None
+
+    def collection(self, name):
+        return Sections(self, self.manifest["collections"].get(name, []))
+
+    def close(self):
+        self._file.close()
+
+
+class LazySection(object):
+    """A section that is only read and decoded when load is called"""
+    def __init__(self, reader, location):
+        self._reader = reader
+        self._location = location
+
+    def load(self):
+        return self._reader.load(self._location)
+
+    def raw(self):
+        return self._reader.raw(self._location)
+
+
+class Sections(Mapping):
+    """Read-only mapping of the keys of a collection to its decoded sections.
+
+    Sections are decoded on every lookup; callers cache what they keep."""
+    def __init__(self, reader, entries):
+        self._reader = reader
+        self._locations = {_hashable(key): (offset, length) for key, offset, length in entries}
+
+    def __getitem__(self, key):
+        return self._reader.load(self._locations[key])
+
+    def raw(self, key):
+        return self._reader.raw(self._locations[key])
+
+    def __iter__(self):
+        return iter(self._locations)
+
+    def __len__(self):
+        return len(self._locations)
+
+
+def _hashable(key):
+    # json gives back lists for tuple keys
+    return tuple(_hashable(item) for item in key) if isinstance(key, list) else key
@@ -0,0 +1,82 @@
+"""Reading ahead of iterables in background threads."""
+import itertools
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+# seconds between checks of whether the caller has stopped iterating
+_POLL_INTERVAL = 0.1
+
+
+def prefetch(iterable, chunk_size, max_chunks=2):
+    """Yield the items of iterable, read in a background thread up to max_chunks
+    chunks of chunk_size items ahead of the caller.
+
+    Network reads, such as the pages of an Elasticsearch scroll, then overlap with
+    the processing of the items already read.  Exceptions raised while reading are
+    raised again in the caller.  If max_chunks is 0, iterable is read in the
+    calling thread.
+    """
+    if max_chunks <= 0:
+        return iter(iterable)
+    return prefetch_merged([iterable], chunk_size, max_chunks)
+
+
+def prefetch_merged(iterables, chunk_size, max_chunks=2):
+    """Yield the items of several iterables, each read in a background thread of
+    its own, as they arrive.
+
+    Items of each iterable keep their order, but those of different iterables are
+    interleaved.  Up to max_chunks chunks of chunk_size items, and at least one per
+    iterable, are read ahead of the caller.
+    """
+    chunks = queue.Queue(maxsize=max(max_chunks, len(iterables)))
+    stopped = threading.Event()
+
+    def put(kind, value=None):
+        # gives up once the caller has stopped iterating
+        while not stopped.is_set():
+            try:
+                chunks.put((kind, value), timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(iterable):
+        iterator = iter(iterable)
+        try:
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    put("done")
+                    return
+                if not put("items", chunk):
+                    break
+        except BaseException:
+            put("error", sys.exc_info())
+            return
+        # closing a generator runs its cleanup, such as clearing a scroll
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+    # the readers only start once the caller starts iterating
+    for iterable in iterables:
+        reader = threading.Thread(target=read, args=(iterable,))
+        reader.daemon = True
+        reader.start()
+    readers = len(iterables)
+    try:
+        while readers:
+            kind, value = chunks.get()
+            if kind == "done":
+                readers -= 1
+            elif kind == "error":
+                six.reraise(*value)
+            else:
+                for item in value:
+                    yield item
+    finally:
+        stopped.set()
@@ -1,10 +1,22 @@
 from abc import ABCMeta, abstractmethod
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 
-from six import with_metaclass
+import numpy as np
+from six import string_types, with_metaclass
 import jsonpickle
+import jsonpickle.ext.numpy as jsonpickle_numpy
 
+from topik.models.base_model_output import ModelOutput
+from topik.vectorizers.vectorizer_output import PositionalArrayView, VectorizerOutput
+from ._container import ContainerReader, is_container, write_container
 from ._registry import registered_outputs
 
+# vectorized and modeled corpora hold numpy arrays and scipy sparse matrices
+jsonpickle_numpy.register_handlers()
+
 
 class OutputInterface(with_metaclass(ABCMeta)):
     def __init__(self, *args, **kwargs):
@@ -20,18 +32,33 @@ class OutputInterface(with_metaclass(ABCMeta)):
         # should be a dictionary-like structure, with string ids for model used and parameters passed
         #     and dictionaries mapping doc id to list of tokens
         self.modeled_corpora = None
+        # the container this output was loaded from, which its lazily loaded results are read from
+        self._container = None
 
-    def save(self, filename, saved_data=None):
+    def save(self, filename, saved_data=None, saved_collections=None, lazy_data=None):
         """Persist this object to disk somehow.
 
-        You can save your data in any number of files in any format, but at a minimum, you need one json file that
-        describes enough to bootstrap the loading process.  Namely, you must have a key called 'class' so that upon
-        loading the output, the correct class can be instantiated and used to load any other data.  You don't have
-        to implement anything for saved_data, but it is stored as a key next to 'class'.
+        You can save your data in any number of files in any format, but at a minimum, you need one file that
+        describes enough to bootstrap the loading process.  This writes it: a binary container that records the
+        class of this output, so that upon loading the output, the correct class can be instantiated and used to
+        load any other data.
+
+        saved_data is a dictionary of keyword arguments to instantiate the class with.  Each value is stored in
+        a section of its own, and all of them are decoded on load.  saved_collections is a dictionary of
+        dictionary-like collections of results (tokenized corpora, models, ...) to pass as keyword arguments.
+        Each of their values is stored in a section of its own, which is only decoded when it is looked up; the
+        collections are passed to the class as read-only mappings.  lazy_data is like saved_data, but its
+        values are passed as sections that are only decoded when their load method is called; sections that
+        were never loaded may be saved again as they are, by passing their raw() instead.
 
         """
-        with open(filename, "w") as f:
-            f.write(jsonpickle.encode({"class": self.__class__.__name__, "saved_data": saved_data}, f))
+        collections = {}
+        for name, collection in (saved_collections or {}).items():
+            # lazily loaded collections copy the sections that were never decoded as they are
+            collections[name] = collection.sections() if hasattr(collection, "sections") \
+                else collection.items()
+        write_container(filename, {"class": self.__class__.__name__}, saved_data or {}, collections,
+                        lazy_data)
 
     def synchronize(self, max_wait, field):
         """By default, operations are synchronous and no additional wait is
@@ -44,10 +71,67 @@ class OutputInterface(with_metaclass(ABCMeta)):
         raise NotImplementedError
 
     def close(self):
-        pass
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+
+def _int_keys(mapping):
+    """json turns int keys (term ids and hashed document ids) into strings"""
+    return {int(key) if isinstance(key, string_types) and key.lstrip("-").isdigit() else key: value
+            for key, value in mapping.items()}
+
+
+def _term_frequency_array(term_frequency):
+    return PositionalArrayView(np.array([term_frequency[term_id]
+                                         for term_id in range(len(term_frequency))], dtype=np.int64))
+
+
+def _upgrade_result(result):
+    """Rebuild a vectorized corpus or model jsonpickled by earlier versions of topik.
+
+    These were held in dicts (_vectors and _id_term_map, _topic_term_matrix and _doc_topic_matrix).  jsonpickle
+    restores their attributes as they were saved, without calling __setstate__, so they are converted here to
+    the CSR matrix, vocabulary and arrays of the current layout.  Other results are returned as they are.
+    """
+    state = getattr(result, "__dict__", {})
+    if isinstance(result, VectorizerOutput) and "_vectors" in state:
+        return VectorizerOutput(id_term_map=_int_keys(state["_id_term_map"]),
+                                document_term_counts=_int_keys(state["_document_term_counts"]),
+                                doc_lengths=_int_keys(state["_doc_lengths"]),
+                                term_frequency=_term_frequency_array(_int_keys(state["_term_frequency"])),
+                                vectors=_int_keys(state["_vectors"]))
+    if isinstance(result, ModelOutput) and "_topic_term_matrix" in state:
+        return ModelOutput(vocab=_int_keys(state["_vocab"]),
+                           term_frequency=_term_frequency_array(_int_keys(state["_term_frequency"])),
+                           topic_term_matrix=state["_topic_term_matrix"],
+                           doc_lengths=_int_keys(state["_doc_lengths"]),
+                           doc_topic_matrix=_int_keys(state["_doc_topic_matrix"]))
+    return result
 
 
 def load_output(filename):
-    with open(filename) as f:
-        output_details = jsonpickle.decode(f.read())
-    return registered_outputs[output_details['class']](**output_details["saved_data"])
+    """Restore an output saved with :meth:`OutputInterface.save`.
+
+    Only the manifest of the file and the values in saved_data are read here.  Files jsonpickled by earlier
+    versions of topik are read in full, and the vectorized corpora and models in them are converted to the
+    current layout; they are written in the binary format the next time they are saved.  A container stays
+    open for the results that are read from it lazily until the output is closed.
+    """
+    if not is_container(filename):
+        with open(filename) as f:
+            output_details = jsonpickle.decode(f.read())
+        saved_data = output_details["saved_data"]
+        for name in ("vectorized_corpora", "modeled_corpora"):
+            results = saved_data.get(name)
+            if isinstance(results, MutableMapping):
+                for key in list(results.keys()):
+                    results[key] = _upgrade_result(results[key])
+        return registered_outputs[output_details['class']](**saved_data)
+    reader = ContainerReader(filename)
+    kwargs = {name: reader.value(name) for name in reader.manifest["values"]}
+    kwargs.update((name, reader.collection(name)) for name in reader.manifest["collections"])
+    kwargs.update((name, reader.lazy_value(name)) for name in reader.manifest.get("lazy_values", {}))
+    output = registered_outputs[reader.manifest["class"]](**kwargs)
+    output._container = reader
+    return output
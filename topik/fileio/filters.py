@@ -0,0 +1,351 @@
+"""Filter expressions for selecting documents of a corpus.
+
+Filters are written as python expressions over document fields, and are parsed,
+never evaluated.  Fields are referred to by name, or as ``{}['name']`` (the form
+that earlier versions of topik formatted each document into).  The supported
+expressions are:
+
+  * comparisons of a field with a constant: ``year >= 2000``, ``lang == 'en'``,
+    including chained ranges such as ``2000 <= year < 2010``
+  * set membership: ``lang in ('en', 'fr')``, ``lang not in ['de']``
+  * ``and``, ``or`` and ``not``
+  * ``int()``, ``float()`` and ``str()`` around a field, to compare it as a number
+    or as a string
+
+A parsed :class:`Filter` can be matched against documents with a closure that is
+compiled once, evaluated over columns of metadata as a numpy mask, or translated
+into an Elasticsearch query or an SQL condition.
+
+Examples
+--------
+>>> corpus_filter = compile_filter("2000 <= int(year) < 2010 and lang in ('en', 'fr')")
+>>> corpus_filter.matches({"year": "2004", "lang": "en"})
+True
+>>> corpus_filter.matches({"year": "2004", "lang": "de"})
+False
+>>> corpus_filter.mask({"year": ["1999", "2004"], "lang": ["en", "en"]}).tolist()
+[False, True]
+"""
+import ast
+import operator
+
+import numpy as np
+from six import string_types, text_type
+
+# name that documents are referred to by, in place of {}
+_DOC = "doc"
+
+_CONVERSIONS = {"int": int, "float": float, "str": text_type}
+
+_OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+              ">": operator.gt, ">=": operator.ge}
+
+_AST_OPERATORS = {ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=",
+                  ast.Gt: ">", ast.GtE: ">="}
+
+# operator to use when the operands are swapped, so that the field comes first
+_SWAPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+_ELASTIC_RANGES = {"<": "lt", "<=": "lte", ">": "gt", ">=": "gte"}
+
+# SQL expressions converting a column's values as int(), float() and str() do
+_SQL_CASTS = {int: "CAST({} AS NUMERIC)", float: "CAST({} AS NUMERIC)", text_type: "CAST({} AS TEXT)"}
+
+
+class Filter(object):
+    """Base class of parsed filter expressions"""
+    def matches(self, document):
+        """Whether document, a dict of fields, passes the filter"""
+        return self.compile()(document)
+
+    def compile(self):
+        """Function of a document returning whether it passes the filter"""
+        raise NotImplementedError
+
+    def mask(self, columns):
+        """Boolean array of whether each row of a table passes the filter.
+
+        columns is a dict of field name to a sequence of values, all of the same length."""
+        raise NotImplementedError
+
+    def to_elasticsearch(self):
+        """Equivalent Elasticsearch filter"""
+        raise NotImplementedError
+
+    def to_sql(self, columns, params):
+        """Equivalent SQL condition.  columns maps field names to column names;
+        values are appended to params, and referred to as ? placeholders."""
+        raise NotImplementedError
+
+
+def _column(columns, field):
+    if field not in columns:
+        raise ValueError("Documents have no field {} that can be filtered on.".format(field))
+    return columns[field]
+
+
+def _elastic_field(field, value):
+    """Field to match value against in Elasticsearch.  Strings are matched against
+    the keyword subfield that dynamic mappings add to text fields, as the text field
+    itself is analyzed into lowercased words."""
+    return field + ".keyword" if isinstance(value, string_types) else field
+
+
+def sql_cast(column, convert):
+    """SQL expression of the values of column, converted by convert (int, float,
+    str or None, for no conversion)"""
+    return _SQL_CASTS[convert].format(column) if convert is not None else column
+
+
+class _Comparison(Filter):
+    def __init__(self, field, op, value, convert=None):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.convert = convert
+
+    def compile(self):
+        field, compare, value, convert = self.field, _OPERATORS[self.op], self.value, self.convert
+        # missing fields only compare equal to None, like NULL in SQL
+        ordered = self.op not in ("==", "!=")
+
+        def matches(document):
+            field_value = document.get(field)
+            if field_value is None or value is None:
+                return not ordered and compare(field_value, value)
+            if convert is not None:
+                field_value = convert(field_value)
+            return compare(field_value, value)
+        return matches
+
+    def mask(self, columns):
+        values = np.asarray(_column(columns, self.field))
+        if self.convert is not None:
+            values = values.astype(self.convert)
+        return np.asarray(_OPERATORS[self.op](values, self.value), dtype=bool)
+
+    def to_elasticsearch(self):
+        if self.value is None:
+            if self.op in _ELASTIC_RANGES:
+                return {"bool": {"must_not": [{"match_all": {}}]}}
+            # matches documents that have the field (Elasticsearch 5 has no "missing" query)
+            exists = {"exists": {"field": self.field}}
+            return exists if self.op == "!=" else {"bool": {"must_not": [exists]}}
+        field = _elastic_field(self.field, self.value)
+        if self.op in _ELASTIC_RANGES:
+            return {"range": {field: {_ELASTIC_RANGES[self.op]: self.value}}}
+        query = {"term": {field: self.value}}
+        return query if self.op == "==" else {"bool": {"must_not": [query]}}
+
+    def to_sql(self, columns, params):
+        column = sql_cast(_column(columns, self.field), self.convert)
+        if self.value is None:
+            if self.op not in ("==", "!="):
+                return "0"
+            return "{} IS {}NULL".format(column, "NOT " if self.op == "!=" else "")
+        params.append(self.value)
+        condition = "{} {} ?".format(column, "=" if self.op == "==" else self.op)
+        # as in compile, missing fields (NULL) differ from every value
+        return "({} OR {} IS NULL)".format(condition, column) if self.op == "!=" else condition
+
+
+class _Membership(Filter):
+    def __init__(self, field, values, negate=False, convert=None):
+        self.field = field
+        self.values = values
+        self.negate = negate
+        self.convert = convert
+
+    def compile(self):
+        field, values, negate, convert = self.field, set(self.values), self.negate, self.convert
+
+        def matches(document):
+            field_value = document.get(field)
+            if convert is not None and field_value is not None:
+                field_value = convert(field_value)
+            return (field_value in values) != negate
+        return matches
+
+    def mask(self, columns):
+        values = np.asarray(_column(columns, self.field))
+        if self.convert is not None:
+            values = values.astype(self.convert)
+        return np.in1d(values, list(self.values), invert=self.negate)
+
+    def to_elasticsearch(self):
+        fields = {}
+        for value in self.values:
+            fields.setdefault(_elastic_field(self.field, value), []).append(value)
+        queries = [{"terms": {field: values}} for field, values in sorted(fields.items())]
+        query = queries[0] if len(queries) == 1 else {"bool": {"should": queries}}
+        return {"bool": {"must_not": [query]}} if self.negate else query
+
+    def to_sql(self, columns, params):
+        column = sql_cast(_column(columns, self.field), self.convert)
+        params.extend(self.values)
+        condition = "{} {}IN ({})".format(column, "NOT " if self.negate else "",
+                                          ", ".join("?" * len(self.values)))
+        # missing fields are in none of the values
+        return "({} OR {} IS NULL)".format(condition, column) if self.negate else condition
+
+
+class _And(Filter):
+    def __init__(self, filters):
+        self.filters = filters
+
+    def compile(self):
+        functions = [f.compile() for f in self.filters]
+        return lambda document: all(function(document) for function in functions)
+
+    def mask(self, columns):
+        return np.logical_and.reduce([f.mask(columns) for f in self.filters])
+
+    def to_elasticsearch(self):
+        # a lower and an upper bound on the same field make up a single range;
+        # further bounds are ranges of their own, which must all match
+        ranges = {}
+        queries = []
+        for f in self.filters:
+            query = f.to_elasticsearch()
+            if "range" in query:
+                (field, bounds), = query["range"].items()
+                (bound, value), = bounds.items()
+                merged = ranges.setdefault(field, bounds)
+                if merged is not bounds and not any(key[:2] == bound[:2] for key in merged):
+                    merged[bound] = value
+                    continue
+            queries.append(query)
+        return queries[0] if len(queries) == 1 else {"bool": {"must": queries}}
+
+    def to_sql(self, columns, params):
+        return "(" + " AND ".join(f.to_sql(columns, params) for f in self.filters) + ")"
+
+
+class _Or(Filter):
+    def __init__(self, filters):
+        self.filters = filters
+
+    def compile(self):
+        functions = [f.compile() for f in self.filters]
+        return lambda document: any(function(document) for function in functions)
+
+    def mask(self, columns):
+        return np.logical_or.reduce([f.mask(columns) for f in self.filters])
+
+    def to_elasticsearch(self):
+        return {"bool": {"should": [f.to_elasticsearch() for f in self.filters]}}
+
+    def to_sql(self, columns, params):
+        return "(" + " OR ".join(f.to_sql(columns, params) for f in self.filters) + ")"
+
+
+class _Not(Filter):
+    def __init__(self, filter):
+        self.filter = filter
+
+    def compile(self):
+        function = self.filter.compile()
+        return lambda document: not function(document)
+
+    def mask(self, columns):
+        return ~self.filter.mask(columns)
+
+    def to_elasticsearch(self):
+        return {"bool": {"must_not": [self.filter.to_elasticsearch()]}}
+
+    def to_sql(self, columns, params):
+        # conditions on missing fields are NULL in SQL, but false in compile
+        return "NOT COALESCE({}, 0)".format(self.filter.to_sql(columns, params))
+
+
+class _Parser(object):
+    def __init__(self, expression):
+        self.expression = expression
+
+    def parse(self):
+        try:
+            # {} stands for the document; "{0}" and "{}" both work with format
+            source = self.expression.format(*[_DOC] * max(self.expression.count("{}"), 1))
+            tree = ast.parse(source.strip(), mode="eval")
+        except (SyntaxError, IndexError, KeyError, ValueError):
+            raise ValueError("Filter is not a valid expression: {!r}".format(self.expression))
+        return self._filter(tree.body)
+
+    def _unsupported(self, node):
+        return ValueError("Unsupported filter expression {!r}: cannot filter on {}.".format(
+            self.expression, type(node).__name__))
+
+    def _filter(self, node):
+        if isinstance(node, ast.BoolOp):
+            filters = [self._filter(value) for value in node.values]
+            return _And(filters) if isinstance(node.op, ast.And) else _Or(filters)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return _Not(self._filter(node.operand))
+        if isinstance(node, ast.Compare):
+            filters = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                filters.append(self._comparison(left, op, right))
+                left = right
+            return filters[0] if len(filters) == 1 else _And(filters)
+        raise self._unsupported(node)
+
+    def _comparison(self, left, op, right):
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right, (ast.Tuple, ast.List, ast.Set)):
+                raise self._unsupported(right)
+            field, convert = self._field(left)
+            return _Membership(field, [self._literal(element) for element in right.elts],
+                               negate=isinstance(op, ast.NotIn), convert=convert)
+        if type(op) not in _AST_OPERATORS:
+            raise self._unsupported(op)
+        op = _AST_OPERATORS[type(op)]
+        try:
+            field, convert = self._field(left)
+            value = self._literal(right)
+        except ValueError:
+            # constant first, as in 2000 <= year
+            field, convert = self._field(right)
+            value = self._literal(left)
+            op = _SWAPPED[op]
+        return _Comparison(field, op, value, convert)
+
+    def _field(self, node):
+        """(field name, conversion or None) that node refers to"""
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+                node.func.id in _CONVERSIONS and len(node.args) == 1 and not node.keywords:
+            field, _ = self._field(node.args[0])
+            return field, _CONVERSIONS[node.func.id]
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and \
+                node.value.id == _DOC:
+            key = node.slice.value if isinstance(node.slice, ast.Index) else node.slice
+            return self._literal(key), None
+        if isinstance(node, ast.Name) and node.id not in ("True", "False", "None"):
+            return node.id, None
+        raise self._unsupported(node)
+
+    def _literal(self, node):
+        if isinstance(node, ast.Str):
+            return node.s
+        if isinstance(node, ast.Num):
+            return node.n
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and \
+                isinstance(node.operand, ast.Num):
+            return -node.operand.n
+        if isinstance(node, ast.Name) and node.id in ("True", "False", "None"):
+            return {"True": True, "False": False, "None": None}[node.id]
+        if isinstance(node, getattr(ast, "NameConstant", ())):
+            return node.value
+        raise self._unsupported(node)
+
+
+def compile_filter(expression):
+    """Parse a filter expression into a :class:`Filter`.  Filters are returned as they are."""
+    if isinstance(expression, Filter):
+        return expression
+    return _Parser(expression).parse()
+
+
+def date_range(field, start, end):
+    """Filter for documents whose field, as an integer, is between start and end inclusive"""
+    return _And([_Comparison(field, ">=", start, int), _Comparison(field, "<=", end, int)])
@@ -1,8 +1,31 @@
+from ._prefetch import prefetch, prefetch_merged
 from ._registry import register_input
 
 
+def scan_slices(client, slices=1, prefetch_pages=2, query=None, size=1000, **kwargs):
+    """Scroll over the documents matching query, in several sliced scrolls at once.
+
+    Each of the slices reads its part of the documents in a thread of its own, so
+    that several shards are read at the same time.  Documents are yielded as they
+    arrive, so their order varies from one scan to the next.  With a single slice,
+    this is :func:`elasticsearch.helpers.scan`, reading prefetch_pages pages ahead.
+
+    kwargs are passed on to :func:`elasticsearch.helpers.scan`.
+    """
+    from elasticsearch import helpers
+    if slices <= 1:
+        return prefetch(helpers.scan(client, query=query, size=size, **kwargs),
+                        size, prefetch_pages)
+    scans = []
+    for slice_id in range(slices):
+        body = dict(query) if query else {}
+        body["slice"] = {"id": slice_id, "max": slices}
+        scans.append(helpers.scan(client, query=body, size=size, **kwargs))
+    return prefetch_merged(scans, size, prefetch_pages)
+
+
 @register_input
-def read_elastic(hosts, **kwargs):
+def read_elastic(hosts, prefetch_pages=2, slices=1, **kwargs):
     """Iterate over all documents in the specified elasticsearch intance and index that match the specified query.
 
     kwargs are passed to Elasticsearch class instantiation, and can be used to pass any additional options
@@ -17,16 +40,25 @@ def read_elastic(hosts, **kwargs):
     content_field : str
         The name fo the field that contains the main text body of the document.
 
+    prefetch_pages : int
+        Number of pages of the scroll that are read ahead, in a background thread,
+        while earlier documents are being processed.  0 reads each page only when
+        it is needed.
+
+    slices : int
+        Number of sliced scrolls that read the documents in parallel, each in a
+        thread of its own.  Up to one per shard of the index is useful.  With more
+        than one, documents do not come in the order of a single scroll.
+
     **kwargs: additional keyword arguments to be passed to Elasticsearch client instance and to scan query.
               See
               https://elasticsearch-py.readthedocs.org/en/master/api.html#elasticsearch for all client options.
               https://elasticsearch-py.readthedocs.org/en/master/helpers.html#elasticsearch.helpers.scan for all scan options.
     """
     # TODO: add doctest
-    from elasticsearch import Elasticsearch, helpers
+    from elasticsearch import Elasticsearch
     es = Elasticsearch(hosts, **kwargs)
-    results = helpers.scan(es, **kwargs)
-    for result in results:
+    for result in scan_slices(es, slices, prefetch_pages, **kwargs):
         yield result['_source']
 
 
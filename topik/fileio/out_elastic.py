@@ -1,57 +1,321 @@
-from six.moves import UserDict
+from array import array
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from six.moves import UserDict, zip
+import itertools
 import logging
+import numbers
+import sys
+import threading
 import time
 
 from elasticsearch import Elasticsearch, helpers
+import numpy as np
+from scipy import sparse
+import six
 
+from ._prefetch import prefetch
 from ._registry import register_output
+from .in_elastic import scan_slices
 from .base_output import OutputInterface
+from .filters import compile_filter
 from topik.vectorizers.vectorizer_output import VectorizerOutput
+from topik.vectorizers.vocabulary import Vocabulary
 from topik.models.base_model_output import ModelOutput
 
-def es_setitem(key, value, doc_type, instance, index, batch_size=1000):
+# restored when an index had no refresh interval set; older servers reject null
+_DEFAULT_REFRESH_INTERVAL = "1s"
+
+
+@contextmanager
+def _refresh_disabled(instance, index):
+    """Turn off periodic refreshes of index while documents are loaded, then
+    restore its refresh interval and refresh it once.  The index is created if it
+    does not exist yet."""
+    if instance.indices.exists(index):
+        settings = instance.indices.get_settings(index=index, name="index.refresh_interval",
+                                                 flat_settings=True)
+        previous = settings.get(index, {}).get("settings", {}).get("index.refresh_interval",
+                                                                   _DEFAULT_REFRESH_INTERVAL)
+        instance.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1"}})
+    else:
+        previous = _DEFAULT_REFRESH_INTERVAL
+        instance.indices.create(index=index,
+                                body={"settings": {"index": {"refresh_interval": "-1"}}})
+    try:
+        yield
+    finally:
+        instance.indices.put_settings(index=index,
+                                      body={"index": {"refresh_interval": previous}})
+        instance.indices.refresh(index)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def es_bulk(instance, index, actions, thread_count=1, chunk_size=500,
+            max_chunk_bytes=100 * 1024 * 1024, max_retries=3, initial_backoff=2,
+            max_backoff=600):
+    """Send bulk actions to index, with refreshes turned off until they are all done.
+
+    Parameters
+    ----------
+    instance : Elasticsearch
+        client to send requests with
+    index : str
+        index that the actions apply to
+    actions : iterable of dict
+        bulk actions, as taken by :func:`elasticsearch.helpers.bulk`
+    thread_count : int
+        number of bulk requests in flight at once, while further actions are
+        read.  With more than one, actions on the same document in different
+        requests may be applied in any order.
+    chunk_size : int
+        number of actions per bulk request
+    max_chunk_bytes : int
+        largest size of a bulk request, in bytes
+    max_retries : int
+        number of times that actions rejected with a 429 (Too Many Requests)
+        status are retried
+    initial_backoff, max_backoff : float
+        seconds to wait before the first retry, doubling on each further retry
+        up to max_backoff
+
+    Retries need elasticsearch-py 5.5 or later.
+    """
+    options = dict(chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                   max_retries=max_retries, initial_backoff=initial_backoff,
+                   max_backoff=max_backoff)
+
+    def send(actions):
+        # with raise_on_error, helpers.bulk raises on the first 429 instead of retrying it
+        _, errors = helpers.bulk(instance, actions, index=index, raise_on_error=False, **options)
+        if errors:
+            raise helpers.BulkIndexError("{} document(s) failed to index.".format(len(errors)),
+                                         errors)
+
+    with _refresh_disabled(instance, index):
+        # actions are read in the pool's task thread, at most 2 * thread_count chunks
+        # ahead of the requests in flight, so producing them overlaps with sending
+        available = threading.Semaphore(2 * thread_count)
+        stopped = threading.Event()
+        failures = []
+
+        def queued(chunks):
+            try:
+                for chunk in chunks:
+                    available.acquire()
+                    if stopped.is_set():
+                        return
+                    yield chunk
+            except Exception:
+                # the pool does not pass on errors of the tasks iterable
+                failures.append(sys.exc_info())
+
+        def send_chunk(chunk):
+            try:
+                send(chunk)
+            finally:
+                available.release()
+
+        pool = ThreadPool(max(thread_count, 1))
+        try:
+            # with more than one thread, chunks are sent and finish in any order
+            for _ in pool.imap_unordered(send_chunk, queued(_chunks(actions, chunk_size))):
+                pass
+        finally:
+            # wakes up the pool's task feeder if a failed request left it waiting
+            stopped.set()
+            available.release()
+            pool.terminate()
+        if failures:
+            six.reraise(*failures[0])
+
+
+def es_set_fields(key, values, instance, index, batch_size=1000, **bulk_options):
+    """Load an iterable of (doc type, id, value) to field key of new or existing
+    documents of several types, in a single bulk load: one partial update per
+    document.
+
+    bulk_options are passed on to :func:`es_bulk`."""
+    actions = ({'_op_type': 'update',
+                '_index': index,
+                '_type': doc_type,
+                '_id': id,
+                'doc': {key: val},
+                'doc_as_upsert': "true",
+                } for doc_type, id, val in values)
+    es_bulk(instance, index, actions, chunk_size=batch_size, **bulk_options)
+
+
+def es_setitem(key, value, doc_type, instance, index, batch_size=1000, **bulk_options):
     """load an iterable of (id, value) pairs to the specified new or
-           new or existing field within existing documents."""
-    batch = []
-    for id, val in value:
-        action = {'_op_type': 'update',
-                  '_index': index,
-                  '_type': doc_type,
-                  '_id': id,
-                  'doc': {key: val},
-                  'doc_as_upsert': "true",
-                  }
-        batch.append(action)
-        if len(batch) >= batch_size:
-            helpers.bulk(client=instance, actions=batch,
-                         index=index)
-            batch = []
-    if batch:
-        helpers.bulk(client=instance, actions=batch, index=index)
-    instance.indices.refresh(index)
+           new or existing field within existing documents.
+
+    bulk_options are passed on to :func:`es_bulk`."""
+    es_set_fields(key, ((doc_type, id, val) for id, val in value), instance, index,
+                  batch_size, **bulk_options)
+
+def _hit_id(hit):
+    try:
+        return int(hit["_id"])
+    except ValueError:
+        return hit["_id"]
+
+
+def es_scan_fields(key, doc_types, instance, index, query=None, batch_size=1000,
+                   prefetch_pages=2):
+    """Yield (doc type, id, value) of field key of the documents of several types,
+    in a single scroll.  Only that field is fetched from each document; documents
+    without it are skipped.  Up to prefetch_pages pages of the scroll are read
+    ahead, while the documents already read are processed."""
+    body = dict(query) if query else {}
+    body["_source"] = [key]
+    for hit in prefetch(helpers.scan(instance, index=index, doc_type=",".join(doc_types),
+                                     query=body, size=batch_size),
+                        batch_size, prefetch_pages):
+        source = hit.get("_source", {})
+        if key in source:
+            yield hit["_type"], _hit_id(hit), source[key]
+
 
 def es_getitem(key, doc_type, instance, index, query=None):
-    results = helpers.scan(instance, index=index,
-                               query=query, doc_type=doc_type)
-    for result in results:
-        try:
-            id = int(result["_id"])
-        except ValueError:
-            id = result["_id"]
-        yield id, result['_source'][key]
+    for _, id, value in es_scan_fields(key, [doc_type], instance, index, query):
+        yield id, value
+
+
+# Vectorized corpora and models are stored under their key in documents of these
+# types: one "vocabulary" document (with the corpus's key as its id) holding the
+# terms and term frequencies, and one document per corpus document ("vector" or
+# "document") or topic ("topic") holding everything about it.
+_MODEL_TYPES = ("vocabulary", "topic", "document")
+
+
+def _vocabulary_source(id_term_map, term_frequency):
+    term_ids = sorted(id_term_map)
+    return {"term_ids": term_ids,
+            "terms": [id_term_map[term_id] for term_id in term_ids],
+            "term_frequencies": [term_frequency[term_id] for term_id in term_ids]}
+
+
+def _read_vocabulary(source):
+    """(id_term_map, term_frequency) dicts of a vocabulary document"""
+    return (dict(zip(source["term_ids"], source["terms"])),
+            dict(zip(source["term_ids"], source["term_frequencies"])))
+
+
+class ElasticVectorizedOutput(VectorizerOutput):
+    """Vectorized corpus stored in Elasticsearch, read when it is first used.
+
+    The vocabulary and term frequencies are read from one document, and the
+    vectors, lengths and term counts of documents in one scroll.  Only this
+    corpus's field is fetched from each document.  Iterating over the documents (see
+    :meth:`~.VectorizerOutput.iter_bow`), as models do, yields each vector as its
+    scroll batch arrives, so training can start before the scroll is done; the
+    first complete pass keeps the vectors in a CSR matrix for later passes.
+    """
+    def __init__(self, key, instance, index, query=None, batch_size=1000):
+        self._key = key
+        self._instance = instance
+        self._index = index
+        self._query = query
+        self._batch_size = batch_size
+        self._terms = None
+        self._documents = None
+        self._views = {}
+
+    def _scan(self, doc_types):
+        return es_scan_fields(self._key, doc_types, self._instance, self._index, self._query,
+                              self._batch_size)
+
+    def _load_terms(self):
+        if self._terms is None:
+            id_term_map, term_frequency = {}, {}
+            for _, _, value in self._scan(["vocabulary"]):
+                id_term_map, term_frequency = _read_vocabulary(value)
+            self._terms = Vocabulary.from_id_term_map(id_term_map), term_frequency
+        return self._terms
+
+    def _scan_documents(self):
+        """Yield (doc_id, [(term_id, weight), ...]) of each document as it is read.
+        Once every document has been read, they are kept as arrays."""
+        doc_ids, lengths, term_counts = [], {}, {}
+        indptr, indices, weights = array('l', [0]), array('i'), []
+        for _, doc_id, value in self._scan(["vector"]):
+            doc_ids.append(doc_id)
+            lengths[doc_id] = value["length"]
+            term_counts[doc_id] = value["term_count"]
+            indices.extend(value["term_ids"])
+            weights.extend(value["weights"])
+            indptr.append(len(indices))
+            yield doc_id, list(zip(value["term_ids"], value["weights"]))
+        dtype = np.int32 if all(isinstance(weight, numbers.Integral) for weight in weights) \
+            else np.float32
+        matrix = sparse.csr_matrix((np.asarray(weights, dtype=dtype),
+                                    np.frombuffer(indices, dtype=np.intc).astype(np.int32),
+                                    np.frombuffer(indptr, dtype=np.int_).astype(np.int64)),
+                                   shape=(len(doc_ids), len(self._load_terms()[0])))
+        self._documents = (doc_ids, matrix,
+                           np.array([term_counts[doc_id] for doc_id in doc_ids], dtype=np.int64),
+                           np.array([lengths[doc_id] for doc_id in doc_ids], dtype=np.int64))
+
+    def _load_documents(self):
+        if self._documents is None:
+            for _ in self._scan_documents():
+                pass
+        return self._documents
+
+    # the attributes VectorizerOutput reads its data from are loaded on first access
+    _vocabulary = property(lambda self: self._load_terms()[0])
+    _term_frequency = property(lambda self: self._load_terms()[1])
+    _doc_ids = property(lambda self: self._load_documents()[0])
+    _matrix = property(lambda self: self._load_documents()[1])
+    _document_term_counts = property(lambda self: self._load_documents()[2])
+    _doc_lengths = property(lambda self: self._load_documents()[3])
+
+    def iter_bow(self):
+        if self._documents is not None:
+            return super(ElasticVectorizedOutput, self).iter_bow()
+        return (row for _, row in self._scan_documents())
+
+    def get_vectors(self):
+        if self._documents is not None:
+            return super(ElasticVectorizedOutput, self).get_vectors()
+        return ((doc_id, dict(row)) for doc_id, row in self._scan_documents())
+
+    def __len__(self):
+        if self._documents is not None:
+            return len(self._documents[0])
+        return self._instance.count(index=self._index, doc_type="vector", body={
+            "query": {"bool": {"filter": {"exists": {"field": self._key}}}}})["count"]
+
+    def __reduce__(self):
+        # pickles as an in-memory vectorized output, without the connection
+        return (VectorizerOutput.from_arrays,
+                (self.vocabulary, self.doc_ids, self.matrix, self._document_term_counts,
+                 self._doc_lengths, self.term_frequency))
+
 
 class BaseElasticCorpora(UserDict):
     def __init__(self, instance, index, corpus_type, query=None,
-                 batch_size=1000):
+                 batch_size=1000, bulk_options=None):
         self.instance = instance
         self.index = index
         self.corpus_type = corpus_type
         self.query = query
         self.batch_size = batch_size
+        self.bulk_options = bulk_options or {}
         pass
 
     def __setitem__(self, key, value):
-        es_setitem(key, value, self.corpus_type, self.instance, self.index)
+        es_setitem(key, value, self.corpus_type, self.instance, self.index, self.batch_size,
+                   **self.bulk_options)
 
 
     def __getitem__(self, key):
@@ -60,75 +324,86 @@ class BaseElasticCorpora(UserDict):
 
 class VectorizedElasticCorpora(BaseElasticCorpora):
     def __setitem__(self, key, value):
-        #id_term_map
-        es_setitem(key,value.id_term_map.items(),"term",self.instance,self.index)
-        #document_term_counts
-        es_setitem(key,value.document_term_counts.items(),"document_term_count",self.instance,self.index)
-        #doc_lengths
-        es_setitem(key,value.doc_lengths.items(),"document_length",self.instance,self.index)
-        #global term_frequency
-        es_setitem(key,value.term_frequency.items(),"term_frequency",self.instance,self.index)
-        #vectors
-        es_setitem(key,value.vectors.items(),"vector",self.instance,self.index)
-        # could either upload vectors explicitly here (above) or using Super (below)
-        #super(VectorizedElasticCorpora, self).__setitem__(key, value)
+        def fields():
+            yield "vocabulary", key, _vocabulary_source(value.id_term_map, value.term_frequency)
+            # everything about a document goes in a single update of it
+            doc_lengths, term_counts = value.doc_lengths, value.document_term_counts
+            for doc_id, row in zip(value.doc_ids, value.iter_bow()):
+                yield "vector", doc_id, {"term_ids": [term_id for term_id, _ in row],
+                                         "weights": [weight for _, weight in row],
+                                         "length": doc_lengths[doc_id],
+                                         "term_count": term_counts[doc_id]}
+        es_set_fields(key, fields(), self.instance, self.index, self.batch_size,
+                      **self.bulk_options)
 
     def __getitem__(self, key):
-        # TODO: each of these should be retrieved from a query.  Populate the VectorizerOutput object
-        # and return it.  These things can be iterators instead of dicts; VectorizerOutput should
-        # not care.
-        # TODO: this is the id->term map for the full set of unique terms across all docs
-        id_term_map = {int(term_id): term for term_id, term in es_getitem(key,"term",self.instance,self.index,self.query)}
-        # 15
-        # TODO: this is the count of terms associated with each document
-        document_term_count = {int(doc_id): doc_term_count for doc_id, doc_term_count in es_getitem(key,"document_term_count",self.instance,self.index,self.query)}
-        # {"doc1": 3, "doc2": 5}
-        doc_lengths = {int(doc_id): doc_length for doc_id, doc_length in es_getitem(key,"document_length",self.instance,self.index,self.query)}
-        term_frequency = {int(term_id): global_frequency for term_id, global_frequency in es_getitem(key,"term_frequency",self.instance,self.index,self.query)}
-        # TODO: this is the vectorized representation of each document
-        vectors = {int(doc_id): {int(term_id): term_weight for term_id, term_weight in doc_term_weights.items()} for doc_id, doc_term_weights in es_getitem(key,"vector",self.instance,self.index,self.query)}
-        #vectors = {int(doc_id): {doc_term_weights for doc_id, doc_term_weights in es_getitem(key,"vector",self.instance,self.index,self.query)}
-        #vectors = list(es_getitem(key,"vector",self.instance,self.index,self.query))
-        #  {"doc1": {1: 3, 2: 1}  # word id is key, word count is value (for bag of words model)
-        return VectorizerOutput(id_term_map=id_term_map,
-                                document_term_counts=document_term_count,
-                                doc_lengths=doc_lengths,
-                                term_frequency=term_frequency,
-                                vectors=vectors)
+        return ElasticVectorizedOutput(key, self.instance, self.index, self.query,
+                                       self.batch_size)
+
 
 class ModeledElasticCorpora(BaseElasticCorpora):
     def __setitem__(self, key, value):
-        es_setitem(key,value.vocab.items(),"term",self.instance,self.index)
-        es_setitem(key,value.term_frequency.items(),"term_frequency",self.instance,self.index)
-        es_setitem(key,value.topic_term_matrix.items(),"topic_term_dist",self.instance,self.index)
-        es_setitem(key,value.doc_lengths.items(),"doc_length",self.instance,self.index)
-        es_setitem(key,value.doc_topic_matrix.items(),"doc_topic_dist",self.instance,self.index)
+        def fields():
+            yield "vocabulary", key, _vocabulary_source(value.vocab, value.term_frequency)
+            # rows of the weight arrays are converted to lists one at a time, as they are sent
+            for topic_id, row in zip(value.topic_ids, value.topic_term_array):
+                yield "topic", topic_id, row.tolist()
+            doc_lengths = value.doc_lengths
+            for doc_id, row in zip(value.doc_ids, value.doc_topic_array):
+                yield "document", doc_id, {"length": doc_lengths[doc_id], "topics": row.tolist()}
+        es_set_fields(key, fields(), self.instance, self.index, self.batch_size,
+                      **self.bulk_options)
 
     def __lt__(self, y):
         return super(ModeledElasticCorpora, self).__lt__(y)
 
     def __getitem__(self, key):
-        vocab = {int(term_id): term for term_id, term in \
-                 es_getitem(key,"term",self.instance,self.index,self.query)}
-        term_frequency = {int(term_id): tf for term_id, tf in \
-                          es_getitem(key,"term_frequency",self.instance,self.index,self.query)}
-        topic_term_matrix = {topic_id: topic_term_dist for topic_id, topic_term_dist in \
-                             es_getitem(key,"topic_term_dist",self.instance,self.index,self.query)}
-        doc_lengths = {topic_id: doc_length for topic_id, doc_length in \
-                       es_getitem(key,"doc_length",self.instance,self.index,self.query)}
-        doc_topic_matrix = {int(doc_id): doc_topic_dist for doc_id, doc_topic_dist in \
-                             es_getitem(key,"doc_topic_dist",self.instance,self.index,self.query)}
+        vocab, term_frequency, topic_term_matrix, doc_lengths = {}, {}, {}, {}
+        doc_ids, doc_topics = [], []
+        # one scroll over every part of the model, rather than one per part
+        for doc_type, id, value in es_scan_fields(key, _MODEL_TYPES, self.instance, self.index,
+                                                  self.query, self.batch_size):
+            if doc_type == "document":
+                doc_ids.append(id)
+                doc_topics.append(value["topics"])
+                doc_lengths[id] = value["length"]
+            elif doc_type == "topic":
+                topic_term_matrix[id] = value
+            else:
+                vocab, term_frequency = _read_vocabulary(value)
         return ModelOutput(vocab=vocab, term_frequency=term_frequency,
                            topic_term_matrix=topic_term_matrix,
                            doc_lengths=doc_lengths,
-                           doc_topic_matrix=doc_topic_matrix)
+                           doc_topic_matrix=np.array(doc_topics), doc_ids=doc_ids)
 
 @register_output
 class ElasticSearchOutput(OutputInterface):
+    """Stores documents and results in an Elasticsearch index.
+
+    Parameters
+    ----------
+    source : str or list of str
+        Elasticsearch hosts
+    index : str
+        index to store documents and results in
+    bulk_options : dict
+        options of the bulk loads of documents and results, as taken by
+        :func:`es_bulk`: thread_count (requests in flight at once; 1 by default),
+        max_chunk_bytes, max_retries, initial_backoff and max_backoff
+    prefetch_pages : int
+        pages of documents read ahead, in a background thread, while the
+        documents already read are tokenized or otherwise processed.  0 reads
+        each page only when it is needed.
+    slices : int
+        number of sliced scrolls reading documents in parallel, up to one per
+        shard of the index.  With more than one, the order of documents varies.
+    kwargs
+        passed on to the :class:`~elasticsearch.Elasticsearch` client
+    """
     def __init__(self, source, index, hash_field=None, doc_type='continuum',
                  query=None, iterable=None, filter_expression="",
                  vectorized_corpora=None, tokenized_corpora=None, modeled_corpora=None,
-                 **kwargs):
+                 bulk_options=None, prefetch_pages=2, slices=1, **kwargs):
         super(ElasticSearchOutput, self).__init__()
         self.hosts = source
         self.instance = Elasticsearch(hosts=source, **kwargs)
@@ -136,16 +411,22 @@ class ElasticSearchOutput(OutputInterface):
         self.doc_type = doc_type
         self.query = query
         self.hash_field = hash_field
+        self.bulk_options = bulk_options or {}
+        self.prefetch_pages = prefetch_pages
+        self.slices = slices
         if iterable:
             self.import_from_iterable(iterable, hash_field)
         self.filter_expression = filter_expression
 
         self.tokenized_corpora = tokenized_corpora if tokenized_corpora else \
-            BaseElasticCorpora(self.instance, self.index, 'tokenized', self.query)
+            BaseElasticCorpora(self.instance, self.index, 'tokenized', self.query,
+                               bulk_options=self.bulk_options)
         self.vectorized_corpora = vectorized_corpora if vectorized_corpora else \
-            VectorizedElasticCorpora(self.instance, self.index, 'vectorized', self.query)
+            VectorizedElasticCorpora(self.instance, self.index, 'vectorized', self.query,
+                                     bulk_options=self.bulk_options)
         self.modeled_corpora = modeled_corpora if modeled_corpora else \
-            ModeledElasticCorpora(self.instance, self.index, "models", self.query)
+            ModeledElasticCorpora(self.instance, self.index, "models", self.query,
+                                  bulk_options=self.bulk_options)
 
 
     @property
@@ -165,25 +446,20 @@ class ElasticSearchOutput(OutputInterface):
         """
         if field_to_hash:
             self.hash_field = field_to_hash
-            batch = []
-            for item in iterable:
-                if isinstance(item, basestring):
-                    item = {field_to_hash: item}
-                id = hash(item[field_to_hash])
-                action = {'_op_type': 'update',
-                          '_index': self.index,
-                          '_type': self.doc_type,
-                          '_id': id,
-                          'doc': item,
-                          'doc_as_upsert': "true",
-                          }
-                batch.append(action)
-                if len(batch) >= batch_size:
-                    helpers.bulk(client=self.instance, actions=batch, index=self.index)
-                    batch = []
-            if batch:
-                helpers.bulk(client=self.instance, actions=batch, index=self.index)
-            self.instance.indices.refresh(self.index)
+
+            def actions():
+                for item in iterable:
+                    if isinstance(item, basestring):
+                        item = {field_to_hash: item}
+                    yield {'_op_type': 'update',
+                           '_index': self.index,
+                           '_type': self.doc_type,
+                           '_id': hash(item[field_to_hash]),
+                           'doc': item,
+                           'doc_as_upsert': "true",
+                           }
+            es_bulk(self.instance, self.index, actions(), chunk_size=batch_size,
+                    **self.bulk_options)
         else:
             raise ValueError("A field_to_hash is required for import_from_iterable")
 
@@ -212,23 +488,32 @@ class ElasticSearchOutput(OutputInterface):
     def get_date_filtered_data(self, field_to_get, start, end, filter_field="date"):
         converted_index = self.convert_date_field_and_reindex(field=filter_field)
 
-        results = helpers.scan(self.instance, index=converted_index,
-                               doc_type=self.doc_type, query={
-            "query": {"filtered": {"filter": {"range": {filter_field: {
+        results = scan_slices(self.instance, self.slices, self.prefetch_pages,
+                              index=converted_index, doc_type=self.doc_type, query={
+            "query": {"bool": {"filter": {"range": {filter_field: {
                 "gte": start,"lte": end}}}}}})
         for result in results:
             yield result["_id"], result['_source'][field_to_get]
 
     def get_filtered_data(self, field_to_get, filter=""):
-        results = helpers.scan(self.instance, index=self.index,
-                               query=self.query, doc_type=self.doc_type)
+        query = self.query
+        if filter:
+            # the filter runs in Elasticsearch, alongside any query the output was created with
+            filtered = {"filter": compile_filter(filter).to_elasticsearch()}
+            if query and "query" in query:
+                filtered["must"] = query["query"]
+            query = {"query": {"bool": filtered}}
+        results = scan_slices(self.instance, self.slices, self.prefetch_pages,
+                              index=self.index, query=query, doc_type=self.doc_type)
         for result in results:
             yield result["_id"], result['_source'][field_to_get]
 
     def save(self, filename, saved_data=None):
         if saved_data is None:
             saved_data = {"source": self.hosts, "index": self.index, "hash_field": self.hash_field,
-                          "doc_type": self.doc_type, "query": self.query}
+                          "doc_type": self.doc_type, "query": self.query,
+                          "bulk_options": self.bulk_options,
+                          "prefetch_pages": self.prefetch_pages, "slices": self.slices}
         return super(ElasticSearchOutput, self).save(filename, saved_data)
 
     def synchronize(self, max_wait, field):
@@ -239,9 +524,9 @@ class ElasticSearchOutput(OutputInterface):
             count_not_yet_updated = self.instance.count(index=self.index,
                                              doc_type=self.doc_type,
                                              body={"query": {
-                                                        "constant_score" : {
-                                                            "filter" : {
-                                                                "missing" : {
+                                                        "bool" : {
+                                                            "must_not" : {
+                                                                "exists" : {
                                                                     "field" : field}}}}})['count']
             logging.debug("Count not yet updated: {}".format(count_not_yet_updated))
             time.sleep(0.01)
@@ -1,6 +1,8 @@
 from six.moves import UserDict
 import types
 
+from ._container import LazySection, Sections
+from .filters import compile_filter, date_range
 from ._registry import register_output
 from .base_output import OutputInterface
 
@@ -16,21 +18,108 @@ class GreedyDict(UserDict, object):
             yield val
 
 
+class LazyGreedyDict(GreedyDict):
+    """GreedyDict over the sections of a saved output.
+
+    Each value is only read and decoded when it is first looked up.  Values that
+    were never looked up are copied as they are when the output is saved again."""
+    def __init__(self, sections):
+        super(LazyGreedyDict, self).__init__()
+        self._sections = sections
+        self._pending = set(sections)
+
+    def __getitem__(self, key):
+        if key in self._pending:
+            self.data[key] = self._sections[key]
+            self._pending.discard(key)
+        return super(LazyGreedyDict, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        super(LazyGreedyDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+        else:
+            super(LazyGreedyDict, self).__delitem__(key)
+
+    def __contains__(self, key):
+        return key in self._pending or key in self.data
+
+    def __len__(self):
+        return len(self._pending) + len(self.data)
+
+    def keys(self):
+        return list(self.data.keys()) + list(self._pending)
+
+    def __iter__(self):
+        for key in self.keys():
+            yield self[key]
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def sections(self):
+        """(key, value) pairs to save, with values that were never decoded still encoded"""
+        for key in self.keys():
+            yield key, self._sections.raw(key) if key in self._pending else self.data[key]
+
+
+class LazyCorpus(GreedyDict):
+    """GreedyDict over the corpus section of a saved output, decoded when it is first used"""
+    def __init__(self, section):
+        super(LazyCorpus, self).__init__()
+        self._section = section
+
+    @property
+    def data(self):
+        if self._section is not None:
+            self._data = self._section.load()
+            self._section = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._section = None
+        self._data = value
+
+    def saved(self):
+        """the corpus to save, still encoded if it was never decoded"""
+        return self._section.raw() if self._section is not None else self._data
+
+
+def _results(saved):
+    if isinstance(saved, Sections):
+        return LazyGreedyDict(saved)
+    return saved if saved else GreedyDict()
+
+
 @register_output
 class InMemoryOutput(OutputInterface):
     def __init__(self, iterable=None, hash_field=None,
                  tokenized_corpora=None,
-                 vectorized_corpora=None, modeled_corpora=None):
+                 vectorized_corpora=None, modeled_corpora=None, corpus=None):
         super(InMemoryOutput, self).__init__()
 
-        self.corpus = GreedyDict()
+        self.hash_field = hash_field
 
+        if isinstance(corpus, LazySection):
+            self.corpus = LazyCorpus(corpus)
+        else:
+            self.corpus = GreedyDict()
+            if corpus:
+                # documents of a saved output, already keyed by id
+                self.corpus.data = corpus
         if iterable:
             self.import_from_iterable(iterable, hash_field)
 
-        self.tokenized_corpora = tokenized_corpora if tokenized_corpora else GreedyDict()
-        self.vectorized_corpora = vectorized_corpora if vectorized_corpora else GreedyDict()
-        self.modeled_corpora = modeled_corpora if modeled_corpora else GreedyDict()
+        self.tokenized_corpora = _results(tokenized_corpora)
+        self.vectorized_corpora = _results(vectorized_corpora)
+        self.modeled_corpora = _results(modeled_corpora)
 
     def import_from_iterable(self, iterable, field_to_hash):
         """
@@ -50,23 +139,24 @@ class InMemoryOutput(OutputInterface):
     # TODO: generalize for datetimes
     # TODO: validate input data to ensure that it has valid year data
     def get_date_filtered_data(self, field_to_get, start, end, filter_field="year"):
-        return self.get_filtered_data(field_to_get,
-                                      "{}<=int({}['{}'])<={}".format(start, "{}",
-                                                                     filter_field, end))
+        return self.get_filtered_data(field_to_get, date_range(filter_field, start, end))
 
     def get_filtered_data(self, field_to_get, filter=""):
         if not filter:
             for doc_id, doc in self.corpus.items():
                 yield doc_id, doc[field_to_get]
         else:
+            matches = compile_filter(filter).compile()
             for doc_id, doc in self.corpus.items():
-                if eval(filter.format(doc)):
+                if matches(doc):
                     yield doc_id, doc[field_to_get]
 
     def save(self, filename):
-        saved_data = {"iterable": self.corpus,
-                      "hash_field": self.hash_field,
-                      "modeled_corpora": self.modeled_corpora,
-                      "vectorized_corpora": self.vectorized_corpora,
-                      "tokenized_corpora": self.tokenized_corpora}
-        return super(InMemoryOutput, self).save(filename, saved_data)
+        saved_data = {"hash_field": self.hash_field}
+        saved_collections = {"modeled_corpora": self.modeled_corpora,
+                             "vectorized_corpora": self.vectorized_corpora,
+                             "tokenized_corpora": self.tokenized_corpora}
+        # the documents are only decoded when they are first filtered
+        corpus = self.corpus.saved() if isinstance(self.corpus, LazyCorpus) else self.corpus.data
+        return super(InMemoryOutput, self).save(filename, saved_data, saved_collections,
+                                                lazy_data={"corpus": corpus})
@@ -0,0 +1,438 @@
+from array import array
+import hashlib
+import io
+import json
+import os
+import shutil
+try:
+    from collections.abc import MutableMapping, Sequence
+except ImportError:
+    from collections import MutableMapping, Sequence
+
+import jsonpickle
+import numpy as np
+from scipy import sparse
+from six import iteritems, string_types, text_type
+from six.moves import range, zip
+
+from .filters import compile_filter, date_range
+from ._registry import register_output
+from .base_output import OutputInterface
+from topik.models.base_model_output import ModelOutput
+from topik.vectorizers.vectorizer_output import (VectorizerOutput, IndexedArrayView,
+                                                 PositionalArrayView)
+from topik.vectorizers.vocabulary import Vocabulary, _IdTermView
+
+# number of offsets buffered in memory before they are written out
+_OFFSETS_BUFFER = 65536
+# number of new document ids held in a set before they are merged into the sorted ids
+_IDS_BUFFER = 65536
+
+
+def _encode_json(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _decode_json(data):
+    return json.loads(data.decode("utf-8"))
+
+
+def _encode_tokens(tokens):
+    # tokens never contain newlines: tokenizers split on whitespace
+    return u"\n".join(tokens).encode("utf-8")
+
+
+def _decode_tokens(data):
+    return data.decode("utf-8").split(u"\n") if data else []
+
+
+def _map_file(filename, dtype):
+    """Memory-map a raw binary file; mmap does not accept empty files"""
+    if not os.path.getsize(filename):
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r")
+
+
+def _save_array(filename, values):
+    np.save(filename, np.ascontiguousarray(values))
+
+
+def _load_array(filename):
+    array = np.load(filename, mmap_mode="r")
+    # zero-size arrays come back as empty memmaps, which numpy cannot slice
+    return np.asarray(array) if not array.size else array
+
+
+class _RaggedWriter(object):
+    """Appends variable-length records to an offsets file and a data file"""
+    def __init__(self, path, encode, append=False):
+        self._encode = encode
+        exists = append and os.path.exists(path + ".offsets")
+        self._data = io.open(path + ".data", "ab" if exists else "wb")
+        self._offsets_file = io.open(path + ".offsets", "ab" if exists else "wb")
+        self._position = self._data.tell()
+        # the first record starts at 0
+        self._offsets = array('l') if exists else array('l', [0])
+
+    def append(self, value):
+        data = self._encode(value)
+        self._data.write(data)
+        self._position += len(data)
+        self._offsets.append(self._position)
+        if len(self._offsets) >= _OFFSETS_BUFFER:
+            self._flush()
+
+    def _flush(self):
+        # "l" is the widest typecode python 2 arrays support; files are always int64
+        self._offsets_file.write(
+            np.frombuffer(self._offsets, dtype=np.int_).astype("<i8").tobytes())
+        self._offsets = array('l')
+
+    def close(self):
+        self._flush()
+        self._data.close()
+        self._offsets_file.close()
+
+
+class _RaggedColumn(Sequence):
+    """Read-only sequence of the variable-length records written by _RaggedWriter.
+
+    Both files are memory-mapped, so opening takes constant time and records are
+    only decoded when they are accessed."""
+    def __init__(self, path, decode):
+        self._offsets = _map_file(path + ".offsets", "<i8")
+        self._data = _map_file(path + ".data", np.uint8)
+        self._decode = decode
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._decode(self._data[self._offsets[index]:self._offsets[index + 1]].tobytes())
+
+    def __iter__(self):
+        offsets, data, decode = self._offsets, self._data, self._decode
+        for index in range(len(self)):
+            yield decode(data[offsets[index]:offsets[index + 1]].tobytes())
+
+
+def _write_column(path, values, encode):
+    writer = _RaggedWriter(path, encode)
+    try:
+        for value in values:
+            writer.append(value)
+    finally:
+        writer.close()
+
+
+class _SortedIds(object):
+    """Ids of the stored documents, for skipping documents that are imported again.
+
+    The ids are kept sorted in a memory-mapped file and looked up with a binary
+    search, so memory use does not grow with the corpus; only the ids of the
+    current batch are held in a set until they are merged into the file."""
+    def __init__(self, filename, ids):
+        self._filename = filename
+        self._sorted = _load_array(filename) if os.path.exists(filename) else None
+        if self._sorted is None or len(self._sorted) != len(ids):
+            # missing in outputs written by earlier versions, or out of date if an import was interrupted
+            self._sorted = None
+            _save_array(filename, np.sort(np.fromiter(ids, dtype=np.int64, count=len(ids))))
+            self._sorted = _load_array(filename)
+        self._batch = set()
+
+    def __contains__(self, id):
+        if id in self._batch:
+            return True
+        index = np.searchsorted(self._sorted, id)
+        return index < len(self._sorted) and self._sorted[index] == id
+
+    def add(self, id):
+        self._batch.add(id)
+        if len(self._batch) >= _IDS_BUFFER:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        new = np.sort(np.fromiter(self._batch, dtype=np.int64, count=len(self._batch)))
+        merged = np.insert(self._sorted, np.searchsorted(self._sorted, new), new)
+        # unmap the file before it is overwritten
+        self._sorted = None
+        _save_array(self._filename, merged)
+        self._sorted = _load_array(self._filename)
+        self._batch = set()
+
+
+class _TokenizedColumns(object):
+    """Restartable iterable of (doc_id, tokens) over saved columns"""
+    def __init__(self, path):
+        self._ids = _RaggedColumn(os.path.join(path, "ids"), _decode_json)
+        self._tokens = _RaggedColumn(os.path.join(path, "tokens"), _decode_tokens)
+
+    def __iter__(self):
+        return zip(self._ids, self._tokens)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class _ResultStore(MutableMapping):
+    """Dict-like store of results, one directory per key.
+
+    Values are written to a temporary directory that replaces the previous one
+    only once complete.  Nothing is read until a value is looked up."""
+    def __init__(self, path):
+        self.path = path
+
+    def _directory(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def __setitem__(self, key, value):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        directory = self._directory(key)
+        partial = directory + ".partial"
+        if os.path.exists(partial):
+            shutil.rmtree(partial)
+        os.makedirs(partial)
+        self._write(partial, value)
+        with io.open(os.path.join(partial, "key"), "w", encoding="utf-8") as f:
+            f.write(key if isinstance(key, text_type) else key.decode("utf-8"))
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(partial, directory)
+
+    def __getitem__(self, key):
+        directory = self._directory(key)
+        if not os.path.exists(os.path.join(directory, "key")):
+            raise KeyError(key)
+        return self._read(directory)
+
+    def __delitem__(self, key):
+        directory = self._directory(key)
+        if not os.path.exists(directory):
+            raise KeyError(key)
+        shutil.rmtree(directory)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._directory(key), "key"))
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            key_file = os.path.join(self.path, name, "key")
+            if os.path.exists(key_file):
+                with io.open(key_file, encoding="utf-8") as f:
+                    yield f.read()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _TokenizedStore(_ResultStore):
+    def _write(self, directory, tokenized_corpus):
+        ids = _RaggedWriter(os.path.join(directory, "ids"), _encode_json)
+        tokens = _RaggedWriter(os.path.join(directory, "tokens"), _encode_tokens)
+        try:
+            for doc_id, doc_tokens in tokenized_corpus:
+                ids.append(doc_id)
+                tokens.append(doc_tokens)
+        finally:
+            ids.close()
+            tokens.close()
+
+    def _read(self, directory):
+        return _TokenizedColumns(directory)
+
+
+def _write_vocabulary(directory, vocabulary):
+    if type(vocabulary) is Vocabulary:
+        vocabulary.save(os.path.join(directory, "vocabulary.bin"))
+    else:
+        with open(os.path.join(directory, "vocabulary.json"), "w") as f:
+            f.write(jsonpickle.encode(vocabulary))
+
+
+def _read_vocabulary(directory):
+    if os.path.exists(os.path.join(directory, "vocabulary.bin")):
+        return Vocabulary.load(os.path.join(directory, "vocabulary.bin"), mmap=True)
+    with open(os.path.join(directory, "vocabulary.json")) as f:
+        return jsonpickle.decode(f.read())
+
+
+def _term_array(mapping, nterms):
+    """Array of the values of a {term_id: value} mapping, indexed by term id"""
+    return np.fromiter((mapping.get(term_id, 0) for term_id in range(nterms)),
+                       dtype=np.int64, count=nterms)
+
+
+class _VectorizedStore(_ResultStore):
+    def _write(self, directory, vectorized_corpus):
+        matrix = vectorized_corpus.matrix
+        _write_vocabulary(directory, vectorized_corpus.vocabulary)
+        _write_column(os.path.join(directory, "ids"), vectorized_corpus.doc_ids, _encode_json)
+        for name in ("data", "indices", "indptr"):
+            _save_array(os.path.join(directory, name + ".npy"), getattr(matrix, name))
+        _save_array(os.path.join(directory, "shape.npy"), np.array(matrix.shape, dtype=np.int64))
+        _save_array(os.path.join(directory, "document_term_counts.npy"),
+                    vectorized_corpus._document_term_counts)
+        _save_array(os.path.join(directory, "doc_lengths.npy"), vectorized_corpus._doc_lengths)
+        _save_array(os.path.join(directory, "term_frequency.npy"),
+                    _term_array(vectorized_corpus.term_frequency, matrix.shape[1]))
+
+    def _read(self, directory):
+        arrays = {name: _load_array(os.path.join(directory, name + ".npy"))
+                  for name in ("data", "indices", "indptr", "shape", "document_term_counts",
+                               "doc_lengths", "term_frequency")}
+        matrix = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                   shape=tuple(arrays["shape"].tolist()), copy=False)
+        return VectorizerOutput.from_arrays(
+            vocabulary=_read_vocabulary(directory),
+            doc_ids=_RaggedColumn(os.path.join(directory, "ids"), _decode_json),
+            matrix=matrix,
+            document_term_counts=arrays["document_term_counts"],
+            doc_lengths=arrays["doc_lengths"],
+            term_frequency=PositionalArrayView(arrays["term_frequency"]))
+
+
+class _ModeledStore(_ResultStore):
+    def _write(self, directory, modeled_corpus):
+        nterms = modeled_corpus.topic_term_array.shape[1]
+        _save_array(os.path.join(directory, "topic_term.npy"), modeled_corpus.topic_term_array)
+        _save_array(os.path.join(directory, "doc_topic.npy"), modeled_corpus.doc_topic_array)
+        _write_column(os.path.join(directory, "ids"), modeled_corpus.doc_ids, _encode_json)
+        vocab = modeled_corpus.vocab
+        _write_column(os.path.join(directory, "vocab"),
+                      (vocab[term_id] for term_id in range(nterms)), _encode_json)
+        _save_array(os.path.join(directory, "term_frequency.npy"),
+                    _term_array(modeled_corpus.term_frequency, nterms))
+        length_ids = _RaggedWriter(os.path.join(directory, "length_ids"), _encode_json)
+        doc_lengths = array('l')
+        try:
+            for doc_id, doc_length in iteritems(modeled_corpus.doc_lengths):
+                length_ids.append(doc_id)
+                doc_lengths.append(doc_length)
+        finally:
+            length_ids.close()
+        _save_array(os.path.join(directory, "doc_lengths.npy"),
+                    np.frombuffer(doc_lengths, dtype=np.int_).astype(np.int64))
+        # trained state is model-sized rather than corpus-sized
+        with open(os.path.join(directory, "model.json"), "w") as f:
+            f.write(jsonpickle.encode({"model_state": modeled_corpus.model_state,
+                                       "update_func": modeled_corpus._update_func}))
+
+    def _read(self, directory):
+        with open(os.path.join(directory, "model.json")) as f:
+            model = jsonpickle.decode(f.read())
+        return ModelOutput(
+            vocab=_IdTermView(_RaggedColumn(os.path.join(directory, "vocab"), _decode_json)),
+            term_frequency=PositionalArrayView(
+                _load_array(os.path.join(directory, "term_frequency.npy"))),
+            topic_term_matrix=_load_array(os.path.join(directory, "topic_term.npy")),
+            doc_lengths=IndexedArrayView(
+                _RaggedColumn(os.path.join(directory, "length_ids"), _decode_json),
+                _load_array(os.path.join(directory, "doc_lengths.npy"))),
+            doc_topic_matrix=_load_array(os.path.join(directory, "doc_topic.npy")),
+            doc_ids=_RaggedColumn(os.path.join(directory, "ids"), _decode_json),
+            model_state=model["model_state"], update_func=model["update_func"])
+
+
+@register_output
+class MmapOutput(OutputInterface):
+    """Stores everything on disk, in binary files that are memory-mapped when read.
+
+    Raw documents, token lists, vectorized matrices and model weights are written as
+    they are produced, under the directory path, rather than being held in memory
+    until the project is saved.  Variable-length records (documents, token lists,
+    ids) are stored as an offsets file plus a data file; arrays are stored as .npy
+    files.  Opening a saved output does not read any of them: results are
+    memory-mapped when they are first looked up, so memory use stays bounded by
+    what is being processed rather than by the size of the corpus.
+
+    Parameters
+    ----------
+    path : str
+        Directory to store data in.  Created if it does not exist.
+    hash_field : None or str
+        Field of raw documents that their ids are computed from.
+    """
+    def __init__(self, path, hash_field=None, iterable=None):
+        super(MmapOutput, self).__init__()
+        self.path = path
+        self.hash_field = hash_field
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.tokenized_corpora = _TokenizedStore(os.path.join(path, "tokenized"))
+        self.vectorized_corpora = _VectorizedStore(os.path.join(path, "vectorized"))
+        self.modeled_corpora = _ModeledStore(os.path.join(path, "modeled"))
+        if iterable:
+            self.import_from_iterable(iterable, hash_field)
+
+    def _corpus_path(self, name):
+        return os.path.join(self.path, "corpus", name)
+
+    def _corpus_column(self, name, decode=_decode_json):
+        if not os.path.exists(self._corpus_path(name) + ".offsets"):
+            return []
+        return _RaggedColumn(self._corpus_path(name), decode)
+
+    def import_from_iterable(self, iterable, field_to_hash):
+        """Append documents to the stored corpus.
+
+        iterable: generally a list of dicts, but possibly a list of strings
+            This is your data.  Documents whose field_to_hash has been imported
+            before are skipped.
+        """
+        if not os.path.exists(os.path.join(self.path, "corpus")):
+            os.makedirs(os.path.join(self.path, "corpus"))
+        if self.hash_field is not None and self.hash_field != field_to_hash:
+            raise ValueError("Documents in this output are identified by {}, not {}.".format(
+                self.hash_field, field_to_hash))
+        self.hash_field = field_to_hash
+        known_ids = _SortedIds(self._corpus_path("ids") + ".sorted.npy", self._corpus_column("ids"))
+        writers = [_RaggedWriter(self._corpus_path(name), _encode_json, append=True)
+                   for name in ("ids", "texts", "documents")]
+        try:
+            for item in iterable:
+                if isinstance(item, string_types):
+                    item = {field_to_hash: item}
+                elif field_to_hash not in item and field_to_hash in list(item.values())[0]:
+                    item = list(item.values())[0]
+                id = hash(item[field_to_hash])
+                if id in known_ids:
+                    continue
+                known_ids.add(id)
+                # the hashed field gets a column of its own, so that it can be read
+                #    without decoding whole documents
+                for writer, value in zip(writers, (id, item[field_to_hash], item)):
+                    writer.append(value)
+        finally:
+            for writer in writers:
+                writer.close()
+            known_ids.flush()
+
+    # TODO: generalize for datetimes
+    def get_date_filtered_data(self, field_to_get, start, end, filter_field="year"):
+        return self.get_filtered_data(field_to_get, date_range(filter_field, start, end))
+
+    def get_filtered_data(self, field_to_get, filter=""):
+        ids = self._corpus_column("ids")
+        if not filter and field_to_get == self.hash_field:
+            for doc_id, text in zip(ids, self._corpus_column("texts")):
+                yield doc_id, text
+        else:
+            matches = compile_filter(filter).compile() if filter else None
+            for doc_id, doc in zip(ids, self._corpus_column("documents")):
+                if matches is None or matches(doc):
+                    yield doc_id, doc[field_to_get]
+
+    def save(self, filename):
+        # results are written to path as they are stored; only their location is saved here
+        saved_data = {"path": self.path, "hash_field": self.hash_field}
+        return super(MmapOutput, self).save(filename, saved_data)
@@ -0,0 +1,252 @@
+import json
+import numbers
+import sqlite3
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from six import string_types
+from six.moves import cPickle as pickle
+
+from ._registry import register_output
+from .base_output import OutputInterface
+from .filters import compile_filter, date_range, sql_cast
+from .out_mmap import _decode_tokens, _encode_tokens
+
+# rows fetched per query when iterating over documents or tokens
+_BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, content TEXT, document TEXT);
+CREATE TABLE IF NOT EXISTS fields (name TEXT PRIMARY KEY, column_name TEXT);
+CREATE TABLE IF NOT EXISTS tokens (corpus TEXT, doc_id INTEGER, tokens BLOB);
+CREATE INDEX IF NOT EXISTS tokens_corpus ON tokens (corpus);
+CREATE TABLE IF NOT EXISTS results (kind TEXT, name TEXT, data BLOB, PRIMARY KEY (kind, name));
+"""
+
+
+def _is_metadata(value):
+    return isinstance(value, (string_types, numbers.Number)) and value is not None
+
+
+def _pages(connection, query, params, key_index=0):
+    """Run query in pages of _BATCH rows, resuming after the last key seen.
+
+    query ends in a comparison of the key with a placeholder for the operator
+    ({after}), ordering by the key and a limit, which take the last key and the
+    page size as their parameters.  Each page is a separate query, so writes (and
+    commits) may happen while the rows are being consumed."""
+    # the first page starts at the smallest key, rather than after it
+    after, last_key = ">=", -2 ** 63
+    while True:
+        rows = connection.execute(query.format(after=after),
+                                  list(params) + [last_key, _BATCH]).fetchall()
+        for row in rows:
+            yield row
+        if len(rows) < _BATCH:
+            return
+        after, last_key = ">", rows[-1][key_index]
+
+
+class _TokenizedRows(object):
+    """Restartable iterable of (doc_id, tokens) of one tokenized corpus"""
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def __iter__(self):
+        for _, doc_id, tokens in _pages(
+                self._connection, "SELECT rowid, doc_id, tokens FROM tokens "
+                                  "WHERE corpus = ? AND rowid {after} ? ORDER BY rowid LIMIT ?",
+                [self._name]):
+            yield doc_id, _decode_tokens(bytes(tokens))
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM tokens WHERE corpus = ?",
+                                        [self._name]).fetchone()[0]
+
+
+class _SQLiteTokenizedCorpora(MutableMapping):
+    """Tokenized corpora, one row per document"""
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __setitem__(self, key, tokenized_corpus):
+        with self._connection:
+            self._connection.execute("DELETE FROM tokens WHERE corpus = ?", [key])
+            self._connection.executemany(
+                "INSERT INTO tokens (corpus, doc_id, tokens) VALUES (?, ?, ?)",
+                ((key, doc_id, sqlite3.Binary(_encode_tokens(tokens)))
+                 for doc_id, tokens in tokenized_corpus))
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return _TokenizedRows(self._connection, key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        with self._connection:
+            self._connection.execute("DELETE FROM tokens WHERE corpus = ?", [key])
+
+    def __contains__(self, key):
+        return self._connection.execute("SELECT 1 FROM tokens WHERE corpus = ? LIMIT 1",
+                                        [key]).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in
+                     self._connection.execute("SELECT DISTINCT corpus FROM tokens")])
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(DISTINCT corpus) FROM tokens").fetchone()[0]
+
+
+class _SQLiteResults(MutableMapping):
+    """Vectorized corpora or models of one kind, each pickled into a blob"""
+    def __init__(self, connection, kind):
+        self._connection = connection
+        self._kind = kind
+
+    def __setitem__(self, key, value):
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (kind, name, data) VALUES (?, ?, ?)",
+                [self._kind, key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))])
+
+    def __getitem__(self, key):
+        row = self._connection.execute("SELECT data FROM results WHERE kind = ? AND name = ?",
+                                       [self._kind, key]).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(bytes(row[0]))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        with self._connection:
+            self._connection.execute("DELETE FROM results WHERE kind = ? AND name = ?",
+                                     [self._kind, key])
+
+    def __contains__(self, key):
+        return self._connection.execute("SELECT 1 FROM results WHERE kind = ? AND name = ?",
+                                        [self._kind, key]).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._connection.execute(
+            "SELECT name FROM results WHERE kind = ? ORDER BY rowid", [self._kind])])
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results WHERE kind = ?",
+                                        [self._kind]).fetchone()[0]
+
+
+@register_output
+class SQLiteOutput(OutputInterface):
+    """Stores documents and results in an SQLite database file.
+
+    Every scalar field of the documents (other than the hashed content field, and
+    nested values such as lists) gets an indexed column of its own, so corpus
+    filters and date ranges are translated into SQL queries that only read the
+    matching rows, rather than being evaluated on every document.  Token lists are
+    stored one row per document; vectorized corpora and models as blobs.
+
+    Parameters
+    ----------
+    path : str
+        Database file.  Created if it does not exist.
+    hash_field : None or str
+        Field of raw documents that their ids are computed from.
+    """
+    def __init__(self, path, hash_field=None, iterable=None):
+        super(SQLiteOutput, self).__init__()
+        self.path = path
+        self.hash_field = hash_field
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        self._columns = dict(self._connection.execute("SELECT name, column_name FROM fields"))
+        self.tokenized_corpora = _SQLiteTokenizedCorpora(self._connection)
+        self.vectorized_corpora = _SQLiteResults(self._connection, "vectorized")
+        self.modeled_corpora = _SQLiteResults(self._connection, "modeled")
+        if iterable:
+            self.import_from_iterable(iterable, hash_field)
+
+    def _column(self, field):
+        """Name of the indexed column holding field, adding it if necessary"""
+        if field not in self._columns:
+            column = "field_{}".format(len(self._columns))
+            # no type affinity: values are stored as they are given ('02134' stays a string)
+            self._connection.execute("ALTER TABLE documents ADD COLUMN {}".format(column))
+            self._connection.execute("CREATE INDEX documents_{0} ON documents ({0})".format(column))
+            # int() and float() comparisons (such as date ranges) use an index of the numeric values
+            self._connection.execute("CREATE INDEX documents_{}_number ON documents ({})".format(
+                column, sql_cast(column, int)))
+            self._connection.execute("INSERT INTO fields (name, column_name) VALUES (?, ?)",
+                                     [field, column])
+            self._columns[field] = column
+        return self._columns[field]
+
+    def import_from_iterable(self, iterable, field_to_hash):
+        """
+        iterable: generally a list of dicts, but possibly a list of strings
+            This is your data.  Documents are replaced by later ones with the
+            same field_to_hash.
+        """
+        self.hash_field = field_to_hash
+        with self._connection:
+            for item in iterable:
+                if isinstance(item, string_types):
+                    item = {field_to_hash: item}
+                elif field_to_hash not in item and field_to_hash in list(item.values())[0]:
+                    item = list(item.values())[0]
+                metadata = [(self._column(field), value) for field, value in sorted(item.items())
+                            if field != field_to_hash and _is_metadata(value)]
+                columns = ["id", "content", "document"] + [column for column, _ in metadata]
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO documents ({}) VALUES ({})".format(
+                        ", ".join(columns), ", ".join("?" * len(columns))),
+                    [hash(item[field_to_hash]), item[field_to_hash], json.dumps(item)] +
+                    [value for _, value in metadata])
+
+    def _documents(self, field_to_get, condition="1", params=()):
+        if field_to_get == self.hash_field:
+            selected, decode = "content", None
+        elif field_to_get in self._columns:
+            selected, decode = self._columns[field_to_get], None
+        else:
+            selected, decode = "document", lambda document: json.loads(document)[field_to_get]
+        for doc_id, value in _pages(
+                self._connection, "SELECT id, {} FROM documents WHERE {} AND id {{after}} ? "
+                                  "ORDER BY id LIMIT ?".format(selected, condition), params):
+            yield doc_id, decode(value) if decode else value
+
+    def _filtered(self, field_to_get, corpus_filter):
+        columns = dict(self._columns)
+        if self.hash_field:
+            columns[self.hash_field] = "content"
+        params = []
+        condition = compile_filter(corpus_filter).to_sql(columns, params)
+        return self._documents(field_to_get, condition, params)
+
+    def get_date_filtered_data(self, field_to_get, start, end, filter_field="year"):
+        return self._filtered(field_to_get, date_range(filter_field, start, end))
+
+    def get_filtered_data(self, field_to_get, filter=""):
+        """Documents matching filter, a :mod:`~topik.fileio.filters` expression.
+
+        Filters are run as SQL queries over the indexed metadata columns.  As with
+        the other outputs, numbers stored as strings only compare as numbers with
+        int() or float() around the field."""
+        if not filter:
+            return self._documents(field_to_get)
+        return self._filtered(field_to_get, filter)
+
+    def save(self, filename):
+        # results are written to the database as they are stored; only its location is saved here
+        saved_data = {"path": self.path, "hash_field": self.hash_field}
+        return super(SQLiteOutput, self).save(filename, saved_data)
+
+    def close(self):
+        self._connection.close()
+        super(SQLiteOutput, self).close()
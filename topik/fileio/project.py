@@ -1,9 +1,10 @@
-import itertools
 import jsonpickle
 import os
 
 from topik import tokenizers, transformers, vectorizers, models, visualizers
+from topik.tokenizers._parallel import EXECUTION_ARGUMENTS
 from ._registry import registered_outputs
+from .base_output import load_output
 from .reader import read_input
 
 
@@ -36,20 +37,19 @@ class TopikProject(object):
             with open(project_name + ".topikproject") as project_meta:
                 project_data = jsonpickle.decode(project_meta.read())
             kwargs.update(project_data)
-            with open(project_name + ".topikdata") as project_data:
-                loaded_data = jsonpickle.decode(project_data.read())
-                output_type = loaded_data["class"]
-                output_args.update(loaded_data["saved_data"])
+            # loading the output here is sufficient to restore all results: the output is responsible for loading
+            #    them as necessary, and returning iterators or output objects appropriately.
+            self.output = load_output(project_name + ".topikdata")
+            output_type = self.output.__class__.__name__
+        else:
+            if output_type is None:
+                output_type = "InMemoryOutput"
+            self.output = registered_outputs[output_type](**output_args)
         self.project_name = project_name
-        if output_type is None:
-            output_type = "InMemoryOutput"
-        # loading the output here is sufficient to restore all results: the output is responsible for loading them as
-        #    necessary, and returning iterators or output objects appropriately.
-        self.output = registered_outputs[output_type](**output_args)
         # not used, but stored here for persistence purposes
         self._output_type = output_type
         self._output_args = output_args
-        # None or a string expression in Elasticsearch query format
+        # "" or a filter expression (see topik.fileio.filters)
         self.corpus_filter = kwargs["corpus_filter"] if "corpus_filter" in kwargs else ""
         # None or a string name
         self.content_field = kwargs["content_field"] if "content_field" in kwargs else ""
@@ -61,6 +61,8 @@ class TopikProject(object):
         self._selected_vectorized_corpus_id = kwargs["_selected_vectorized_corpus_id"] if "_selected_vectorized_corpus_id" in kwargs else None
         # Initially None, set to string value when run_model method called
         self._selected_modeled_corpus_id = kwargs["_selected_modeled_corpus_id"] if "_selected_modeled_corpus_id" in kwargs else None
+        # tokenizer method and arguments of each tokenized corpus id, for tokenizing new texts the same way
+        self._tokenizer_settings = kwargs["_tokenizer_settings"] if "_tokenizer_settings" in kwargs else {}
 
     def __enter__(self):
         return self
@@ -79,6 +81,7 @@ class TopikProject(object):
                "_selected_tokenized_corpus_id": self._selected_tokenized_corpus_id,
                "_selected_vectorized_corpus_id": self._selected_vectorized_corpus_id,
                "_selected_modeled_corpus_id": self._selected_modeled_corpus_id,
+               "_tokenizer_settings": self._tokenizer_settings,
                "corpus_filter": self.corpus_filter,
                "project_name": self.project_name,
                "output_type": self._output_type,
@@ -112,13 +115,21 @@ class TopikProject(object):
                                                   filter_field=filter_field)
 
     def tokenize(self, method="simple", **kwargs):
-        """Break raw text into substituent terms (or collections of terms)"""
+        """Break raw text into substituent terms (or collections of terms)
+
+        processes, chunksize and ordered spread the work over several processes.  They
+        do not change the result, so they are not part of the tokenized corpus id.
+        """
         # tokenize, and store the results on this object somehow
         tokenized_corpus = tokenizers.tokenize(self.selected_filtered_corpus,
                                              method=method, **kwargs)
+        tokenizer_kwargs = {key: value for key, value in kwargs.items()
+                            if key not in EXECUTION_ARGUMENTS}
         tokenize_parameter_string = self.corpus_filter + "_tk_{method}{params}".format(
             method=method,
-            params=_get_parameters_string(**kwargs))
+            params=_get_parameters_string(**tokenizer_kwargs))
+        self._tokenizer_settings[tokenize_parameter_string] = {"method": method,
+                                                               "kwargs": tokenizer_kwargs}
 
         # store this
         self.output.tokenized_corpora[tokenize_parameter_string] = tokenized_corpus
@@ -137,8 +148,7 @@ class TopikProject(object):
 
     def vectorize(self, method="bag_of_words", **kwargs):
         """Convert tokenized text to vector form - mathematical representation used for modeling."""
-        tokenizer_iterators = itertools.tee(self.selected_tokenized_corpus)
-        vectorized_corpus = vectorizers.vectorize(tokenizer_iterators[0],
+        vectorized_corpus = vectorizers.vectorize(self.selected_tokenized_corpus,
                                                 method=method, **kwargs)
         vectorize_parameter_string = self.corpus_filter + self._selected_tokenized_corpus_id + "_".join([method, _get_parameters_string(**kwargs)])
         # store this internally
@@ -159,6 +169,47 @@ class TopikProject(object):
         # set _model_id internal handle to point to this data
         self._selected_modeled_corpus_id = model_id
 
+    def update_model(self, tokenized_corpus=None, **kwargs):
+        """Train the selected model further on documents it has not seen yet.
+
+        Rather than running the model again over the whole corpus, only documents
+        missing from the selected model's doc_topic_matrix are used.  They are taken
+        from the selected tokenized corpus (or from tokenized_corpus, if given),
+        counted with the model's own vocabulary and fed to an online update.  Topics
+        are refreshed; the topic weights of documents seen before are kept.  kwargs
+        (such as workers) are passed on to the model's update.
+        """
+        modeled_corpus = self.selected_modeled_corpus
+        if modeled_corpus.model_state is None:
+            raise ValueError("model {} has no trained state to update.  Run run_model "
+                             "again instead.".format(self._selected_modeled_corpus_id))
+        if tokenized_corpus is None:
+            tokenized_corpus = self.selected_tokenized_corpus
+        known_doc_ids = set(modeled_corpus.doc_ids)
+        new_documents = ((doc_id, tokens) for doc_id, tokens in tokenized_corpus
+                         if doc_id not in known_doc_ids)
+        vectorized_corpus = vectorizers.bag_of_words(
+            new_documents, vocabulary=modeled_corpus.model_state.vocabulary)
+        modeled_corpus.update(vectorized_corpus, **kwargs)
+        # store it again, for outputs that do not keep the model object itself
+        self.output.modeled_corpora[self._selected_modeled_corpus_id] = modeled_corpus
+
+    def infer(self, texts, batch_size=1000):
+        """Topic distributions of new texts under the selected model, without retraining.
+
+        Texts are tokenized with the settings of the selected tokenized corpus, which
+        must come from the simple tokenizer (the other tokenizers learn from the whole
+        corpus).  Returns an array with one row per text; see :meth:`~.ModelOutput.infer`.
+        """
+        settings = self._tokenizer_settings.get(self._selected_tokenized_corpus_id)
+        if settings is None or settings["method"] != "simple":
+            raise ValueError("New texts can only be tokenized like corpora tokenized with the "
+                             "simple tokenizer in this project.  Tokenize texts yourself and "
+                             "pass lists of tokens to ModelOutput.infer instead.")
+        tokenizer = tokenizers.SimpleTokenizer(**settings["kwargs"])
+        return self.selected_modeled_corpus.infer(texts, batch_size=batch_size,
+                                                  tokenizer=tokenizer)
+
     def visualize(self, vis_name='lda_vis', model_id=None, **kwargs):
         """Plot model output"""
         if not model_id:
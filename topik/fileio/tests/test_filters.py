@@ -0,0 +1,81 @@
+import nose.tools as nt
+import numpy as np
+
+from topik.fileio.filters import compile_filter, date_range
+
+documents = [{"year": "1999", "lang": "en", "title": "first"},
+             {"year": "2004", "lang": "fr", "title": "second"},
+             {"year": "2010", "lang": "de"}]
+columns = {"year": ["1999", "2004", "2010"], "lang": ["en", "fr", "de"]}
+
+
+def _matching(expression):
+    corpus_filter = compile_filter(expression)
+    return [document.get("title") for document in documents if corpus_filter.matches(document)]
+
+
+def test_comparisons():
+    nt.assert_equal(_matching("year == '2004'"), ["second"])
+    nt.assert_equal(_matching("2000 <= int(year) < 2010"), ["second"])
+    nt.assert_equal(_matching("lang not in ('fr', 'de') or int(year) > 2005"), ["first", None])
+    nt.assert_equal(_matching("not title == None"), ["first", "second"])
+
+
+def test_legacy_format_strings():
+    nt.assert_equal(_matching("1975<=int({}['year'])<=1999"), ["first"])
+    nt.assert_equal(_matching("{0}['lang'] == 'fr' and int({0}['year']) > 2000"), ["second"])
+
+
+def test_mask():
+    mask = compile_filter("int(year) >= 2004 and lang != 'de'").mask(columns)
+    np.testing.assert_array_equal(mask, [False, True, False])
+    np.testing.assert_array_equal(date_range("year", 1975, 2004).mask(columns),
+                                  [True, True, False])
+
+
+def test_to_elasticsearch():
+    nt.assert_equal(compile_filter("1975 <= int(year) <= 1999").to_elasticsearch(),
+                    {"range": {"year": {"gte": 1975, "lte": 1999}}})
+    # strings are matched against the keyword subfield, not the analyzed text field
+    nt.assert_equal(compile_filter("lang in ('en', 'fr') or not year == '2004'").to_elasticsearch(),
+                    {"bool": {"should": [{"terms": {"lang.keyword": ["en", "fr"]}},
+                                         {"bool": {"must_not": [{"term": {"year.keyword": "2004"}}]}}]}})
+    nt.assert_equal(compile_filter("journal == 'Nature' and vol in (12, '12a')").to_elasticsearch(),
+                    {"bool": {"must": [{"term": {"journal.keyword": "Nature"}},
+                                       {"bool": {"should": [{"terms": {"vol": [12]}},
+                                                            {"terms": {"vol.keyword": ["12a"]}}]}}]}})
+    nt.assert_equal(compile_filter("title == None").to_elasticsearch(),
+                    {"bool": {"must_not": [{"exists": {"field": "title"}}]}})
+
+
+def test_to_elasticsearch_ranges():
+    # a bound already set on a field is never overwritten: further bounds must match too
+    nt.assert_equal(compile_filter("year >= 2005 and year >= 2000").to_elasticsearch(),
+                    {"bool": {"must": [{"range": {"year": {"gte": 2005}}},
+                                       {"range": {"year": {"gte": 2000}}}]}})
+    nt.assert_equal(compile_filter("year > 2005 and year >= 2000 and year < 2010").to_elasticsearch(),
+                    {"bool": {"must": [{"range": {"year": {"gt": 2005, "lt": 2010}}},
+                                       {"range": {"year": {"gte": 2000}}}]}})
+    # comparisons with None match nothing, and are not merged into ranges
+    nt.assert_equal(compile_filter("year > None and year < 3").to_elasticsearch(),
+                    {"bool": {"must": [{"bool": {"must_not": [{"match_all": {}}]}},
+                                       {"range": {"year": {"lt": 3}}}]}})
+
+
+def test_to_sql():
+    params = []
+    condition = compile_filter("year > 2000 and lang in ('en', 'fr')").to_sql(
+        {"year": "c0", "lang": "c1"}, params)
+    nt.assert_equal(condition, "(c0 > ? AND c1 IN (?, ?))")
+    nt.assert_equal(params, [2000, "en", "fr"])
+    nt.assert_equal(compile_filter("int(year) >= 2000").to_sql({"year": "c0"}, []),
+                    "CAST(c0 AS NUMERIC) >= ?")
+    # documents missing the field pass negated conditions, as with matches
+    nt.assert_equal(compile_filter("not lang != 'de'").to_sql({"lang": "c1"}, []),
+                    "NOT COALESCE((c1 != ? OR c1 IS NULL), 0)")
+
+
+def test_rejects_other_expressions():
+    for expression in ["__import__('os').getcwd() == ''", "len(authors) > 1", "year",
+                       "year == lang", "year =="]:
+        nt.assert_raises(ValueError, compile_filter, expression)
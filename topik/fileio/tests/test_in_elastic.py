@@ -1,10 +1,11 @@
 import nose.tools as nt
 import logging
 
-from topik.fileio.in_elastic import read_elastic
+from topik.fileio.in_elastic import read_elastic, scan_slices
 from topik.fileio.project import TopikProject
 from topik.fileio.tests import test_data_path
 from ._solutions import solution_elastic
+from .test_out_elastic import _ScrollingClient
 from elasticsearch.exceptions import ConnectionError
 from nose.plugins.skip import SkipTest
 
@@ -47,3 +48,13 @@ def test_elastic_import():
     if instance.indices.exists(INDEX):
         instance.indices.delete(INDEX)
 
+
+def test_scan_slices():
+    client = _ScrollingClient()
+    client.documents = {("continuum", number): {"text": "document {}".format(number)}
+                        for number in range(10)}
+    documents = list(scan_slices(client, slices=3, index=INDEX, doc_type="continuum"))
+    nt.assert_equal(sorted(document["_source"]["text"] for document in documents),
+                    sorted("document {}".format(number) for number in range(10)))
+    nt.assert_equal(sorted(body["slice"]["id"] for request, _, body in client.requests
+                           if request == "search"), [0, 1, 2])
@@ -0,0 +1,263 @@
+import json
+import threading
+import time
+
+import nose.tools as nt
+import numpy as np
+from elasticsearch.exceptions import ConnectionError
+from elasticsearch.serializer import JSONSerializer
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from topik.fileio.out_elastic import (ElasticSearchOutput, VectorizedElasticCorpora,
+                                      ModeledElasticCorpora, es_scan_fields)
+from topik.models import run_model
+from topik.models.tests.test_data import test_vectorized_output
+
+
+class _Indices(object):
+    def exists(self, index, **kwargs):
+        return True
+
+    def get_settings(self, index=None, **kwargs):
+        return {index: {"settings": {}}}
+
+    def put_settings(self, body=None, index=None, **kwargs):
+        pass
+
+    def refresh(self, index=None, **kwargs):
+        pass
+
+
+class _Transport(object):
+    serializer = JSONSerializer()
+
+
+class _ScrollingClient(object):
+    """Stands in for an Elasticsearch client, with documents held in a dict of
+    {(doc type, id): source}.  Serves the bulk updates of es_setitem, and the
+    scroll requests of helpers.scan, page_size hits at a time."""
+    def __init__(self, page_size=2):
+        self.documents = {}
+        self.page_size = page_size
+        self.requests = []
+        self.updates = []
+        # scroll requests wait while this is cleared
+        self.scrolling = threading.Event()
+        self.scrolling.set()
+        self.indices = _Indices()
+        self.transport = _Transport()
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def bulk(self, body, **kwargs):
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        items = []
+        for action, data in zip(lines[::2], lines[1::2]):
+            update = action["update"]
+            self.updates.append((update["_type"], update["_id"]))
+            self.documents.setdefault((update["_type"], update["_id"]), {}).update(data["doc"])
+            items.append({"update": {"_id": update["_id"], "status": 200}})
+        return {"errors": False, "items": items}
+
+    def search(self, body=None, doc_type=None, size=None, **kwargs):
+        self.requests.append(("search", doc_type, body))
+        types = doc_type.split(",")
+        fields = body.get("_source")
+        hits = [{"_type": hit_type, "_id": str(id),
+                 "_source": {field: value for field, value in source.items()
+                             if fields is None or field in fields}}
+                for (hit_type, id), source in sorted(self.documents.items()) if hit_type in types]
+        if "slice" in body:
+            hits = hits[body["slice"]["id"]::body["slice"]["max"]]
+        pages = [hits[start:start + self.page_size] for start in range(0, len(hits), self.page_size)]
+        with self._lock:
+            scroll_id = str(len(self._pages))
+            self._pages[scroll_id] = pages[1:]
+        return self._page(scroll_id, pages[0] if pages else [])
+
+    def scroll(self, scroll_id=None, **kwargs):
+        self.scrolling.wait()
+        self.requests.append(("scroll", scroll_id, None))
+        pages = self._pages[scroll_id]
+        return self._page(scroll_id, pages.pop(0) if pages else [])
+
+    def _page(self, scroll_id, hits):
+        return {"_scroll_id": scroll_id, "_shards": {"successful": 1, "total": 1},
+                "hits": {"hits": hits}}
+
+    def clear_scroll(self, **kwargs):
+        pass
+
+    def count(self, doc_type=None, body=None, **kwargs):
+        field = body["query"]["bool"]["filter"]["exists"]["field"]
+        return {"count": sum(1 for (hit_type, _), source in self.documents.items()
+                             if hit_type == doc_type and field in source)}
+
+
+def test_vectorized_corpus_is_read_lazily():
+    client = _ScrollingClient()
+    # as many documents per page as the client returns
+    corpora = VectorizedElasticCorpora(client, "index", "vectorized", batch_size=2)
+    corpora["bow"] = test_vectorized_output
+    # fields of other corpora in the same documents are not fetched
+    corpora["other"] = test_vectorized_output
+    vectorized = corpora["bow"]
+    nt.assert_equal(client.requests, [])
+
+    nt.assert_equal(len(vectorized), len(test_vectorized_output))
+    rows = vectorized.iter_bow()
+    # the first vector is available before the scroll is done
+    client.scrolling.clear()
+    first = next(rows)
+    nt.assert_equal([request[0] for request in client.requests], ["search"])
+    client.scrolling.set()
+    nt.assert_equal([first] + list(rows),
+                    [sorted(test_vectorized_output.vectors[doc_id].items())
+                     for doc_id in vectorized.doc_ids])
+    nt.assert_true(all(request[2]["_source"] == ["bow"] for request in client.requests
+                       if request[0] == "search"))
+
+    requests = len(client.requests)
+    nt.assert_equal(vectorized.global_term_count, test_vectorized_output.global_term_count)
+    for doc_id in test_vectorized_output.doc_ids:
+        nt.assert_equal(vectorized.vectors[doc_id], test_vectorized_output.vectors[doc_id])
+        nt.assert_equal(vectorized.doc_lengths[doc_id], test_vectorized_output.doc_lengths[doc_id])
+    nt.assert_equal(len(client.requests), requests)
+
+
+def test_vectorized_corpus_is_written_in_one_pass():
+    client = _ScrollingClient()
+    VectorizedElasticCorpora(client, "index", "vectorized")["bow"] = test_vectorized_output
+    # a single update of each document, and one of the vocabulary
+    nt.assert_equal(sorted(client.updates),
+                    sorted([("vocabulary", "bow")] +
+                           [("vector", doc_id) for doc_id in test_vectorized_output.doc_ids]))
+
+
+def test_scroll_pages_are_read_ahead():
+    client = _ScrollingClient()
+    VectorizedElasticCorpora(client, "index", "vectorized")["bow"] = test_vectorized_output
+    hits = es_scan_fields("bow", ["vector"], client, "index", batch_size=2, prefetch_pages=1)
+    next(hits)
+    # the next page is requested while the first one is being processed
+    for _ in range(100):
+        if len(client.requests) > 1:
+            break
+        time.sleep(0.01)
+    nt.assert_equal([request[0] for request in client.requests[:2]], ["search", "scroll"])
+    nt.assert_equal(len(list(hits)), len(test_vectorized_output) - 1)
+
+
+def test_scroll_errors_are_raised():
+    client = _ScrollingClient()
+    VectorizedElasticCorpora(client, "index", "vectorized")["bow"] = test_vectorized_output
+
+    def scroll(**kwargs):
+        raise ConnectionError("N/A", "scroll failed", None)
+    client.scroll = scroll
+    nt.assert_raises(ConnectionError, list,
+                     es_scan_fields("bow", ["vector"], client, "index", batch_size=2))
+
+
+def test_model_is_read_in_one_scroll():
+    model = run_model(test_vectorized_output, "plsa", ntopics=2)
+    client = _ScrollingClient(page_size=100)
+    corpora = ModeledElasticCorpora(client, "index", "models")
+    corpora["plsa"] = model
+    loaded = corpora["plsa"]
+    nt.assert_equal(len([request for request in client.requests if request[0] == "search"]), 1)
+    np.testing.assert_allclose(loaded.topic_term_array, model.topic_term_array)
+    for doc_id in model.doc_ids:
+        np.testing.assert_allclose(loaded.doc_topic_matrix[doc_id], model.doc_topic_matrix[doc_id])
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers the requests of a bulk load, rejecting the first server.throttled
+    updates with 429 (Too Many Requests)"""
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+
+    def do_HEAD(self):
+        self._reply(200 if self.server.settings else 404)
+
+    def do_GET(self):
+        refresh_interval = self.server.settings[-1]["index"]["refresh_interval"]
+        self._reply(200, {"stub": {"settings": {"index.refresh_interval": refresh_interval}}})
+
+    def do_PUT(self):
+        # both creating the index and updating its settings
+        body = json.loads(self._body())
+        self.server.settings.append(body.get("settings", body))
+        self._reply(200, {"acknowledged": True})
+
+    def do_POST(self):
+        server = self.server
+        if self.path.startswith("/stub/_refresh"):
+            server.refreshes.append(server.settings[-1])
+            return self._reply(200, {})
+        lines = [json.loads(line) for line in self._body().splitlines() if line]
+        items = []
+        with server.lock:
+            server.bulk_requests += 1
+            for action, data in zip(lines[::2], lines[1::2]):
+                update = action["update"]
+                if server.throttled:
+                    server.throttled -= 1
+                    status = 429
+                else:
+                    server.documents[update["_id"]] = data["doc"]
+                    status = 200
+                items.append({"update": {"_id": update["_id"], "status": status}})
+        self._reply(200, {"errors": any(item["update"]["status"] != 200 for item in items),
+                          "items": items})
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, throttled=0):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), _StubHandler)
+        self.throttled = throttled
+        self.settings = []
+        self.refreshes = []
+        self.documents = {}
+        self.bulk_requests = 0
+        self.lock = threading.Lock()
+
+
+def test_parallel_bulk_load():
+    server = _StubServer(throttled=3)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        output = ElasticSearchOutput("127.0.0.1:{}".format(server.server_address[1]), "stub",
+                                     bulk_options={"thread_count": 3, "initial_backoff": 0})
+        documents = [{"text": "document {}".format(number), "year": number}
+                     for number in range(20)]
+        output.import_from_iterable(documents, "text", batch_size=4)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    nt.assert_equal(sorted(server.documents.values(), key=lambda document: document["year"]),
+                    documents)
+    # five chunks, and retries of the throttled updates
+    nt.assert_greater(server.bulk_requests, 5)
+    # refreshes are off during the load, and the index is refreshed once the default
+    # interval is restored
+    nt.assert_equal(server.settings, [{"index": {"refresh_interval": "-1"}},
+                                      {"index": {"refresh_interval": "1s"}}])
+    nt.assert_equal(server.refreshes, [{"index": {"refresh_interval": "1s"}}])
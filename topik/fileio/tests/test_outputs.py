@@ -1,13 +1,22 @@
 import os
+import shutil
+import tempfile
 import unittest
 import logging
 import elasticsearch
+import jsonpickle
 
 from topik.fileio.base_output import load_output
+from topik.fileio._container import is_container
 from topik.fileio.reader import read_input
 from topik.fileio.tests import test_data_path
 from topik.fileio.out_elastic import ElasticSearchOutput
 from topik.fileio.out_memory import InMemoryOutput
+from topik.fileio import out_mmap
+from topik.fileio.out_mmap import MmapOutput
+from topik.fileio.out_sqlite import SQLiteOutput
+from topik.tokenizers import tokenize
+from topik.vectorizers import vectorize
 from elasticsearch.exceptions import ConnectionError
 from nose.plugins.skip import SkipTest
 
@@ -59,6 +68,207 @@ class TestInMemoryOutput(unittest.TestCase, BaseOutputTest):
             '{}/test_data_json_stream.json'.format(test_data_path)),
             field_to_hash=CONTENT_FIELD)
 
+    def tearDown(self):
+        if os.path.exists(SAVE_FILENAME):
+            os.remove(SAVE_FILENAME)
+
+    def test_load_results_lazily(self):
+        tokenized = list(tokenize(self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+        self.test_raw_data.tokenized_corpora["simple"] = tokenized
+        self.test_raw_data.vectorized_corpora["bag_of_words"] = vectorize(tokenized)
+        self.test_raw_data.vectorized_corpora["tfidf"] = vectorize(tokenized, method="tfidf")
+        self.test_raw_data.save(SAVE_FILENAME)
+        self.assertTrue(is_container(SAVE_FILENAME))
+
+        loaded = load_output(SAVE_FILENAME)
+        self.assertEqual(sorted(loaded.vectorized_corpora.keys()), ["bag_of_words", "tfidf"])
+        self.assertEqual(loaded.vectorized_corpora._pending, set(["bag_of_words", "tfidf"]))
+        self.assertEqual(len(loaded.vectorized_corpora["tfidf"]), 100)
+        self.assertEqual(loaded.vectorized_corpora._pending, set(["bag_of_words"]))
+
+        # sections that were never decoded are copied to the new file as they are
+        loaded.save(SAVE_FILENAME)
+        reloaded = load_output(SAVE_FILENAME)
+        self.assertEqual(list(reloaded.tokenized_corpora["simple"]), tokenized)
+        self.assertEqual(reloaded.vectorized_corpora["bag_of_words"].vectors[tokenized[0][0]],
+                         self.test_raw_data.vectorized_corpora["bag_of_words"].vectors[tokenized[0][0]])
+
+    def test_load_corpus_lazily(self):
+        self.test_raw_data.save(SAVE_FILENAME)
+        loaded = load_output(SAVE_FILENAME)
+        self.assertIsNotNone(loaded.corpus._section)
+
+        # a corpus that was never decoded is copied to the new file as it is
+        loaded.save(SAVE_FILENAME)
+        loaded = load_output(SAVE_FILENAME)
+        self.assertIsNotNone(loaded.corpus._section)
+        data = list(loaded.get_filtered_data(CONTENT_FIELD))
+        self.assertIsNone(loaded.corpus._section)
+        self.assertEqual(sorted(data), sorted(self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+        self.assertEqual(len(loaded.corpus), 100)
+
+    def test_close_releases_container(self):
+        self.test_raw_data.save(SAVE_FILENAME)
+        loaded = load_output(SAVE_FILENAME)
+        container = loaded._container
+        self.assertFalse(container._file.closed)
+        loaded.close()
+        self.assertTrue(container._file.closed)
+        self.assertIsNone(loaded._container)
+
+    def test_load_jsonpickle_file(self):
+        tokenized = list(tokenize(self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+        with open(SAVE_FILENAME, "w") as f:
+            f.write(jsonpickle.encode({"class": "InMemoryOutput", "saved_data": {
+                "iterable": self.test_raw_data.corpus, "hash_field": CONTENT_FIELD,
+                "tokenized_corpora": {"simple": tokenized}}}))
+        loaded = load_output(SAVE_FILENAME)
+        self.assertEqual(len(list(loaded.get_filtered_data(CONTENT_FIELD))), 100)
+        self.assertEqual(list(loaded.tokenized_corpora["simple"]), tokenized)
+        loaded.save(SAVE_FILENAME)
+        self.assertTrue(is_container(SAVE_FILENAME))
+        self.assertEqual(list(load_output(SAVE_FILENAME).tokenized_corpora["simple"]), tokenized)
+
+    def test_load_legacy_results(self):
+        # written by topik 0.x, with results held in dicts
+        loaded = load_output(os.path.join(test_data_path, "legacy_project.topikdata"))
+        vectorized = loaded.vectorized_corpora["_tk_simplebag_of_words_"]
+        self.assertEqual(len(vectorized), 3)
+        self.assertEqual(vectorized.matrix.shape, (3, 39))
+        self.assertEqual(vectorized.term_frequency[vectorized.term_id_map["technology"]], 2)
+        doc_id = -3946606966139839273
+        self.assertEqual(vectorized.vectors[doc_id][vectorized.term_id_map["data"]], 2)
+        self.assertEqual(vectorized.doc_lengths[doc_id], 15)
+        model = loaded.modeled_corpora["lda_"]
+        self.assertEqual(model.topic_term_array.shape, (2, 39))
+        self.assertEqual(model.doc_topic_array.shape, (3, 2))
+        self.assertAlmostEqual(sum(model.doc_topic_matrix[doc_id]), 1, places=5)
+        self.assertEqual(model.vocab[vectorized.term_id_map["data"]], "data")
+
+        loaded.save(SAVE_FILENAME)
+        reloaded = load_output(SAVE_FILENAME)
+        self.assertEqual(len(reloaded.vectorized_corpora["_tk_simplebag_of_words_"]), 3)
+        self.assertEqual(reloaded.modeled_corpora["lda_"].topic_term_array.tolist(),
+                         model.topic_term_array.tolist())
+
+
+class TestMmapOutput(unittest.TestCase, BaseOutputTest):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.test_raw_data = MmapOutput(self.path)
+        self.test_raw_data.import_from_iterable(read_input(
+            '{}/test_data_json_stream.json'.format(test_data_path)),
+            field_to_hash=CONTENT_FIELD)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_import_skips_known_documents(self):
+        self.test_raw_data.import_from_iterable(read_input(
+            '{}/test_data_json_stream.json'.format(test_data_path)),
+            field_to_hash=CONTENT_FIELD)
+        self.assertEqual(len(list(self.test_raw_data.get_filtered_data(CONTENT_FIELD))), 100)
+
+    def test_import_skips_documents_across_batches(self):
+        documents = list(read_input('{}/test_data_json_stream.json'.format(test_data_path)))
+        buffer_size, out_mmap._IDS_BUFFER = out_mmap._IDS_BUFFER, 7
+        try:
+            output = MmapOutput(os.path.join(self.path, "batches"))
+            output.import_from_iterable(documents + documents[:30], field_to_hash=CONTENT_FIELD)
+        finally:
+            out_mmap._IDS_BUFFER = buffer_size
+        ids = [doc_id for doc_id, text in output.get_filtered_data(CONTENT_FIELD)]
+        self.assertEqual(sorted(ids), sorted(doc_id for doc_id, text in
+                                             self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+
+    def test_import_rebuilds_missing_sorted_ids(self):
+        # outputs written before the sorted ids were kept
+        os.remove(os.path.join(self.path, "corpus", "ids.sorted.npy"))
+        self.test_raw_data.import_from_iterable(read_input(
+            '{}/test_data_json_stream.json'.format(test_data_path)),
+            field_to_hash=CONTENT_FIELD)
+        self.assertEqual(len(list(self.test_raw_data.get_filtered_data(CONTENT_FIELD))), 100)
+
+    def test_results_are_memory_mapped(self):
+        tokenized = list(tokenize(self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+        self.test_raw_data.tokenized_corpora["simple"] = tokenized
+        self.assertEqual(list(self.test_raw_data.tokenized_corpora["simple"]), tokenized)
+        vectorized = vectorize(tokenized)
+        self.test_raw_data.vectorized_corpora["bag_of_words"] = vectorized
+        self.test_raw_data.save(SAVE_FILENAME)
+        loaded = load_output(SAVE_FILENAME).vectorized_corpora["bag_of_words"]
+        os.remove(SAVE_FILENAME)
+        self.assertEqual(list(loaded.doc_ids), vectorized.doc_ids)
+        self.assertEqual(loaded.id_term_map[7], vectorized.id_term_map[7])
+        self.assertEqual(loaded.term_frequency[7], vectorized.term_frequency[7])
+        self.assertEqual((loaded.matrix != vectorized.matrix).nnz, 0)
+        self.assertFalse(loaded.matrix.data.flags.owndata)
+
+
+class TestSQLiteOutput(unittest.TestCase, BaseOutputTest):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.test_raw_data = SQLiteOutput(os.path.join(self.path, "corpus.db"))
+        self.test_raw_data.import_from_iterable(read_input(
+            '{}/test_data_json_stream.json'.format(test_data_path)),
+            field_to_hash=CONTENT_FIELD)
+
+    def tearDown(self):
+        self.test_raw_data.close()
+        shutil.rmtree(self.path)
+
+    def test_filters_match_in_memory_output(self):
+        in_memory = InMemoryOutput()
+        in_memory.import_from_iterable(read_input(
+            '{}/test_data_json_stream.json'.format(test_data_path)),
+            field_to_hash=CONTENT_FIELD)
+        for filter in ["1975<=int({}['year'])<=1999",
+                       "{0}['year'] in ('1999', '2000') and not {0}['vol'] == '879'",
+                       "{0}['year'] > '2005' or {0}['title'] == None"]:
+            self.assertEqual(sorted(self.test_raw_data.get_filtered_data("title", filter)),
+                             sorted(in_memory.get_filtered_data("title", filter)))
+
+    def test_filters_on_missing_fields_match_in_memory_output(self):
+        documents = [{CONTENT_FIELD: "first", "lang": "en", "year": "1999"},
+                     {CONTENT_FIELD: "second", "lang": "fr"},
+                     {CONTENT_FIELD: "third", "year": "2004"}]
+        in_memory = InMemoryOutput()
+        in_memory.import_from_iterable(documents, field_to_hash=CONTENT_FIELD)
+        self.test_raw_data.import_from_iterable(documents, field_to_hash=CONTENT_FIELD)
+        for filter in ["lang != 'en'", "not lang == 'en'", "lang not in ('en',)",
+                       "not (lang == 'fr' or int(year) > 2000)", "not lang in ('en', 'fr')",
+                       "lang == None", "not int(year) < 2000", "year < None"]:
+            self.assertEqual(
+                sorted(text for _, text in self.test_raw_data.get_filtered_data(CONTENT_FIELD, filter)
+                       if text in ("first", "second", "third")),
+                sorted(text for _, text in in_memory.get_filtered_data(CONTENT_FIELD, filter)),
+                filter)
+
+    def test_metadata_is_stored_as_given(self):
+        self.test_raw_data.import_from_iterable([{CONTENT_FIELD: "boston", "zip": "02134"},
+                                                 {CONTENT_FIELD: "paris", "zip": "1e3"}],
+                                                field_to_hash=CONTENT_FIELD)
+        self.assertEqual(sorted(self.test_raw_data.get_filtered_data("zip", "zip != None")),
+                         sorted([(hash("boston"), "02134"), (hash("paris"), "1e3")]))
+        self.assertEqual(list(self.test_raw_data.get_filtered_data(CONTENT_FIELD, "zip == '02134'")),
+                         [(hash("boston"), "boston")])
+        self.assertEqual(list(self.test_raw_data.get_filtered_data(CONTENT_FIELD, "float(zip) > 2000")),
+                         [(hash("boston"), "boston")])
+
+    def test_filters_are_not_evaluated(self):
+        for filter in ["__import__('os').getcwd() == ''", "len({}['authors']) > 1",
+                       "{}['missing'] == 1"]:
+            with self.assertRaises(ValueError):
+                list(self.test_raw_data.get_filtered_data(CONTENT_FIELD, filter))
+
+    def test_results_are_stored(self):
+        tokenized = list(tokenize(self.test_raw_data.get_filtered_data(CONTENT_FIELD)))
+        self.test_raw_data.tokenized_corpora["simple"] = iter(tokenized)
+        self.test_raw_data.vectorized_corpora["bag_of_words"] = vectorize(tokenized)
+        self.assertEqual(list(self.test_raw_data.tokenized_corpora["simple"]), tokenized)
+        self.assertEqual(len(self.test_raw_data.vectorized_corpora["bag_of_words"]), 100)
+        self.assertEqual(list(self.test_raw_data.tokenized_corpora), ["simple"])
+
 
 class TestElasticSearchOutput(unittest.TestCase, BaseOutputTest):
     def setUp(self):
@@ -1,5 +1,7 @@
 import glob
 import os
+import shutil
+import tempfile
 import time
 import unittest
 
@@ -100,6 +102,30 @@ class ProjectTest(object):
         for topic in self.project.selected_modeled_corpus.topic_term_matrix.values():
             nt.assert_almost_equal(sum(topic), 1)
 
+    def test_update_model(self):
+        self.project.tokenize()
+        self.project.vectorize()
+        self.project.run_model(model_name='lda', ntopics=2)
+        tokenized = list(self.project.selected_tokenized_corpus)
+        new_documents = [("new{}".format(number), tokens)
+                         for number, (doc_id, tokens) in enumerate(tokenized[:10])]
+        self.project.update_model(tokenized_corpus=tokenized + new_documents)
+        modeled = self.project.selected_modeled_corpus
+        nt.assert_equal(len(modeled.doc_topic_matrix), 110)
+        nt.assert_equal(modeled.model_state.numdocs, 110)
+        for topic in modeled.topic_term_matrix.values():
+            nt.assert_almost_equal(sum(topic), 1, places=5)
+
+    def test_infer(self):
+        self.project.tokenize(min_length=2)
+        self.project.vectorize()
+        self.project.run_model(model_name='plsa', ntopics=2)
+        texts = [text for doc_id, text in self.project.get_filtered_corpus_iterator()][:3]
+        inferred = self.project.infer(texts, batch_size=2)
+        nt.assert_equal(inferred.shape, (3, 2))
+        for doc in inferred:
+            nt.assert_almost_equal(sum(doc), 1)
+
     def test_visualize(self):
         self.project.tokenize()
         self.project.vectorize(method='bag_of_words')
@@ -116,6 +142,48 @@ class TestInMemoryOutput(unittest.TestCase, ProjectTest):
                                     output_args=self.output_args)
         self.project.read_input(test_data_path, content_field="abstract")
 
+    def test_open_legacy_project(self):
+        # saved by topik 0.x, with results held in dicts
+        path = tempfile.mkdtemp()
+        try:
+            for extension in (".topikproject", ".topikdata"):
+                shutil.copy(os.path.join(os.path.dirname(test_data_path),
+                                         "legacy_project" + extension), path)
+            project = TopikProject(os.path.join(path, "legacy_project"))
+            nt.assert_equal(len(project.selected_vectorized_corpus), 3)
+            nt.assert_equal(project.selected_modeled_corpus.topic_term_array.shape, (2, 39))
+            project.visualize(vis_name='termite', topn=5)
+        finally:
+            shutil.rmtree(path)
+
+
+class TestMmapOutput(unittest.TestCase, ProjectTest):
+    def setUp(self):
+        self.output_type = "MmapOutput"
+        self.output_args = {"path": tempfile.mkdtemp()}
+        self.project = TopikProject("test_project",
+                                    output_type=self.output_type,
+                                    output_args=self.output_args)
+        self.project.read_input(test_data_path, content_field="abstract")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_args["path"])
+
+
+class TestSQLiteOutput(unittest.TestCase, ProjectTest):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.output_type = "SQLiteOutput"
+        self.output_args = {"path": os.path.join(self.path, "test_project.db")}
+        self.project = TopikProject("test_project",
+                                    output_type=self.output_type,
+                                    output_args=self.output_args)
+        self.project.read_input(test_data_path, content_field="abstract")
+
+    def tearDown(self):
+        self.project.output.close()
+        shutil.rmtree(self.path)
+
 
 class TestElasticSearchOutput(unittest.TestCase, ProjectTest):
     INDEX = "test_index"
@@ -138,3 +206,6 @@ class TestElasticSearchOutput(unittest.TestCase, ProjectTest):
         if instance.indices.exists("{}_year_alias_date".format(TestElasticSearchOutput.INDEX)):
             instance.indices.delete("{}_year_alias_date".format(TestElasticSearchOutput.INDEX))
         time.sleep(1)
+
+    def test_update_model(self):
+        raise SkipTest("Model state is not stored in Elasticsearch")
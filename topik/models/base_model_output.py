@@ -1,35 +1,228 @@
+from itertools import islice
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+import numpy as np
+from scipy import sparse
+from six import string_types
+
+from topik.vectorizers.vectorizer_output import _count_terms, IndexedArrayView
+
+# attributes that map term or document ids to values
+_ID_KEYED_ATTRIBUTES = ("_vocab", "_term_frequency", "_doc_lengths")
+
+
+def _topic_ids(ntopics):
+    return ["topic{}".format(topic_no) for topic_no in range(ntopics)]
+
+
+def _topic_term_array(topic_term_matrix):
+    """(ntopics, nterms) array from a {"topicN": weights} mapping; arrays are kept as-is"""
+    if isinstance(topic_term_matrix, Mapping):
+        topic_ids = sorted(topic_term_matrix, key=lambda topic_id: int(topic_id[len("topic"):]))
+        return np.array([topic_term_matrix[topic_id] for topic_id in topic_ids])
+    return np.asarray(topic_term_matrix)
+
+
+def _doc_topic_arrays(doc_topic_matrix, doc_ids=None):
+    """(doc_ids, (ndocs, ntopics) array) from a {doc_id: weights} mapping, or from an
+    array whose rows follow doc_ids"""
+    if isinstance(doc_topic_matrix, Mapping):
+        doc_ids = list(doc_topic_matrix)
+        return doc_ids, np.array([doc_topic_matrix[doc_id] for doc_id in doc_ids])
+    if doc_ids is None or len(doc_ids) != len(doc_topic_matrix):
+        raise ValueError("doc_ids must be given for each row of a doc_topic_matrix array.")
+    # sequences (which may be lazy, as when loaded from disk) are used as they are
+    if not isinstance(doc_ids, Sequence):
+        doc_ids = list(doc_ids)
+    return doc_ids, np.asarray(doc_topic_matrix)
+
+
+def _merge_rows(ids, rows, new_ids, new_rows):
+    """Replace the rows of ids that are already present and append the others"""
+    row_index = {id: row for row, id in enumerate(ids)}
+    replaced = [(row_index[id], new_row) for new_row, id in enumerate(new_ids) if id in row_index]
+    appended = [new_row for new_row, id in enumerate(new_ids) if id not in row_index]
+    rows = np.concatenate([rows, new_rows[appended]])
+    if replaced:
+        old, new = zip(*replaced)
+        rows[list(old)] = new_rows[list(new)]
+    return list(ids) + [new_ids[new_row] for new_row in appended], rows
+
+
+def _batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _count_batch(documents, vocabulary, tokenizer):
+    """CSR matrix of term counts of a batch of raw or tokenized documents"""
+    tokenized = ((number, tokenizer(document) if isinstance(document, string_types) else document)
+                 for number, document in enumerate(documents))
+    return _count_terms(tokenized, vocabulary, grow_vocabulary=False)[1]
+
+
 class ModelOutput(object):
     """Abstract base class for topic models.
 
     Ensures consistent interface across models, for base result display capabilities.
 
+    Topic-term and document-topic weights are held in two arrays, with a list of
+    document ids giving the order of the document rows.  topic_term_matrix and
+    doc_topic_matrix give read-only dict-like access to their rows, by topic id
+    ("topic0", "topic1", ...) and by document id.
+
     Attributes
     ----------
-    _doc_topic_matrix : mapping of document ids to weights for topic indices
-                        matrix storing the relative topic weights for each document
-    _topic_term_matrix : mapping of terms to each topic
+    _topic_term : numpy array of shape (ntopics, nterms)
+                  weight of each term (by term id) in each topic
+    _doc_topic : numpy array of shape (ndocs, ntopics)
+                 relative topic weights for each document, rows following _doc_ids
+    _doc_ids : list of document ids
+    _model_state : None or model-specific object
+                   trained state of the model, for models that can be updated
+                   with new documents (see :meth:`update`)
+
+    model_func returns (topic_term_matrix, doc_topic_matrix), optionally followed by
+    the model state.  The matrices are arrays (document rows following the doc_ids of
+    the vectorized corpus) or dicts as given by topic_term_matrix and
+    doc_topic_matrix.  update_func, if given, continues training from that state.
     """
     def __init__(self, vectorized_corpus=None, model_func=None,
                  vocab=None, term_frequency=None, topic_term_matrix=None,
-                 doc_lengths=None, doc_topic_matrix=None, **kwargs):
+                 doc_lengths=None, doc_topic_matrix=None, doc_ids=None, model_state=None,
+                 update_func=None, **kwargs):
+        self._model_state = model_state
+        self._update_func = update_func
+        self._views = {}
         if vectorized_corpus and model_func:
             self._vocab = vectorized_corpus.id_term_map
             self._doc_lengths = vectorized_corpus.doc_lengths
             self._term_frequency = vectorized_corpus.term_frequency
-            self._topic_term_matrix, self._doc_topic_matrix = model_func(
-                                                    vectorized_corpus, **kwargs)
+            results = model_func(vectorized_corpus, **kwargs)
+            self._topic_term = _topic_term_array(results[0])
+            self._doc_ids, self._doc_topic = _doc_topic_arrays(results[1],
+                                                               vectorized_corpus.doc_ids)
+            if len(results) > 2:
+                self._model_state = results[2]
 
-        elif (vocab and term_frequency and topic_term_matrix and doc_lengths and
-                     doc_topic_matrix):
+        elif (vocab and term_frequency and topic_term_matrix is not None and doc_lengths and
+                     doc_topic_matrix is not None):
             self._vocab = vocab
             self._term_frequency = term_frequency
-            self._topic_term_matrix = topic_term_matrix
+            self._topic_term = _topic_term_array(topic_term_matrix)
             self._doc_lengths = doc_lengths
-            self._doc_topic_matrix = doc_topic_matrix
+            self._doc_ids, self._doc_topic = _doc_topic_arrays(doc_topic_matrix, doc_ids)
         else:
             raise ValueError("Must provide either vectorized corpus and model func, "
                              "or term data and doc data.")
 
+    def _view(self, name, ids, values):
+        if name not in self._views:
+            self._views[name] = IndexedArrayView(ids, values)
+        return self._views[name]
+
+    def update(self, vectorized_corpus, **kwargs):
+        """Continue training with new documents only, rather than starting over.
+
+        vectorized_corpus must be vectorized with this model's vocabulary (see
+        :attr:`model_state`).  Topics are refreshed, and the new documents are added
+        to doc_topic_matrix; the rows of earlier documents are left as they were.
+        kwargs are passed on to the model's update function.
+        """
+        if self._model_state is None or self._update_func is None:
+            raise ValueError("This model output has no trained model state to update.  "
+                             "Only models trained in this version of topik, with a model "
+                             "that supports updates (such as lda), can be updated.")
+        topic_term, new_doc_topics, self._model_state = self._update_func(
+            self._model_state, vectorized_corpus, **kwargs)
+        self._topic_term = _topic_term_array(topic_term)
+        new_doc_ids, new_doc_topics = _doc_topic_arrays(new_doc_topics, vectorized_corpus.doc_ids)
+        self._doc_ids, self._doc_topic = _merge_rows(self._doc_ids, self._doc_topic,
+                                                     new_doc_ids, new_doc_topics)
+        self._views = {}
+        self._doc_lengths = dict(self._doc_lengths.items())
+        self._doc_lengths.update(vectorized_corpus.doc_lengths.items())
+        self._vocab = vectorized_corpus.id_term_map
+        term_frequency = dict(self._term_frequency)
+        for term_id, count in vectorized_corpus.term_frequency.items():
+            term_frequency[term_id] = term_frequency.get(term_id, 0) + count
+        self._term_frequency = term_frequency
+
+    def infer(self, documents, batch_size=1000, tokenizer=None):
+        """Topic distributions of documents the model was not trained on.
+
+        The topics are held fixed and only each document's topic weights are fitted:
+        variational inference for LDA, EM with fixed topics for PLSA.  Documents are
+        counted with the model's vocabulary (unknown terms are ignored) and inferred
+        batch_size at a time.
+
+        Parameters
+        ----------
+        documents : iterable of str or of list of str, VectorizerOutput or sparse matrix
+            raw texts, tokenized texts, or term counts over the model's vocabulary
+        batch_size : int
+            Number of documents inferred at a time
+        tokenizer : None or callable
+            Turns a raw text into a list of tokens.  Should match the tokenization
+            of the training corpus (:meth:`~.TopikProject.infer` takes care of this).
+            Defaults to :class:`~.SimpleTokenizer` with default settings.
+
+        Returns
+        -------
+        numpy array of shape (number of documents, ntopics), rows in the order of
+        documents and columns in topic order (topic0, topic1, ...)
+        """
+        if self._model_state is None:
+            raise ValueError("This model output has no trained model state to infer with.  "
+                             "Only models trained in this version of topik can infer.")
+        vocabulary = self._model_state.vocabulary
+        if hasattr(documents, "vocabulary") and hasattr(documents, "matrix"):
+            if documents.vocabulary != vocabulary:
+                raise ValueError("Documents must be vectorized with the vocabulary of the model.")
+            documents = documents.matrix
+        if sparse.issparse(documents):
+            matrix = documents.tocsr()
+            batches = (matrix[start:start + batch_size]
+                       for start in range(0, matrix.shape[0], batch_size))
+        else:
+            if tokenizer is None:
+                from topik.tokenizers.simple import SimpleTokenizer
+                tokenizer = SimpleTokenizer()
+            batches = (_count_batch(batch, vocabulary, tokenizer)
+                       for batch in _batches(documents, batch_size))
+        results = [self._model_state.infer(batch) for batch in batches]
+        if not results:
+            return np.empty((0, self._model_state.ntopics))
+        return np.vstack(results)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_views"] = {}
+        # as lists of pairs rather than dicts: json would turn int keys into strings
+        for name in _ID_KEYED_ATTRIBUTES:
+            if isinstance(state[name], dict):
+                state[name] = [[key, value] for key, value in state[name].items()]
+        return state
+
+    def __setstate__(self, state):
+        for name in _ID_KEYED_ATTRIBUTES:
+            if isinstance(state.get(name), list):
+                state[name] = {key: value for key, value in state[name]}
+        state["_views"] = {}
+        self.__dict__.update(state)
+
+    @property
+    def model_state(self):
+        """Trained state of the model, or None if it cannot be updated"""
+        return self._model_state
+
     @property
     def vocab(self):
         return self._vocab
@@ -38,16 +231,34 @@ class ModelOutput(object):
     def term_frequency(self):
         return self._term_frequency
 
+    @property
+    def topic_ids(self):
+        return _topic_ids(len(self._topic_term))
+
+    @property
+    def topic_term_array(self):
+        """Array of shape (ntopics, nterms); rows follow topic_ids, columns term ids"""
+        return self._topic_term
+
     @property
     def topic_term_matrix(self):
-        return self._topic_term_matrix
+        return self._view("topic_term_matrix", self.topic_ids, self._topic_term)
 
     @property
     def doc_lengths(self):
         return self._doc_lengths
 
+    @property
+    def doc_ids(self):
+        return self._doc_ids
+
+    @property
+    def doc_topic_array(self):
+        """Array of shape (ndocs, ntopics); rows follow doc_ids"""
+        return self._doc_topic
+
     @property
     def doc_topic_matrix(self):
-        return self._doc_topic_matrix
+        return self._view("doc_topic_matrix", self._doc_ids, self._doc_topic)
 
 
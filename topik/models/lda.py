@@ -1,25 +1,146 @@
 from __future__ import absolute_import, print_function
 
+from itertools import islice
+
 import gensim
 import numpy
 
+from topik.vectorizers.vectorizer_output import VectorizerOutput, _csr_bow
 from .base_model_output import ModelOutput
 from ._registry import register
 from .tests.test_data import test_vectorized_output
 
 
-def _topic_term_to_array(id_term_map, topic):
-    term_scores = {term: float(score) for term, score in topic}
-    return [term_scores[id_term_map[id]] for id in range(len(id_term_map))]
+class _StreamingBowCorpus(object):
+    """Restartable gensim corpus over the rows of a CSR matrix or of a vectorized output.
+
+    Each pass yields one document at a time as a list of (term_id, weight), so
+    the corpus is never copied into lists of tuples.  gensim iterates over a
+    corpus several times (once per pass, then for inference), hence restartable.
+    Vectorized outputs may produce rows as they are read (see
+    :meth:`~.VectorizerOutput.iter_bow`), so training can start before all of
+    them are available.
+    """
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __iter__(self):
+        if isinstance(self._rows, VectorizerOutput):
+            return self._rows.iter_bow()
+        return _csr_bow(self._rows)
+
+    def __len__(self):
+        if isinstance(self._rows, VectorizerOutput):
+            return len(self._rows)
+        return self._rows.shape[0]
 
 
-def _doc_topic_to_array(vectors_for_ids, doc_topic_output):
-    ids = [id for id in vectors_for_ids]
-    collapsed_output = [[float(weight) for topic, weight in doc] for doc in doc_topic_output]
-    return {id: vector for id, vector in zip(ids, collapsed_output)}
+# gensim model settings that later online updates reuse
+_MODEL_SETTINGS = ("chunksize", "passes", "decay", "offset", "eval_every", "iterations",
+                   "gamma_threshold", "minimum_phi_value", "per_word_topics")
+
+
+class _LDAState(object):
+    """Trained state of a gensim LDA model, kept so that training can be resumed.
+
+    Rather than the gensim object itself (which holds process pools and random
+    state), this keeps the variational sufficient statistics, the priors and the
+    number of updates done so far, along with the vocabulary the model was
+    trained on.  It is persisted as part of a ModelOutput.
+    """
+    def __init__(self, vocabulary, sstats, numdocs, alpha, eta, num_updates,
+                 optimize_alpha=False, optimize_eta=False, settings=None):
+        self.vocabulary = vocabulary
+        self.sstats = sstats
+        self.numdocs = numdocs
+        self.alpha = alpha
+        self.eta = eta
+        self.num_updates = num_updates
+        self.optimize_alpha = optimize_alpha
+        self.optimize_eta = optimize_eta
+        self.settings = settings if settings is not None else {}
+        # gensim model rebuilt for inference; not persisted
+        self._inference_model = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_inference_model"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_inference_model", None)
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_model(cls, model, vocabulary):
+        return cls(vocabulary, model.state.sstats, model.state.numdocs, model.alpha,
+                   model.eta, model.num_updates, optimize_alpha=model.optimize_alpha,
+                   optimize_eta=model.optimize_eta,
+                   settings={name: getattr(model, name) for name in _MODEL_SETTINGS})
+
+    @property
+    def ntopics(self):
+        return self.sstats.shape[0]
+
+    def to_model(self, workers=None):
+        """Rebuild a gensim model, ready for model.update(), from this state"""
+        parameters = dict(self.settings, num_topics=self.ntopics,
+                          id2word=self.vocabulary.id_term_map, alpha=self.alpha,
+                          eta=self.eta, minimum_probability=0, dtype=self.sstats.dtype.type)
+        if workers:
+            model = gensim.models.LdaMulticore(workers=workers, **parameters)
+        else:
+            model = gensim.models.LdaModel(**parameters)
+        model.optimize_alpha = self.optimize_alpha
+        model.optimize_eta = self.optimize_eta
+        model.state.sstats[...] = self.sstats
+        model.state.numdocs = self.numdocs
+        model.sync_state()
+        model.num_updates = self.num_updates
+        return model
+
+    def infer(self, matrix):
+        """Topic distribution of each row of a CSR matrix of term counts, by
+        variational inference with the topics held fixed"""
+        if self._inference_model is None:
+            self._inference_model = self.to_model()
+        return _doc_topic_array(self._inference_model, matrix)
+
+
+def _doc_topic_array(model, matrix):
+    """Normalized topic weights of each row of a CSR matrix of term counts, as an
+    (ndocs, ntopics) array.  Documents are inferred model.chunksize at a time."""
+    doc_topic = numpy.empty((matrix.shape[0], model.num_topics), dtype=model.dtype)
+    documents = iter(_StreamingBowCorpus(matrix))
+    for start in range(0, matrix.shape[0], model.chunksize):
+        gamma, _ = model.inference(list(islice(documents, model.chunksize)))
+        doc_topic[start:start + len(gamma)] = gamma / gamma.sum(axis=1)[:, numpy.newaxis]
+    return doc_topic
+
+
+def _model_results(model, vectorized_output):
+    """(ntopics, nterms) topic-term and (ndocs, ntopics) doc-topic arrays of a trained model"""
+    return model.get_topics(), _doc_topic_array(model, vectorized_output.matrix)
+
+
+def _update_LDA(model_state, vectorized_output, workers=None):
+    """Continue training an LDA model online, with new documents only.
+
+    vectorized_output must use the vocabulary of model_state, so that term ids
+    match.  Returns the refreshed topic-term matrix, the doc-topic matrix of the
+    new documents and the new model state.
+    """
+    if vectorized_output.vocabulary is not model_state.vocabulary and \
+            vectorized_output.vocabulary != model_state.vocabulary:
+        raise ValueError("New documents must be vectorized with the vocabulary of the model "
+                         "being updated.")
+    model = model_state.to_model(workers=workers)
+    model.update(_StreamingBowCorpus(vectorized_output))
+    topic_term_matrix, doc_topic_matrix = _model_results(model, vectorized_output)
+    return topic_term_matrix, doc_topic_matrix, _LDAState.from_model(model, model_state.vocabulary)
 
 
-def _LDA(vectorized_output, ntopics, **kwargs):
+def _LDA(vectorized_output, ntopics, workers=None, **kwargs):
     """A high-level interface for an LDA (Latent Dirichlet Allocation) model.
 
 
@@ -30,29 +151,33 @@ def _LDA(vectorized_output, ntopics, **kwargs):
         see topik.fileio.tokenized_corpus for more info.
     ntopics : int
         Number of topics to model
+    workers : None or int
+        If given, train with gensim's LdaMulticore using this many worker
+        processes.  Otherwise train with single-process LdaModel.
     load_filename : None or str
         If not None, this (JSON) file is read to determine parameters of the model persisted to disk.
     binary_filename : None or str
         If not None, this file is loaded by Gensim to bring a disk-persisted model back into memory.
 
 
-    Attributes
-    ----------
-    corpus : CorpusBase-derived object, tokenized
-    model : Gensim LdaModel instance
+    Returns
+    -------
+    (topic_term_matrix, doc_topic_matrix, model_state): arrays of shape (ntopics, nterms)
+    and (ndocs, ntopics), document rows following vectorized_output.doc_ids, and the
+    _LDAState of the trained model
 
 
     Examples
     --------
     >>> numpy.random.seed(42)
-    >>> topic_term_matrix, doc_topic_matrix = _LDA(test_vectorized_output, ntopics=3)
-    >>> print(doc_topic_matrix)
-    {'doc2': [0.08965506930971592, 0.8220080030962146, 0.08833692759406957], 'doc1': [0.058149936870419104, \
-0.8840453614518317, 0.057804701677749225]}
-    >>> print(topic_term_matrix)
-    {'topic1': [0.13976120128031258, 0.4679840256939818, 0.24623553590186162, 0.14601923712384413], \
-'topic0': [0.24299945065748912, 0.2770920435904989, 0.2640943027886815, 0.21581420296333048], \
-'topic2': [0.24371010776515245, 0.2631345128191464, 0.2570423085484777, 0.23611307086722336]}
+    >>> topic_term_matrix, doc_topic_matrix, model_state = _LDA(test_vectorized_output, ntopics=3)
+    >>> print(numpy.round(doc_topic_matrix, 3))
+    [[0.09  0.822 0.088]
+     [0.058 0.884 0.058]]
+    >>> print(numpy.round(topic_term_matrix, 3))
+    [[0.243 0.277 0.264 0.216]
+     [0.14  0.468 0.246 0.146]
+     [0.244 0.263 0.257 0.236]]
     """
     # the minimum_probability=0 argument is necessary in order for
     # gensim to return the full document-topic-distribution matrix.  If
@@ -62,21 +187,38 @@ def _LDA(vectorized_output, ntopics, **kwargs):
     # all rows (documents) in the document-topic-distribution matrix sum
     # to 1.
 
-    bow = [[(k, v) for k, v in vector.items()] for vector in vectorized_output.vectors.values()]
-    _model = gensim.models.LdaModel(bow,
-                                    num_topics=ntopics,
-                                    id2word=vectorized_output.id_term_map,
-                                    minimum_probability=0, **kwargs)
-    topic_term_matrix = {"topic{}".format(topic_no): _topic_term_to_array(vectorized_output.id_term_map,
-                                                                          _model.show_topic(topic_no, None))
-                         for topic_no in range(ntopics)}
-    doc_topic_matrix = list(_model[bow])
-
-    doc_topic_matrix = _doc_topic_to_array(vectorized_output.vectors, doc_topic_matrix)
-
-    return topic_term_matrix, doc_topic_matrix
+    bow = _StreamingBowCorpus(vectorized_output)
+    if workers:
+        _model = gensim.models.LdaMulticore(bow,
+                                            num_topics=ntopics,
+                                            id2word=vectorized_output.id_term_map,
+                                            workers=workers,
+                                            minimum_probability=0, **kwargs)
+    else:
+        _model = gensim.models.LdaModel(bow,
+                                        num_topics=ntopics,
+                                        id2word=vectorized_output.id_term_map,
+                                        minimum_probability=0, **kwargs)
+    topic_term_matrix, doc_topic_matrix = _model_results(_model, vectorized_output)
+    return topic_term_matrix, doc_topic_matrix, _LDAState.from_model(_model,
+                                                                     vectorized_output.vocabulary)
 
 
 @register
-def lda(vectorized_output, ntopics, **kwargs):
-    return ModelOutput(vectorized_corpus=vectorized_output, model_func=_LDA, ntopics=ntopics, **kwargs)
+def lda(vectorized_output, ntopics, workers=None, **kwargs):
+    """Latent Dirichlet Allocation, trained with gensim.
+
+    Parameters
+    ----------
+    vectorized_output : VectorizerOutput
+    ntopics : int
+        Number of topics to model
+    workers : None or int
+        Number of worker processes for gensim's LdaMulticore.  None trains in
+        this process with LdaModel.  LdaMulticore does not support alpha='auto'.
+        Updates with :meth:`~.ModelOutput.update` take workers the same way.
+    kwargs :
+        passed on to the gensim model (passes, chunksize, random_state, ...)
+    """
+    return ModelOutput(vectorized_corpus=vectorized_output, model_func=_LDA,
+                       update_func=_update_LDA, ntopics=ntopics, workers=workers, **kwargs)
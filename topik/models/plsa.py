@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from functools import partial
 import logging
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
+from six.moves import map, zip
 
 from .base_model_output import ModelOutput
 from ._registry import register
@@ -10,82 +13,200 @@ from ._registry import register
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
                     level=logging.WARNING)
 
+# exponent of tempered EM, used both in training and when folding in new documents
+_BETA = 0.8
 
-def _rand_mat(rows, cols):
-    out = np.random.random((rows, cols))
+
+def _rand_mat(rows, cols, random_state=np.random):
+    out = random_state.random_sample((rows, cols))
     for row in out:
         row /= row.sum()
     return out
 
 
-def _cal_p_dw(words_in_docs, word_cts_in_docs, topic_array, zw, dz, beta, p_dw):
-    for (d, doc_id, words) in words_in_docs:
-        p_dw[d, words] = (word_cts_in_docs[doc_id] * (zw[:, words]*np.expand_dims(dz[d, :], 1))**beta).sum(axis=0)
-    return p_dw
+def _coo_arrays(matrix):
+    """Row index, column index and value of each nonzero of a CSR matrix, as flat arrays"""
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return rows, matrix.indices, matrix.data.astype(np.float64)
+
+
+def _shards(matrix, shard_size):
+    """Split the nonzeros of a CSR matrix into blocks of shard_size documents.
+
+    Returns a list of (first_row, nrows, rows, cols, counts), where rows are
+    relative to first_row."""
+    shards = []
+    for first_row in range(0, matrix.shape[0], shard_size):
+        shard = matrix[first_row:first_row + shard_size]
+        rows, cols, counts = _coo_arrays(shard)
+        shards.append((first_row, shard.shape[0], rows, cols, counts))
+    return shards
+
+
+def _tempered_weights(rows, cols, tempered_zw, tempered_dz):
+    """(P(w|z) P(z|d)) ** beta for each nonzero (d, w) and topic z; shape (nnz, ntopics).
+
+    Takes zw ** beta and dz ** beta, which are much smaller than the result, so
+    that the power is not taken for every nonzero."""
+    return tempered_zw[:, cols].T * tempered_dz[rows]
 
 
-def _e_step(words_in_docs, dw_z, topic_array, zw, dz, beta, p_dw):
-    for (d, _, words) in words_in_docs:
-        dw_z[d, words, :] = ((zw[:, words].T * dz[d, :]) ** beta) / np.expand_dims(p_dw[d, words], 1)
-    return dw_z
+def _cal_p_dw(counts, weights):
+    """Tempered probability of each nonzero (document, term) pair, scaled by its count"""
+    return counts * weights.sum(axis=1)
 
 
-def _m_step(words_in_docs, word_cts_in_docs, topic_array, zw, dw_z, dz):
-    zw[:] = 0
-    for (d, doc_id, words) in words_in_docs:
-        zw[:, words] += word_cts_in_docs[doc_id]*dw_z[d, words].T
-    # normalize by sum of topic word weights
-    zw /= np.expand_dims(zw.sum(axis=1), 1)
-    for (d, doc_id, words) in words_in_docs:
-        dz[d] = (word_cts_in_docs[doc_id] * dw_z[d, words].T).sum(axis=1)
-    dz /= np.expand_dims(dz.sum(axis=1), 1)
+def _e_step(weights, p_dw):
+    """Responsibility of each topic for each nonzero (document, term) pair; shape (nnz, ntopics)"""
+    return weights / np.expand_dims(p_dw, 1)
+
+
+def _m_step_sums(rows, cols, counts, dw_z, ndocs, nterms):
+    """Unnormalized topic-term and document-topic matrices: the count-weighted
+    responsibilities of all nonzeros, scatter-added by term and by document"""
+    weighted = np.expand_dims(counts, 1) * dw_z
+    ntopics = dw_z.shape[1]
+    zw = np.array([np.bincount(cols, weights=weighted[:, topic], minlength=nterms)
+                   for topic in range(ntopics)])
+    dz = np.array([np.bincount(rows, weights=weighted[:, topic], minlength=ndocs)
+                   for topic in range(ntopics)]).T
     return zw, dz
 
 
-def _cal_likelihood(words_in_docs, word_cts_in_docs, p_dw):
-    likelihood = 0
-    for (d, doc_id, words) in words_in_docs:
-        likelihood += sum(word_cts_in_docs[doc_id] * np.log(p_dw[d][words]))
-    return likelihood
+def _normalize_rows(matrix):
+    matrix /= np.expand_dims(matrix.sum(axis=1), 1)
+    return matrix
 
 
-def _get_topic_term_matrix(zw, ntopics, id_term_map):
-    labeled_zw = {"topic"+str(topicno): zw[topicno].tolist() for topicno in range(ntopics)}
-    return labeled_zw
+def _cal_likelihood(counts, p_dw):
+    return (counts * np.log(p_dw)).sum()
 
 
-def _get_doc_topic_matrix(dz, ntopics, vectorized_corpus):
-    labeled_dz = {doc_id: dz[i].tolist() for i, (doc_id, vector) in enumerate(vectorized_corpus.get_vectors())}
-    return labeled_dz
+def _shard_statistics(shard, tempered_zw, tempered_dz):
+    """E step and partial M step sums for one shard of documents"""
+    first_row, nrows, rows, cols, counts = shard
+    weights = _tempered_weights(rows, cols, tempered_zw,
+                                tempered_dz[first_row:first_row + nrows])
+    p_dw = _cal_p_dw(counts, weights)
+    dw_z = _e_step(weights, p_dw)
+    zw_sums, dz_sums = _m_step_sums(rows, cols, counts, dw_z, nrows, tempered_zw.shape[1])
+    return zw_sums, dz_sums, _cal_likelihood(counts, p_dw)
 
 
-def _PLSA(vectorized_corpus, ntopics, max_iter):
-    cur = 0
-    topic_array = np.arange(ntopics, dtype=np.int32)
-    # topic-word matrix
-    zw = _rand_mat(ntopics, vectorized_corpus.global_term_count)
-    # document-topic matrix
-    dz = _rand_mat(len(vectorized_corpus), ntopics)
-    dw_z = np.zeros((len(vectorized_corpus), vectorized_corpus.global_term_count, ntopics))
-    p_dw = np.zeros((len(vectorized_corpus), vectorized_corpus.global_term_count))
-    beta = 0.8
-    words_in_docs = [(id, doc_id, [word_id for word_id, _ in doc.items()])
-                     for id, (doc_id, doc) in enumerate(vectorized_corpus.get_vectors())]
-    word_cts_in_docs = {doc_id: [ct for _, ct in doc.items()] for doc_id, doc in vectorized_corpus.get_vectors()}
+def _fold_in(matrix, zw, max_iter=50, tolerance=1e-6):
+    """Topic distributions of new documents, by EM with the topics held fixed.
+
+    Only P(z|d) is fitted, starting from uniform, so results are deterministic.
+    The same tempering as in training is used.  Documents without any known terms get a
+    uniform distribution.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_matrix
+        documents x terms matrix of term counts
+    zw : numpy array
+        topic-term matrix, P(w|z), of shape (ntopics, nterms)
+    """
+    ndocs, ntopics = matrix.shape[0], zw.shape[0]
+    dz = np.full((ndocs, ntopics), 1.0 / ntopics)
+    if not ndocs:
+        return dz
+    rows, cols, counts = _coo_arrays(matrix)
+    # tempered P(w|z) for each nonzero; fixed, so gathered once
+    tempered_zw = zw[:, cols].T ** _BETA
     for i in range(max_iter):
-        p_dw = _cal_p_dw(words_in_docs, word_cts_in_docs, topic_array, zw, dz, beta, p_dw)
-        dw_z = _e_step(words_in_docs, dw_z, topic_array, zw, dz, beta, p_dw)
-        zw, dz = _m_step(words_in_docs, word_cts_in_docs, topic_array, zw, dw_z, dz)
-        likelihood = _cal_likelihood(words_in_docs, word_cts_in_docs, p_dw)
-        if cur != 0 and abs((likelihood-cur)/cur) < 1e-8:
+        weights = tempered_zw * dz[rows] ** _BETA
+        p_dw = weights.sum(axis=1)
+        p_dw[p_dw == 0] = 1
+        weighted = np.expand_dims(counts, 1) * _e_step(weights, p_dw)
+        dz_sums = np.array([np.bincount(rows, weights=weighted[:, topic], minlength=ndocs)
+                            for topic in range(ntopics)]).T
+        dz_sums[dz_sums.sum(axis=1) == 0] = 1
+        previous, dz = dz, _normalize_rows(dz_sums)
+        if np.abs(dz - previous).max() < tolerance:
             break
-        cur = likelihood
-    topic_term_matrix = _get_topic_term_matrix(zw, ntopics, vectorized_corpus.id_term_map)
-    doc_topic_matrix = _get_doc_topic_matrix(dz, ntopics, vectorized_corpus)
-    return topic_term_matrix, doc_topic_matrix
+    return dz
+
+
+class _PLSAState(object):
+    """Trained topics of a PLSA model, with the vocabulary they are over, kept for
+    inference on new documents"""
+    def __init__(self, vocabulary, zw):
+        self.vocabulary = vocabulary
+        self.zw = zw
+
+    @property
+    def ntopics(self):
+        return self.zw.shape[0]
+
+    def infer(self, matrix):
+        """Topic distribution of each row of a CSR matrix of term counts"""
+        return _fold_in(matrix, self.zw)
 
-@register
-def plsa(vectorized_corpus, ntopics, max_iter=100, **kwargs):
-    return ModelOutput(vectorized_corpus=vectorized_corpus, model_func=_PLSA, ntopics=ntopics, max_iter=max_iter, **kwargs)
 
+def _PLSA(vectorized_corpus, ntopics, max_iter, workers=1, shard_size=5000, seed=None):
+    """Fit PLSA by tempered expectation maximization.
 
+    Only the nonzero (document, term) pairs of the vectorized corpus are visited:
+    probabilities and topic responsibilities are kept in flat arrays aligned with
+    them, so memory grows with the number of nonzeros times ntopics rather than
+    with documents x terms x ntopics.
+
+    Documents are split into shards of shard_size.  Each shard's E step and
+    partial M step sums can run in a separate thread (numpy releases the GIL for
+    most of the work); the sums and likelihoods are then added up in shard order.
+    Shards do not depend on the number of workers, so for a given seed the result
+    is the same with any number of workers.
+    """
+    random_state = np.random if seed is None else np.random.RandomState(seed)
+    cur = 0
+    nterms = vectorized_corpus.global_term_count
+    # topic-word matrix
+    zw = _rand_mat(ntopics, nterms, random_state)
+    # document-topic matrix
+    dz = _rand_mat(len(vectorized_corpus), ntopics, random_state)
+    shards = _shards(vectorized_corpus.matrix, shard_size)
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        for i in range(max_iter):
+            statistics = partial(_shard_statistics, tempered_zw=zw ** _BETA,
+                                 tempered_dz=dz ** _BETA)
+            shard_results = pool.imap(statistics, shards) if pool else map(statistics, shards)
+            zw_sums = np.zeros((ntopics, nterms))
+            dz_sums = np.empty_like(dz)
+            likelihood = 0
+            for (first_row, nrows, _, _, _), (shard_zw, shard_dz, shard_likelihood) in \
+                    zip(shards, shard_results):
+                zw_sums += shard_zw
+                dz_sums[first_row:first_row + nrows] = shard_dz
+                likelihood += shard_likelihood
+            # normalize by sum of topic word weights
+            zw, dz = _normalize_rows(zw_sums), _normalize_rows(dz_sums)
+            if cur != 0 and abs((likelihood-cur)/cur) < 1e-8:
+                break
+            cur = likelihood
+    finally:
+        if pool:
+            pool.terminate()
+    # rows of dz follow the doc ids of the vectorized corpus
+    return zw, dz, _PLSAState(vectorized_corpus.vocabulary, zw)
+
+@register
+def plsa(vectorized_corpus, ntopics, max_iter=100, workers=1, seed=None, **kwargs):
+    """Probabilistic latent semantic analysis, fit by tempered EM.
+
+    Parameters
+    ----------
+    vectorized_corpus : VectorizerOutput
+    ntopics : int
+        Number of topics to model
+    max_iter : int
+        Maximum number of EM iterations
+    workers : int
+        Number of threads to run the E step on, over shards of documents
+    seed : None or int
+        Seed for the random initial matrices.  Results for a given seed do not
+        depend on workers.
+    """
+    return ModelOutput(vectorized_corpus=vectorized_corpus, model_func=_PLSA, ntopics=ntopics,
+                       max_iter=max_iter, workers=workers, seed=seed, **kwargs)
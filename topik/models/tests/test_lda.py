@@ -1,7 +1,10 @@
+import jsonpickle
 import nose.tools as nt
+import numpy as np
 
 from topik.models.tests.test_data import test_vectorized_output
-from topik.models.lda import lda
+from topik.models.lda import lda, _StreamingBowCorpus
+from topik.vectorizers import bag_of_words
 
 
 def test_train():
@@ -11,3 +14,74 @@ def test_train():
     for topic in model_output.topic_term_matrix.values():
         nt.assert_almost_equal(sum(topic), 1)
 
+
+
+def test_train_multicore():
+    model_output = lda(test_vectorized_output, ntopics=2, workers=2, random_state=42)
+    nt.assert_equal(set(model_output.doc_topic_matrix), set(test_vectorized_output.doc_ids))
+    for doc in model_output.doc_topic_matrix.values():
+        nt.assert_almost_equal(sum(doc), 1, places=5)
+    for topic in model_output.topic_term_matrix.values():
+        nt.assert_almost_equal(sum(topic), 1, places=5)
+
+
+def test_streaming_corpus_restarts():
+    bow = _StreamingBowCorpus(test_vectorized_output.matrix)
+    first_pass = list(bow)
+    nt.assert_equal(len(first_pass), len(bow))
+    nt.assert_equal(first_pass, list(bow))
+    nt.assert_equal(dict(first_pass[0]), test_vectorized_output.vectors.row(0))
+
+
+def test_update():
+    model_output = lda(test_vectorized_output, ntopics=2, random_state=42)
+    state = model_output.model_state
+    new_docs = bag_of_words([("doc3", ["llama", "llama", "cat", "airplane"])],
+                            vocabulary=state.vocabulary)
+    old_doc_topics = dict(model_output.doc_topic_matrix)
+    model_output.update(new_docs)
+    nt.assert_equal(model_output.model_state.numdocs, state.numdocs + 1)
+    nt.assert_equal(model_output.doc_lengths["doc3"], 4)
+    nt.assert_equal(model_output.term_frequency[3], 12)
+    nt.assert_almost_equal(sum(model_output.doc_topic_matrix["doc3"]), 1, places=5)
+    for doc_id, doc in old_doc_topics.items():
+        np.testing.assert_array_equal(model_output.doc_topic_matrix[doc_id], doc)
+    for topic in model_output.topic_term_matrix.values():
+        nt.assert_almost_equal(sum(topic), 1, places=5)
+
+
+def test_update_requires_model_vocabulary():
+    model_output = lda(test_vectorized_output, ntopics=2)
+    new_docs = bag_of_words([("doc3", ["llama", "airplane"])])
+    nt.assert_raises(ValueError, model_output.update, new_docs)
+
+
+def test_persist_state():
+    model_output = lda(test_vectorized_output, ntopics=2, random_state=42)
+    loaded = jsonpickle.decode(jsonpickle.encode(model_output))
+    nt.assert_equal(loaded.doc_ids, model_output.doc_ids)
+    np.testing.assert_array_equal(loaded.doc_topic_array, model_output.doc_topic_array)
+    np.testing.assert_allclose(loaded.model_state.to_model().get_topics(),
+                               model_output.model_state.to_model().get_topics())
+
+
+def test_arrays():
+    model_output = lda(test_vectorized_output, ntopics=3)
+    nt.assert_equal(model_output.topic_term_array.shape, (3, 4))
+    nt.assert_equal(model_output.doc_topic_array.shape, (2, 3))
+    nt.assert_equal(model_output.doc_ids, test_vectorized_output.doc_ids)
+    nt.assert_equal(list(model_output.topic_term_matrix), ["topic0", "topic1", "topic2"])
+    np.testing.assert_array_equal(model_output.topic_term_matrix["topic1"],
+                                  model_output.topic_term_array[1])
+    np.testing.assert_array_equal(model_output.doc_topic_matrix["doc1"],
+                                  model_output.doc_topic_array[model_output.doc_ids.index("doc1")])
+
+
+def test_infer():
+    model_output = lda(test_vectorized_output, ntopics=2, random_state=42)
+    inferred = model_output.infer(["Llama llama cat", "dog frank"], batch_size=1)
+    nt.assert_equal(inferred.shape, (2, 2))
+    np.testing.assert_allclose(inferred.sum(axis=1), 1, rtol=1e-5)
+    np.testing.assert_allclose(model_output.infer([["llama", "llama", "cat"], ["dog", "frank"]]),
+                               inferred, atol=0.01)
+    nt.assert_equal(model_output.infer([]).shape, (0, 2))
@@ -0,0 +1,45 @@
+import json
+import os
+
+import jsonpickle
+import nose.tools as nt
+import numpy as np
+
+from topik.fileio.base_output import load_output
+from topik.fileio.tests import test_data_path
+from topik.models.tests.test_data import test_model_output
+
+
+def test_dicts_to_arrays():
+    nt.assert_equal(test_model_output.topic_ids, ["topic0", "topic1"])
+    nt.assert_equal(test_model_output.topic_term_array.shape, (2, 10))
+    nt.assert_equal(test_model_output.doc_topic_array.shape, (4, 2))
+    np.testing.assert_allclose(test_model_output.doc_topic_matrix["doc3"], [0.9, 0.1])
+    nt.assert_almost_equal(test_model_output.topic_term_matrix["topic1"][2], 0.169)
+
+
+def test_load_legacy_model():
+    # saved by topik 0.x, with weights held in dicts
+    legacy_filename = os.path.join(test_data_path, "legacy_project.topikdata")
+    with open(legacy_filename) as f:
+        saved = json.load(f)["saved_data"]["modeled_corpora"]["data"]["lda_"]
+    model_output = load_output(legacy_filename).modeled_corpora["lda_"]
+    np.testing.assert_allclose(model_output.topic_term_array,
+                               [saved["_topic_term_matrix"]["topic0"],
+                                saved["_topic_term_matrix"]["topic1"]])
+    doc_id = model_output.doc_ids[0]
+    np.testing.assert_allclose(model_output.doc_topic_matrix[doc_id],
+                               saved["_doc_topic_matrix"][str(doc_id)])
+    nt.assert_equal(model_output.vocab[0], saved["_vocab"]["0"])
+    nt.assert_true(model_output.model_state is None)
+
+    loaded = jsonpickle.decode(jsonpickle.encode(model_output))
+    np.testing.assert_array_equal(loaded.topic_term_array, model_output.topic_term_array)
+    nt.assert_equal(loaded.doc_ids, model_output.doc_ids)
+
+
+def test_persist():
+    loaded = jsonpickle.decode(jsonpickle.encode(test_model_output))
+    nt.assert_equal(loaded.doc_ids, test_model_output.doc_ids)
+    np.testing.assert_array_equal(loaded.doc_topic_array, test_model_output.doc_topic_array)
+    np.testing.assert_array_equal(loaded.topic_term_array, test_model_output.topic_term_array)
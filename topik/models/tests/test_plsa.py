@@ -6,12 +6,12 @@ import numpy as np
 from topik.models import registered_models
 from topik.models.tests.test_data import test_vectorized_output
 
-from topik.models.plsa import _rand_mat, _e_step, _m_step, _cal_likelihood, _cal_p_dw, plsa
+from topik.models.plsa import _rand_mat, _e_step, _m_step_sums, _normalize_rows, \
+    _cal_likelihood, _cal_p_dw, _coo_arrays, _tempered_weights, _PLSA, plsa
 
 ntopics = 2
-words_in_docs = [(id, doc_id, [word_id for word_id, _ in doc.items()])
-                     for id, (doc_id, doc) in enumerate(test_vectorized_output.get_vectors())]
-word_cts_in_docs = {doc_id: [ct for _, ct in doc.items()] for doc_id, doc in test_vectorized_output.get_vectors()}
+ndocs, nterms = len(test_vectorized_output), test_vectorized_output.global_term_count
+rows, cols, counts = _coo_arrays(test_vectorized_output.matrix)
 
 def test_rand_mat():
     # ntopics, nwords
@@ -22,14 +22,23 @@ def test_rand_mat():
         nt.assert_almost_equal(sum(topic), 1)
 
 
+def test_coo_arrays():
+    nt.assert_equal(len(rows), test_vectorized_output.matrix.nnz)
+    for row, col, count in zip(rows, cols, counts):
+        doc_id = test_vectorized_output.doc_ids[row]
+        nt.assert_equal(test_vectorized_output.vectors[doc_id][col], count)
+
+
 def test_em():
-    dz = _rand_mat(len(test_vectorized_output), ntopics)
-    dw_z = np.zeros((len(test_vectorized_output), test_vectorized_output.global_term_count, ntopics))
-    p_dw = np.zeros((len(test_vectorized_output), test_vectorized_output.global_term_count))
-    zw = _rand_mat(ntopics, test_vectorized_output.global_term_count)
-    p_dw = _cal_p_dw(words_in_docs, word_cts_in_docs, range(ntopics), zw, dz, 0.8, p_dw)
-    dw_z = _e_step(words_in_docs, dw_z, range(ntopics), zw, dz, 0.8, p_dw)
-    zw, dz = _m_step(words_in_docs, word_cts_in_docs, range(ntopics), zw, dw_z, dz)
+    dz = _rand_mat(ndocs, ntopics)
+    zw = _rand_mat(ntopics, nterms)
+    weights = _tempered_weights(rows, cols, zw ** 0.8, dz ** 0.8)
+    p_dw = _cal_p_dw(counts, weights)
+    dw_z = _e_step(weights, p_dw)
+    nt.assert_equal(dw_z.shape, (len(rows), ntopics))
+    zw, dz = (_normalize_rows(sums) for sums in _m_step_sums(rows, cols, counts, dw_z, ndocs, nterms))
+    nt.assert_equal(zw.shape, (ntopics, nterms))
+    nt.assert_equal(dz.shape, (ndocs, ntopics))
     for topic in zw:
         nt.assert_almost_equal(sum(topic), 1)
     for doc in dz:
@@ -37,11 +46,10 @@ def test_em():
 
 
 def test_cal_likelihood():
-    dz = _rand_mat(len(test_vectorized_output), ntopics)
-    zw = _rand_mat(ntopics, test_vectorized_output.global_term_count)
-    p_dw = np.zeros((len(test_vectorized_output), test_vectorized_output.global_term_count))
-    p_dw = _cal_p_dw(words_in_docs, word_cts_in_docs, range(ntopics), zw, dz, 0.8, p_dw)
-    likelihood = _cal_likelihood(words_in_docs, word_cts_in_docs, p_dw)
+    dz = _rand_mat(ndocs, ntopics)
+    zw = _rand_mat(ntopics, nterms)
+    p_dw = _cal_p_dw(counts, _tempered_weights(rows, cols, zw ** 0.8, dz ** 0.8))
+    likelihood = _cal_likelihood(counts, p_dw)
     nt.assert_less(likelihood, 0)
 
 
@@ -54,6 +62,29 @@ def test_train():
         nt.assert_almost_equal(sum(topic), 1)
 
 
+def test_workers_reproducible():
+    # shards are fixed by shard_size, so any number of workers reduces them identically
+    results = [_PLSA(test_vectorized_output, ntopics=2, max_iter=20, workers=workers,
+                     shard_size=1, seed=42) for workers in (1, 2)]
+    for one_worker, two_workers in zip(results[0][:2], results[1][:2]):
+        np.testing.assert_array_equal(one_worker, two_workers)
+    model_output = plsa(test_vectorized_output, ntopics=2, workers=2, seed=42)
+    np.testing.assert_array_equal(model_output.doc_topic_array,
+                                  plsa(test_vectorized_output, ntopics=2, seed=42).doc_topic_array)
+
+
+def test_fold_in():
+    model_output = plsa(test_vectorized_output, ntopics=2, seed=42)
+    inferred = model_output.infer(test_vectorized_output)
+    nt.assert_equal(inferred.shape, (len(test_vectorized_output), 2))
+    np.testing.assert_allclose(inferred.sum(axis=1), 1)
+    # starts from uniform, so inference is deterministic and does not depend on batching
+    np.testing.assert_allclose(model_output.infer(test_vectorized_output, batch_size=1),
+                               inferred, atol=1e-5)
+    inferred = model_output.infer([["llama", "cat", "airplane"], ["airplane"]])
+    np.testing.assert_allclose(inferred[1], [0.5, 0.5])
+
+
 def test_registration():
     nt.assert_true("plsa" in registered_models)
 
@@ -0,0 +1,101 @@
+from collections import deque
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+# names of the keyword arguments that control execution, rather than tokenization.
+#    They do not change the output, so they are left out of result identifiers.
+EXECUTION_ARGUMENTS = ("processes", "chunksize", "ordered")
+
+# per-process state, set once when each worker starts
+_worker_state = {}
+
+
+def _initialize_worker(document_func, kwargs):
+    _worker_state["func"] = partial(document_func, **kwargs)
+
+
+def _process_chunk(chunk):
+    func = _worker_state["func"]
+    return [(doc_id, func(doc_text)) for doc_id, doc_text in chunk]
+
+
+def _chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _next_result(pending, ordered):
+    """Pop a finished task from pending: the oldest one if ordered, else any
+    one that is ready"""
+    if ordered:
+        return pending.popleft().get()
+    while True:
+        for result in pending:
+            if result.ready():
+                pending.remove(result)
+                return result.get()
+        pending[0].wait(0.05)
+
+
+def map_documents(document_func, raw_corpus, processes=1, chunksize=500, ordered=True,
+                  **kwargs):
+    """Apply a single-document function to the text of every document in a corpus.
+
+    With more than one process, documents are sent to a pool of worker processes
+    in chunks of chunksize.  document_func and kwargs (stopwords, collected
+    n-grams, ...) are sent to each worker once, when it starts, rather than with
+    every chunk.  Only a few chunks per worker are in flight at a time, so the
+    corpus is still streamed rather than read into memory.
+
+    Parameters
+    ----------
+    document_func : function
+        module-level function taking a document's text as first argument
+    raw_corpus : iterable of tuple of (doc_id(str/int), doc_text(str))
+        body of documents to process
+    processes : int or None
+        Number of worker processes.  1 processes documents in this process; None
+        uses one worker per CPU.
+    chunksize : int
+        Number of documents sent to a worker at a time
+    ordered : bool
+        If True, results follow the order of raw_corpus.  If False, results are
+        yielded as soon as any chunk is done.
+    kwargs :
+        passed on to document_func
+
+    Examples
+    --------
+    >>> from topik.tokenizers.simple import _simple_document
+    >>> corpus = [("doc1", "frank FRANK the frank dog cat"), ("doc2", "frank a dog of the llama")]
+    >>> results = map_documents(_simple_document, corpus, processes=2, chunksize=1)
+    >>> list(results) == [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
+    ...                   ("doc2", ["frank", "dog", "llama"])]
+    True
+    """
+    if processes == 1:
+        for doc_id, doc_text in raw_corpus:
+            yield doc_id, document_func(doc_text, **kwargs)
+        return
+
+    pool = Pool(processes, initializer=_initialize_worker, initargs=(document_func, kwargs))
+    max_pending = 2 * (processes or cpu_count())
+    pending = deque()
+    try:
+        for chunk in _chunks(raw_corpus, chunksize):
+            pending.append(pool.apply_async(_process_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                for item in _next_result(pending, ordered):
+                    yield item
+        while pending:
+            for item in _next_result(pending, ordered):
+                yield item
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -32,6 +32,8 @@ def tokenize(corpus, method="simple", **kwargs):
         Each iteration call should return a new document's content.
     method: string id of tokenizer to use.  For keys, see
         topik.tokenizers.registered_tokenizers (which is a dictionary of functions)
-    kwargs: arbitrary dicionary of extra parameters.
+    kwargs: arbitrary dicionary of extra parameters.  All tokenizers accept processes,
+        chunksize and ordered, to spread documents over several worker processes
+        (see topik.tokenizers._parallel.map_documents).
     """
     return registered_tokenizers[method](corpus, **kwargs)
@@ -1,8 +1,14 @@
+import hashlib
 import logging
-import itertools
+import os
+import tempfile
+
+from six import text_type
+from six.moves import cPickle as pickle
 from textblob import TextBlob
 
 from topik.tokenizers.simple import _simple_document
+from topik.tokenizers._parallel import map_documents
 
 # imports used only for doctests
 from topik.tokenizers._registry import register
@@ -17,7 +23,117 @@ sample_corpus = [
                          u"recently been popularized by such retired "
                          u"celebrities as Frank The Swank-Tank."))]
 
-def _collect_entities(raw_corpus, freq_min=2, freq_max=10000):
+def _noun_phrases(text):
+    return list(TextBlob(text).noun_phrases)
+
+
+def _fingerprinted(corpus, digest):
+    """Yield the documents of corpus, adding their ids and texts to digest"""
+    for doc_id, text in corpus:
+        digest.update(repr(doc_id).encode("utf-8") + b"\0")
+        digest.update((text.encode("utf-8") if isinstance(text, text_type) else text) + b"\0")
+        yield doc_id, text
+
+
+# first record of a cache file, followed by the md5 digest of the documents it was made from
+_CACHE_HEADER = "topik noun phrases"
+
+
+class _NounPhraseCache(object):
+    """Each document's noun phrases, stored in a file in document order.
+
+    Noun phrase extraction is the slow part of entity tokenization.  The cache
+    lets it run once per document: the phrases are written here while entities
+    are collected, then read back to tokenize each document, instead of keeping
+    the corpus around to extract them again.
+
+    If filename is None, a temporary file is used and deleted on close.
+    Otherwise the file is kept, and if it already holds phrases they can be
+    reused.  The file starts with a fingerprint of the documents the phrases were
+    extracted from, so that it is not reused for other documents.
+
+    Examples
+    --------
+    >>> with _NounPhraseCache() as cache:
+    ...     cache.fill([("doc1", [u"sassy unicorns"]), ("doc2", [])], hashlib.md5(b"corpus"))
+    ...     list(cache) == [("doc1", [u"sassy unicorns"]), ("doc2", [])]
+    True
+    """
+    def __init__(self, filename=None):
+        self._temporary = filename is None
+        if self._temporary:
+            handle, filename = tempfile.mkstemp(suffix=".phrases")
+            os.close(handle)
+            os.remove(filename)
+        self.filename = filename
+
+    @property
+    def filled(self):
+        return os.path.exists(self.filename)
+
+    @property
+    def fingerprint(self):
+        """md5 hex digest of the documents the stored phrases come from, or None if
+        the file is not a phrase cache"""
+        with open(self.filename, "rb") as f:
+            try:
+                header, fingerprint = pickle.load(f)
+            except Exception:
+                return None
+        return fingerprint if header == _CACHE_HEADER else None
+
+    def fill(self, document_phrases, digest):
+        """Store an iterable of (doc_id, list of noun phrases).  digest (a hashlib
+        md5 object) is the fingerprint of the documents once they are all read."""
+        partial_filename = self.filename + ".partial"
+        with open(partial_filename, "wb") as f:
+            # a placeholder of the same size, written over once the documents are read
+            pickle.dump((_CACHE_HEADER, "0" * 32), f, pickle.HIGHEST_PROTOCOL)
+            for doc_id, noun_phrases in document_phrases:
+                pickle.dump((doc_id, noun_phrases), f, pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            pickle.dump((_CACHE_HEADER, digest.hexdigest()), f, pickle.HIGHEST_PROTOCOL)
+        # only a complete cache is ever found at filename
+        os.rename(partial_filename, self.filename)
+
+    def __iter__(self):
+        with open(self.filename, "rb") as f:
+            pickle.load(f)
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def close(self):
+        if self._temporary and self.filled:
+            os.remove(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _fill_cache(cache, corpus, processes=1, chunksize=500, ordered=True):
+    """Extract the noun phrases of corpus into cache, unless it already holds those of
+    the very same documents.  Raises ValueError if it holds those of other documents."""
+    digest = hashlib.md5()
+    documents = _fingerprinted(corpus, digest)
+    if not cache.filled:
+        cache.fill(map_documents(_noun_phrases, documents, processes=processes,
+                                 chunksize=chunksize, ordered=ordered), digest)
+        return
+    # reading the documents is cheap next to extracting their phrases again
+    for _ in documents:
+        pass
+    if cache.fingerprint != digest.hexdigest():
+        raise ValueError("Phrase cache {} holds the noun phrases of other documents than "
+                         "corpus.  Remove it, or pass another phrase_cache.".format(cache.filename))
+
+
+def _collect_entities(raw_corpus, freq_min=2, freq_max=10000, processes=1, chunksize=500):
     """Return noun phrases from collection of documents.
 
     Parameters
@@ -27,6 +143,8 @@ def _collect_entities(raw_corpus, freq_min=2, freq_max=10000):
         Minimum frequency of a noun phrase occurrences in order to retrieve it. Default is 2.
     freq_max: int
         Maximum frequency of a noun phrase occurrences in order to retrieve it. Default is 10000.
+    processes, chunksize :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
@@ -35,9 +153,18 @@ def _collect_entities(raw_corpus, freq_min=2, freq_max=10000):
     True
     """
 
+    # counts do not depend on document order, so take results as they come
+    return _count_entities(map_documents(_noun_phrases, raw_corpus, processes=processes,
+                                         chunksize=chunksize, ordered=False),
+                           freq_min=freq_min, freq_max=freq_max)
+
+
+def _count_entities(document_phrases, freq_min=2, freq_max=10000):
+    """Return the noun phrases occurring between freq_min and freq_max times, from an
+    iterable of (doc_id, list of noun phrases)"""
     np_counts_total = {}
     docs_examined = 0
-    for doc_id, doc_text in raw_corpus:
+    for doc_id, noun_phrases in document_phrases:
         if docs_examined > 0 and docs_examined % 1000 == 0:
             sorted_phrases = sorted(np_counts_total.items(),
                                     key=lambda item: -item[1])
@@ -45,7 +172,7 @@ def _collect_entities(raw_corpus, freq_min=2, freq_max=10000):
             logging.info("at document #%i, considering %i phrases: %s..." %
                          (docs_examined, len(np_counts_total), sorted_phrases[0]))
 
-        for np in TextBlob(doc_text).noun_phrases:
+        for np in noun_phrases:
             np_counts_total[np] = np_counts_total.get(np, 0) + 1
         docs_examined += 1
 
@@ -83,8 +210,14 @@ def _tokenize_entities_document(text, entities, min_length=1, stopwords=None):
     ...     u'frank', u'swank_tank', u'prancercise', u'sassy_unicorns']
     True
     '''
+    return _filter_entities(_noun_phrases(text), entities, min_length=min_length,
+                            stopwords=stopwords)
+
+
+def _filter_entities(noun_phrases, entities, min_length=1, stopwords=None):
+    """Tokens for the noun phrases of a document that are in entities"""
     result = []
-    for np in TextBlob(text).noun_phrases:
+    for np in noun_phrases:
         if np in entities:
             # filter out stop words
             tmp = "_".join(_simple_document(np, min_length=min_length, stopwords=stopwords))
@@ -119,8 +252,15 @@ def _tokenize_mixed_document(text, entities, min_length=1, stopwords=None):
     ... u'pastime', u'sassy_unicorns']
     True
     """
+    return _filter_mixed(_noun_phrases(text), entities, min_length=min_length,
+                         stopwords=stopwords)
+
+
+def _filter_mixed(noun_phrases, entities, min_length=1, stopwords=None):
+    """Tokens for the noun phrases of a document: phrases in entities are kept
+    whole, others are broken into words"""
     result = []
-    for np in TextBlob(text).noun_phrases:
+    for np in noun_phrases:
         if ' ' in np and np not in entities:
             # break apart the noun phrase; it does not occur often enough in the collection of text to be considered.
             result.extend(_simple_document(np, min_length=min_length, stopwords=stopwords))
@@ -134,7 +274,8 @@ def _tokenize_mixed_document(text, entities, min_length=1, stopwords=None):
 
 
 @register
-def entities(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
+def entities(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None,
+             phrase_cache=None, processes=1, chunksize=500, ordered=True):
     """
     A tokenizer that extracts noun phrases from a corpus, then tokenizes all
     documents using those extracted phrases.
@@ -151,6 +292,13 @@ def entities(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
         Maximum occurrence of phrase, beyond which it is ignored
     stopwords : None or iterable of str
         Collection of words to ignore as tokens
+    phrase_cache : None or str
+        File to keep each document's noun phrases in.  If it already exists and was
+        made from the same documents (ids and texts), the phrases in it are used
+        instead of being extracted again; if it was made from other documents,
+        ValueError is raised.  If None, a temporary file is used.
+    processes, chunksize, ordered :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
@@ -159,16 +307,17 @@ def entities(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
     ...     [u'frank', u'swank_tank', u'prancercise', u'sassy_unicorns'])
     True
     """
-    # Tee in case it is a generator (else it will get exhausted).
-    corpus_iterator = itertools.tee(corpus, 2)
-    entities = _collect_entities(corpus_iterator[0], freq_min=freq_min, freq_max=freq_max)
-    for doc_id, doc_text in corpus_iterator[1]:
-        yield doc_id, _tokenize_entities_document(doc_text, entities, min_length=min_length,
-                                       stopwords=stopwords)
+    with _NounPhraseCache(phrase_cache) as cache:
+        _fill_cache(cache, corpus, processes=processes, chunksize=chunksize, ordered=ordered)
+        entities = _count_entities(cache, freq_min=freq_min, freq_max=freq_max)
+        for doc_id, noun_phrases in cache:
+            yield doc_id, _filter_entities(noun_phrases, entities, min_length=min_length,
+                                           stopwords=stopwords)
 
 
 @register
-def mixed(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
+def mixed(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None,
+          phrase_cache=None, processes=1, chunksize=500, ordered=True):
     """A text tokenizer that retrieves entities ('noun phrases') first and simple words for the rest of the text.
 
     Parameters
@@ -183,6 +332,13 @@ def mixed(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
         Maximum occurrence of phrase, beyond which it is ignored
     stopwords : None or iterable of str
         Collection of words to ignore as tokens
+    phrase_cache : None or str
+        File to keep each document's noun phrases in.  If it already exists and was
+        made from the same documents (ids and texts), the phrases in it are used
+        instead of being extracted again; if it was made from other documents,
+        ValueError is raised.  If None, a temporary file is used.
+    processes, chunksize, ordered :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
@@ -191,9 +347,9 @@ def mixed(corpus, min_length=1, freq_min=2, freq_max=10000, stopwords=None):
     ...     [u'frank', u'swank_tank', u'prancercise', u'sassy_unicorns'])
     True
     """
-    corpus_iterators = itertools.tee(corpus, 2)
-    entities = _collect_entities(corpus_iterators[0], freq_min=freq_min, freq_max=freq_max)
-    for doc_id, doc_text in corpus_iterators[1]:
-        yield doc_id, _tokenize_mixed_document(doc_text, entities,
-                                                min_length=min_length,
-                                                stopwords=stopwords)
+    with _NounPhraseCache(phrase_cache) as cache:
+        _fill_cache(cache, corpus, processes=processes, chunksize=chunksize, ordered=ordered)
+        entities = _count_entities(cache, freq_min=freq_min, freq_max=freq_max)
+        for doc_id, noun_phrases in cache:
+            yield doc_id, _filter_mixed(noun_phrases, entities, min_length=min_length,
+                                        stopwords=stopwords)
@@ -1,10 +1,12 @@
+from collections import defaultdict
 import itertools
-import re
 import logging
 
-from topik.tokenizers.simple import _simple_document
+from topik.tokenizers.simple import _simple_document, SimpleTokenizer
 from topik.tokenizers._registry import register
+from topik.tokenizers._parallel import map_documents
 from nltk.collocations import BigramCollocationFinder, TrigramCollocationFinder, QuadgramCollocationFinder
+from nltk.probability import FreqDist
 from nltk.metrics.association import BigramAssocMeasures, TrigramAssocMeasures, QuadgramAssocMeasures
 
 # sample_corpus for doctests
@@ -19,10 +21,12 @@ sample_corpus = [
                          u"celebrities as Frank The Swank-Tank."))]
 
 # TODO: replace min_freqs with freq_bounds like ngrams takes.  Unify format across the board.
-def _collect_ngrams(raw_corpus, top_n=10000, min_length=1, min_freqs=None, stopwords=None):
+def _collect_ngrams(raw_corpus, top_n=10000, min_length=1, min_freqs=None, stopwords=None,
+                    max_ngrams=None, processes=1, chunksize=500):
     """collects bigrams and trigrams from collection of documents.  Input to collocation tokenizer.
 
     bigrams are pairs of words that recur in the collection; trigrams/quadgrams are triplets/quadruplets.
+    Returns lists of bigrams, trigrams and quadgrams (as tuples of words), best scoring first.
 
     Parameters
     ----------
@@ -37,47 +41,235 @@ def _collect_ngrams(raw_corpus, top_n=10000, min_length=1, min_freqs=None, stopw
         starting with bigrams.
     stopwords : None or iterable of str
         Collection of words to ignore as tokens
+    max_ngrams : None or int
+        If given, prune rare n-grams while counting to keep at most about this many
+        of each kind in memory.  See :class:`_NgramCounter`.
+    processes, chunksize :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
     >>> patterns = _collect_ngrams(sample_corpus, min_freqs=[2, 2, 2])
-    >>> patterns[0].pattern
-    u'(frank swank|swank tank|sassy unicorns)'
-    >>> patterns[1].pattern
-    u'(frank swank tank)'
+    >>> patterns[0] == [(u'frank', u'swank'), (u'swank', u'tank'), (u'sassy', u'unicorns')]
+    True
+    >>> patterns[1] == [(u'frank', u'swank', u'tank')]
+    True
+    """
+
+    # generator of documents, turn each element to its list of words.  Order matters here:
+    #    words are chained across document boundaries.
+    doc_texts = (words for doc_id, words in map_documents(
+        SimpleTokenizer(min_length=min_length, stopwords=stopwords), raw_corpus,
+        processes=processes, chunksize=chunksize, ordered=True))
+
+    counter = _NgramCounter(max_ngrams=max_ngrams)
+    for words in doc_texts:
+        counter.update(words)
+    bigram_finder, trigram_finder, quadgram_finder = counter.finders(min_freqs)
+
+    return (bigram_finder.nbest(BigramAssocMeasures.pmi, top_n),
+            trigram_finder.nbest(TrigramAssocMeasures.chi_sq, top_n),
+            quadgram_finder.nbest(QuadgramAssocMeasures.chi_sq, top_n))
+
+
+# bits per word id in an integer-encoded n-gram key
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def _decode(key, n):
+    """Split an integer-encoded n-gram key back into its n word ids"""
+    ids = [0] * n
+    for position in range(n - 1, -1, -1):
+        ids[position] = key & _ID_MASK
+        key >>= _ID_BITS
+    return ids
+
+
+class _NgramCounter(object):
+    """Counts 1- to 4-grams of a word stream in a single sliding-window pass.
+
+    Words are given integer ids, and each n-gram is counted under one integer
+    key packing its word ids, rather than a tuple of strings.  Besides contiguous
+    n-grams, this counts the gapped n-grams that NLTK's trigram and quadgram
+    association measures need (w1 _ w3, w1 _ _ w4, w1 w2 _ w4, w1 _ w3 w4), so that
+    :meth:`finders` can build the same collocation finders as their from_words
+    constructors, which would each read the words again.  Counting continues across
+    calls to update, as if the words were one sequence.
+
+    If max_ngrams is given, any table of n-grams (n > 1) that grows beyond that many
+    entries is pruned while counting: entries seen at most once are dropped, then
+    at most twice the next time, and so on.  This bounds memory, at the cost of
+    undercounting n-grams that become frequent only late in the corpus.
+
+    Examples
+    --------
+    >>> counter = _NgramCounter()
+    >>> counter.update(["sassy", "unicorns", "and", "sassy", "unicorns"])
+    >>> bigram_finder, trigram_finder, quadgram_finder = counter.finders([2, 1, 1])
+    >>> sorted(bigram_finder.ngram_fd.items())
+    [(('sassy', 'unicorns'), 2)]
+    >>> len(trigram_finder.ngram_fd), bigram_finder.N
+    (3, 5)
     """
+    _TABLES = ("ii", "iii", "iiii", "ixi", "ixxi", "iixi", "ixii")
+    # how many words to count between checks of table sizes for pruning
+    _PRUNE_INTERVAL = 10000
+
+    def __init__(self, max_ngrams=None):
+        self.max_ngrams = max_ngrams
+        self._ids = {}
+        self._words = []
+        self._word_counts = []
+        self._tables = {name: defaultdict(int) for name in self._TABLES}
+        self._prune_below = {name: 1 for name in self._TABLES}
+        # ids of the last three words seen, most recent first
+        self._previous = (None, None, None)
+
+    def update(self, words):
+        ids, vocab, word_counts = self._ids, self._words, self._word_counts
+        ii, iii, iiii = self._tables["ii"], self._tables["iii"], self._tables["iiii"]
+        ixi, ixxi = self._tables["ixi"], self._tables["ixxi"]
+        iixi, ixii = self._tables["iixi"], self._tables["ixii"]
+        bits, bits2, bits3 = _ID_BITS, 2 * _ID_BITS, 3 * _ID_BITS
+        w3, w2, w1 = self._previous
+        since_prune = 0
+        for word in words:
+            # the current word is the last word of every n-gram counted here
+            w = ids.get(word)
+            if w is None:
+                w = ids[word] = len(vocab)
+                vocab.append(word)
+                word_counts.append(0)
+            word_counts[w] += 1
+            if w1 is not None:
+                pair = w1 << bits | w
+                ii[pair] += 1
+                if w2 is not None:
+                    ixi[w2 << bits | w] += 1
+                    iii[w2 << bits2 | pair] += 1
+                    if w3 is not None:
+                        iiii[w3 << bits3 | w2 << bits2 | pair] += 1
+                        ixxi[w3 << bits | w] += 1
+                        iixi[w3 << bits2 | w2 << bits | w] += 1
+                        ixii[w3 << bits2 | pair] += 1
+            w3, w2, w1 = w2, w1, w
+            if self.max_ngrams is not None:
+                since_prune += 1
+                if since_prune >= self._PRUNE_INTERVAL:
+                    self._prune()
+                    since_prune = 0
+        self._previous = (w3, w2, w1)
+        if self.max_ngrams is not None:
+            self._prune()
+
+    def _prune(self):
+        for name, table in self._tables.items():
+            if len(table) > self.max_ngrams:
+                threshold = self._prune_below[name]
+                for key in [key for key, count in table.items() if count <= threshold]:
+                    del table[key]
+                self._prune_below[name] = threshold + 1
+
+    def _freq_dist(self, name, n, keys):
+        table, words = self._tables[name], self._words
+        return FreqDist({tuple(words[term_id] for term_id in _decode(key, n)): table[key]
+                         for key in keys})
+
+    def finders(self, min_freqs):
+        """Build NLTK bigram, trigram and quadgram collocation finders from the counts.
+
+        Only n-grams occurring at least min_freqs[0] (bigrams), min_freqs[1]
+        (trigrams) and min_freqs[2] (quadgrams) times are candidates, as with
+        apply_freq_filter.  Only the counts needed to score the candidates are
+        decoded back into words.
+        """
+        bits = _ID_BITS
+        word_fd = FreqDist(dict(zip(self._words, self._word_counts)))
+        tables = self._tables
 
-    # generator of documents, turn each element to its list of words
-    doc_texts = (_simple_document(doc_text, min_length=min_length, stopwords=stopwords)
-                 for doc_id, doc_text in raw_corpus)
+        bigrams = [key for key, count in tables["ii"].items() if count >= min_freqs[0]]
+        bigram_finder = BigramCollocationFinder(word_fd, self._freq_dist("ii", 2, bigrams))
 
-    # generator, concatenate (chain) all words into a single sequence, lazily
-    words = itertools.chain.from_iterable(doc_texts)
+        trigrams = [key for key, count in tables["iii"].items() if count >= min_freqs[1]]
+        pairs, gapped = set(), set()
+        for key in trigrams:
+            a, b, c = _decode(key, 3)
+            pairs.update((a << bits | b, b << bits | c))
+            gapped.add(a << bits | c)
+        trigram_finder = TrigramCollocationFinder(word_fd, self._freq_dist("ii", 2, pairs),
+                                                  self._freq_dist("ixi", 2, gapped),
+                                                  self._freq_dist("iii", 3, trigrams))
 
-    words_iterators = itertools.tee(words, 3)
-    bigrams_patterns = _get_bigrams(words_iterators[0], top_n, min_freqs[0])
-    trigrams_patterns = _get_trigrams(words_iterators[1], top_n, min_freqs[1])
-    quadgrams_patterns = _get_quadgrams(words_iterators[2], top_n, min_freqs[2])
+        quadgrams = [key for key, count in tables["iiii"].items() if count >= min_freqs[2]]
+        needed = {name: set() for name in self._TABLES}
+        for key in quadgrams:
+            a, b, c, d = _decode(key, 4)
+            needed["iii"].update(((a << bits | b) << bits | c, (b << bits | c) << bits | d))
+            needed["ii"].update((a << bits | b, b << bits | c, c << bits | d))
+            needed["ixi"].update((a << bits | c, b << bits | d))
+            needed["ixxi"].add(a << bits | d)
+            needed["iixi"].add((a << bits | b) << bits | d)
+            needed["ixii"].add((a << bits | c) << bits | d)
+        quadgram_finder = QuadgramCollocationFinder(
+            word_fd, self._freq_dist("iiii", 4, quadgrams),
+            self._freq_dist("ii", 2, needed["ii"]), self._freq_dist("iii", 3, needed["iii"]),
+            self._freq_dist("ixi", 2, needed["ixi"]), self._freq_dist("ixxi", 2, needed["ixxi"]),
+            self._freq_dist("iixi", 3, needed["iixi"]), self._freq_dist("ixii", 3, needed["ixii"]))
+        return bigram_finder, trigram_finder, quadgram_finder
 
-    return (bigrams_patterns, trigrams_patterns, quadgrams_patterns)
 
-def _get_bigrams(words, top_n, min_freq):
-    bcf = BigramCollocationFinder.from_words(iter(words))
-    bcf.apply_freq_filter(min_freq)
-    bigrams = [' '.join(w) for w in bcf.nbest(BigramAssocMeasures.pmi, top_n)]
-    return re.compile('(%s)' % '|'.join(bigrams), re.UNICODE)
+# marks the end of a phrase in a _PhraseMatcher trie.  Tokens are never None.
+_PHRASE_END = None
+
+
+class _PhraseMatcher(object):
+    """Merges known phrases in a list of tokens, in one left-to-right scan.
+
+    Phrases are stored in a trie keyed by token, so each position costs a few dict
+    lookups however many phrases there are.  At each position the longest phrase
+    starting there is merged (joined with "_"), and the scan continues after it.
+
+    Examples
+    --------
+    >>> matcher = _PhraseMatcher([("sassy", "unicorns"), ("frank", "swank"),
+    ...                           ("frank", "swank", "tank")])
+    >>> matcher.merge(["frank", "swank", "tank", "sassy", "unicorns", "sassy"])
+    ['frank_swank_tank', 'sassy_unicorns', 'sassy']
+    """
+    def __init__(self, phrases=()):
+        self._root = {}
+        for phrase in phrases:
+            self.add(phrase)
 
-def _get_trigrams(words, top_n, min_freq):
-    tcf = TrigramCollocationFinder.from_words(iter(words))
-    tcf.apply_freq_filter(min_freq)
-    trigrams = [' '.join(w) for w in tcf.nbest(TrigramAssocMeasures.chi_sq, top_n)]
-    return re.compile('(%s)' % '|'.join(trigrams), re.UNICODE)
+    def add(self, phrase):
+        node = self._root
+        for token in phrase:
+            node = node.setdefault(token, {})
+        node[_PHRASE_END] = True
 
-def _get_quadgrams(words, top_n, min_freq):
-    qcf = QuadgramCollocationFinder.from_words(iter(words))
-    qcf.apply_freq_filter(min_freq)
-    quadgrams = [' '.join(w) for w in qcf.nbest(QuadgramAssocMeasures.chi_sq, top_n)]
-    return re.compile('(%s)' % '|'.join(quadgrams), re.UNICODE)
+    def merge(self, tokens):
+        root = self._root
+        ntokens = len(tokens)
+        result = []
+        position = 0
+        while position < ntokens:
+            node = root
+            end = position + 1
+            scan = position
+            while scan < ntokens:
+                node = node.get(tokens[scan])
+                if node is None:
+                    break
+                scan += 1
+                if _PHRASE_END in node:
+                    end = scan
+            if end - position > 1:
+                result.append("_".join(tokens[position:end]))
+            else:
+                result.append(tokens[position])
+            position = end
+        return result
 
 
 def _collocation_document(text, patterns, min_length=1, stopwords=None):
@@ -97,8 +289,9 @@ def _collocation_document(text, patterns, min_length=1, stopwords=None):
     ----------
     text : str
         A single document's text to be tokenized
-    patterns: tuple of compiled regex object to find n-grams
-        Obtained from collect_ngrams function
+    patterns: _PhraseMatcher, or tuple of lists of n-grams (as tuples of words)
+        Obtained from collect_ngrams function.  When tokenizing many documents,
+        build a _PhraseMatcher from them once.
     min_length : int
         Minimum length of any single word
     stopwords : None or iterable of str
@@ -110,18 +303,18 @@ def _collocation_document(text, patterns, min_length=1, stopwords=None):
     >>> text = sample_corpus[0][1]
     >>> tokenized_text = _collocation_document(text,patterns)
     >>> tokenized_text == [
-    ...     u'frank_swank', u'tank', u'walked', u'sassy', u'unicorn', u'brony',
+    ...     u'frank_swank_tank', u'walked', u'sassy', u'unicorn', u'brony',
     ...     u'prancercise', u'class', u'daily', u'prancercise', u'tremendously',
     ...     u'popular', u'pastime', u'sassy_unicorns', u'retirees', u'alike']
     True
     """
-    text = ' '.join(_simple_document(text, min_length=min_length, stopwords=stopwords))
-    for pattern in patterns:
-        text = re.sub(pattern, lambda match: match.group(0).replace(' ', '_'), text)
-    return text.split()
+    if not isinstance(patterns, _PhraseMatcher):
+        patterns = _PhraseMatcher(itertools.chain.from_iterable(patterns))
+    return patterns.merge(_simple_document(text, min_length=min_length, stopwords=stopwords))
 
 @register
-def ngrams(raw_corpus, min_length=1, freq_bounds=None, top_n=10000, stopwords=None):
+def ngrams(raw_corpus, min_length=1, freq_bounds=None, top_n=10000, stopwords=None,
+           max_ngrams=None, processes=1, chunksize=500, ordered=True):
     '''
     A tokenizer that extracts collocations (bigrams and trigrams) from a corpus
     according to the frequency bounds, then tokenizes all documents using those
@@ -141,12 +334,17 @@ def ngrams(raw_corpus, min_length=1, freq_bounds=None, top_n=10000, stopwords=No
         limit results to this many entries
     stopwords: None or iterable of str
         Collection of words to ignore as tokens
+    max_ngrams : None or int
+        If given, prune rare n-grams while collecting them, to bound memory use on
+        large corpora.  See :class:`_NgramCounter`.
+    processes, chunksize, ordered :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
     >>> tokenized_corpora = ngrams(sample_corpus, freq_bounds=[(2, 100), (2, 100), (2, 100)])
     >>> next(tokenized_corpora) == ('doc1',
-    ...     [u'frank_swank', u'tank', u'walked', u'sassy', u'unicorn', u'brony',
+    ...     [u'frank_swank_tank', u'walked', u'sassy', u'unicorn', u'brony',
     ...     u'prancercise', u'class', u'daily', u'prancercise', u'tremendously',
     ...     u'popular', u'pastime', u'sassy_unicorns', u'retirees', u'alike'])
     True
@@ -158,7 +356,11 @@ def ngrams(raw_corpus, min_length=1, freq_bounds=None, top_n=10000, stopwords=No
     logging.debug("Collecting (bi/tri/quad)grams from corpus")
     corpus_iterators = itertools.tee(raw_corpus, 2)
     patterns = _collect_ngrams(corpus_iterators[0], top_n=top_n, min_length=min_length, min_freqs=min_freqs,
-                               stopwords=stopwords)
+                               stopwords=stopwords, max_ngrams=max_ngrams, processes=processes,
+                               chunksize=chunksize)
+    patterns = _PhraseMatcher(itertools.chain.from_iterable(patterns))
     logging.debug("Determining collocation on corpus")
-    for doc_id, doc_text in corpus_iterators[1]:
-        yield doc_id, _collocation_document(doc_text, patterns, min_length=min_length, stopwords=stopwords)
+    for doc_id, tokens in map_documents(_collocation_document, corpus_iterators[1],
+                                        processes=processes, chunksize=chunksize, ordered=ordered,
+                                        patterns=patterns, min_length=min_length, stopwords=stopwords):
+        yield doc_id, tokens
@@ -1,13 +1,78 @@
-import gensim
 import logging
+import re
+
+from gensim.utils import to_unicode
+
 # imports used only for doctests
 from topik.tokenizers._registry import register
+from topik.tokenizers._parallel import map_documents
+
+
+# same words as gensim.utils.PAT_ALPHABETIC (runs of letters, no digits), without
+#    capturing groups so that findall returns the words themselves
+_WORD_PATTERN = re.compile(r'(?:(?!\d)\w)+', re.UNICODE)
+
+
+class SimpleTokenizer(object):
+    """Lowercases text, matches alphabetic words and drops stopwords and short words.
+
+    Stopwords are converted to a frozenset once, when the tokenizer is built, so
+    that each membership test is a hash lookup even when they are given as a list.
+    Calling the tokenizer on a document's text returns its list of words.
+
+    Parameters
+    ----------
+    min_length : int
+        Minimum length of any single word
+    stopwords: None or iterable of str
+        Collection of words to ignore as tokens.  Defaults to gensim's STOPWORDS.
+
+    Examples
+    --------
+    >>> tokenizer = SimpleTokenizer(stopwords=["the", "frank"])
+    >>> tokenizer("Frank the DOG and 2 cats") == ["dog", "and", "cats"]
+    True
+    """
+    def __init__(self, min_length=1, stopwords=None):
+        if not stopwords:
+            from gensim.parsing.preprocessing import STOPWORDS as stopwords
+        self.min_length = min_length
+        self.stopwords = stopwords if isinstance(stopwords, frozenset) else frozenset(stopwords)
+
+    def __call__(self, text):
+        stopwords = self.stopwords
+        words = _WORD_PATTERN.findall(to_unicode(text).lower())
+        if self.min_length > 1:
+            min_length = self.min_length
+            return [word for word in words if len(word) >= min_length and word not in stopwords]
+        return [word for word in words if word not in stopwords]
+
+
+# the last tokenizer built by _simple_document, with the arguments it was built from
+_cached_tokenizer = (None, None, None)
+
+
+def _get_tokenizer(min_length=1, stopwords=None):
+    """Return a SimpleTokenizer for these arguments, reusing the last one built if the
+    arguments are the same.  Stopwords are compared by their contents, so a list that
+    was changed since the last call gets a new tokenizer."""
+    global _cached_tokenizer
+    if stopwords and not isinstance(stopwords, frozenset):
+        stopwords = frozenset(stopwords)
+    cached_min_length, cached_stopwords, tokenizer = _cached_tokenizer
+    if tokenizer is None or cached_min_length != min_length or cached_stopwords != stopwords:
+        tokenizer = SimpleTokenizer(min_length=min_length, stopwords=stopwords)
+        _cached_tokenizer = (min_length, stopwords, tokenizer)
+    return tokenizer
 
 
 def _simple_document(text, min_length=1, stopwords=None):
     """A text tokenizer that simply lowercases, matches alphabetic
     characters and removes stopwords.  For use on individual text documents.
 
+    Reuses the :class:`SimpleTokenizer` from the previous call when called again with
+    the same arguments.
+
     Parameters
     ----------
     text : str
@@ -24,15 +89,11 @@ def _simple_document(text, min_length=1, stopwords=None):
     >>> tokenized_text == ["frank", "frank", "frank", "dog", "cat"]
     True
     """
-    if not stopwords:
-        from gensim.parsing.preprocessing import STOPWORDS as stopwords
-    #logging.debug("Tokenizing text: {}".format(text))
-    return [word for word in gensim.utils.tokenize(text, lower=True)
-            if word not in stopwords and len(word) >= min_length]
+    return _get_tokenizer(min_length=min_length, stopwords=stopwords)(text)
 
 
 @register
-def simple(raw_corpus, min_length=1, stopwords=None):
+def simple(raw_corpus, min_length=1, stopwords=None, processes=1, chunksize=500, ordered=True):
     """A text tokenizer that simply lowercases, matches alphabetic
     characters and removes stopwords.
 
@@ -44,6 +105,8 @@ def simple(raw_corpus, min_length=1, stopwords=None):
         Minimum length of any single word
     stopwords: None or iterable of str
         Collection of words to ignore as tokens
+    processes, chunksize, ordered :
+        parallel execution options; see :func:`~topik.tokenizers._parallel.map_documents`
 
     Examples
     --------
@@ -54,6 +117,5 @@ def simple(raw_corpus, min_length=1, stopwords=None):
     ... ["frank", "frank", "frank", "dog", "cat"])
     True
     """
-    for doc_id, doc_text in raw_corpus:
-        # logging.debug("Tokenizing doc_id: {}".format(doc_id))
-        yield(doc_id, _simple_document(doc_text, min_length=min_length, stopwords=stopwords))
\ No newline at end of file
+    return map_documents(SimpleTokenizer(min_length=min_length, stopwords=stopwords),
+                         raw_corpus, processes=processes, chunksize=chunksize, ordered=ordered)
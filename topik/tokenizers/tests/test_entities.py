@@ -1,3 +1,8 @@
+import os
+import tempfile
+
+import nose.tools as nt
+
 from topik.tokenizers.entities import _collect_entities, \
     _tokenize_entities_document, _tokenize_mixed_document, \
     entities, mixed
@@ -50,3 +55,23 @@ def test_mixed():
     assert(next(tokenized_corpora) == \
            ('doc2', [u'prancercise', u'sassy_unicorns', u'frank',
                      u'swank_tank']))
+
+def test_phrase_cache():
+    fd, cache_file = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(cache_file)
+    try:
+        expected = list(entities(sample_data))
+        assert(list(entities(sample_data, phrase_cache=cache_file)) == expected)
+        assert(os.path.exists(cache_file))
+        # the cached phrases stand in for extraction from the same documents
+        assert(list(entities(sample_data, phrase_cache=cache_file)) == expected)
+        assert(list(mixed(sample_data, phrase_cache=cache_file)) == list(mixed(sample_data)))
+        # but are not reused for other documents
+        with nt.assert_raises(ValueError):
+            list(entities(sample_data[:1], phrase_cache=cache_file))
+    finally:
+        os.remove(cache_file)
+
+def test_entities_processes():
+    assert(list(entities(sample_data, processes=2, chunksize=1)) == list(entities(sample_data)))
@@ -1,5 +1,11 @@
+import itertools
+
+from nltk.collocations import TrigramCollocationFinder, QuadgramCollocationFinder
+from nltk.metrics.association import TrigramAssocMeasures, QuadgramAssocMeasures
+
 from topik.tokenizers.ngrams import _collect_ngrams, \
-    _collocation_document, ngrams
+    _collocation_document, ngrams, _NgramCounter, _PhraseMatcher
+from topik.tokenizers.simple import _simple_document
 from nose.tools import nottest
 sample_data = [
         ("doc1", str(u"Frank the Swank-Tank walked his sassy unicorn, Brony,"
@@ -27,22 +33,24 @@ def generator():
 
 def test__collect_ngrams():
     result_ngrams = _collect_ngrams(sample_data, min_freqs=[2, 2, 2])
-    assert(result_ngrams[0].pattern ==
-           u'(big daddy|daddy workout|frank swank|swank tank|workout queen|sassy unicorn|sassy unicorns)')
-    assert(result_ngrams[1].pattern == u'(big daddy workout|daddy workout queen|frank swank tank)')
-    assert(result_ngrams[2].pattern == u'(big daddy workout queen)')
+    assert([' '.join(ngram) for ngram in result_ngrams[0]] ==
+           [u'big daddy', u'daddy workout', u'frank swank', u'swank tank', u'workout queen',
+            u'sassy unicorn', u'sassy unicorns'])
+    assert([' '.join(ngram) for ngram in result_ngrams[1]] ==
+           [u'big daddy workout', u'daddy workout queen', u'frank swank tank'])
+    assert([' '.join(ngram) for ngram in result_ngrams[2]] == [u'big daddy workout queen'])
 
 
 def test__collocation_document():
     these_ngrams = _collect_ngrams(sample_data, min_freqs=[2, 2, 2])
     assert(_collocation_document(sample_data[0][1],these_ngrams) == [
-        u'frank_swank', u'tank', u'walked', u'sassy_unicorn', u'brony',
+        u'frank_swank_tank', u'walked', u'sassy_unicorn', u'brony',
         u'prancercise', u'class', u'daily', u'prancercise', u'tremendously',
         u'popular', u'pastime', u'sassy_unicorns', u'retirees', u'alike'
     ])
 
     assert(_collocation_document(sample_data[1][1],these_ngrams) == [
-        u'frank_swank', u'tank', u'known', u'big_daddy', u'workout_queen',
+        u'frank_swank_tank', u'known', u'big_daddy_workout_queen',
         u'loved', u'cross', u'dress', u'prancercising', u'dressing',
         u'sassy_unicorn', u'match', u'brony', u'key', u'source', u'enjoyment',
         u'onlooking', u'retirees'])
@@ -54,13 +62,13 @@ def test_ngrams_list():
     assert(len(freq_bounds) == 3)
     assert(next(tokenized_corpora) == (
         'doc1', [
-            u'frank_swank', u'tank', u'walked', u'sassy_unicorn', u'brony',
+            u'frank_swank_tank', u'walked', u'sassy_unicorn', u'brony',
             u'prancercise', u'class', u'daily', u'prancercise', u'tremendously',
             u'popular', u'pastime', u'sassy_unicorns', u'retirees', u'alike'
                  ]))
     assert(next(tokenized_corpora) == (
         'doc2', [
-            u'frank_swank', u'tank', u'known', u'big_daddy', u'workout_queen',
+            u'frank_swank_tank', u'known', u'big_daddy_workout_queen',
             u'loved', u'cross', u'dress', u'prancercising',
             u'dressing', u'sassy_unicorn', u'match', u'brony', u'key', u'source',
             u'enjoyment', u'onlooking', u'retirees']))
@@ -73,13 +81,45 @@ def test_ngrams_generator():
     assert(len(freq_bounds) == 3)
     assert(next(tokenized_corpora) == (
         'doc1', [
-            u'frank_swank', u'tank', u'walked', u'sassy_unicorn', u'brony',
+            u'frank_swank_tank', u'walked', u'sassy_unicorn', u'brony',
             u'prancercise', u'class', u'daily', u'prancercise', u'tremendously',
             u'popular', u'pastime', u'sassy_unicorns', u'retirees', u'alike'
                  ]))
     assert(next(tokenized_corpora) == (
         'doc2', [
-            u'frank_swank', u'tank', u'known', u'big_daddy', u'workout_queen',
+            u'frank_swank_tank', u'known', u'big_daddy_workout_queen',
             u'loved', u'cross', u'dress', u'prancercising',
             u'dressing', u'sassy_unicorn', u'match', u'brony', u'key', u'source',
-            u'enjoyment', u'onlooking', u'retirees']))
\ No newline at end of file
+            u'enjoyment', u'onlooking', u'retirees']))
+
+def test__phrase_matcher():
+    matcher = _PhraseMatcher([(u'big', u'daddy'), (u'daddy', u'workout'),
+                              (u'big', u'daddy', u'workout', u'queen')])
+    # the longest phrase wins; partial matches of longer phrases fall back to shorter ones
+    assert(matcher.merge([u'big', u'daddy', u'workout', u'queen', u'big', u'daddy', u'workout']) ==
+           [u'big_daddy_workout_queen', u'big_daddy', u'workout'])
+    # whole tokens only
+    assert(matcher.merge([u'bigg', u'daddy', u'big']) == [u'bigg', u'daddy', u'big'])
+    assert(matcher.merge([]) == [])
+
+
+def test__ngram_counter_matches_nltk():
+    words = list(itertools.chain.from_iterable(_simple_document(text) for doc_id, text in sample_data))
+    counter = _NgramCounter()
+    # counting continues across updates, as across documents
+    counter.update(words[:20])
+    counter.update(words[20:])
+    bigram_finder, trigram_finder, quadgram_finder = counter.finders([1, 1, 1])
+    assert(trigram_finder.score_ngrams(TrigramAssocMeasures.chi_sq) ==
+           TrigramCollocationFinder.from_words(words).score_ngrams(TrigramAssocMeasures.chi_sq))
+    assert(quadgram_finder.score_ngrams(QuadgramAssocMeasures.chi_sq) ==
+           QuadgramCollocationFinder.from_words(words).score_ngrams(QuadgramAssocMeasures.chi_sq))
+
+
+def test__ngram_counter_pruning():
+    counter = _NgramCounter(max_ngrams=2)
+    counter.update(["sassy", "unicorn", "frank", "swank", "sassy", "unicorn"])
+    bigram_finder, trigram_finder, quadgram_finder = counter.finders([1, 1, 1])
+    assert(dict(bigram_finder.ngram_fd) == {("sassy", "unicorn"): 2})
+    # unigrams are never pruned
+    assert(bigram_finder.N == 6)
@@ -0,0 +1,36 @@
+from topik.tokenizers._parallel import map_documents
+from topik.tokenizers.simple import simple, _simple_document
+from topik.tokenizers.ngrams import ngrams
+
+sample_data = [("doc{}".format(number), text) for number, text in enumerate([
+    "frank FRANK the frank dog cat",
+    "frank a dog of the llama",
+    "Frank the Swank-Tank walked his sassy unicorn",
+    "sassy unicorns and retirees alike",
+    "Frank the Swank-Tank and his sassy unicorn"] * 3)]
+
+
+def test_map_documents_ordered():
+    expected = [(doc_id, _simple_document(text)) for doc_id, text in sample_data]
+    assert(list(map_documents(_simple_document, sample_data, processes=3, chunksize=2)) == expected)
+
+
+def test_map_documents_unordered():
+    results = map_documents(_simple_document, sample_data, processes=3, chunksize=2, ordered=False)
+    assert(sorted(results) == sorted((doc_id, _simple_document(text)) for doc_id, text in sample_data))
+
+
+def test_map_documents_kwargs():
+    results = map_documents(_simple_document, iter(sample_data[:2]), processes=2,
+                            min_length=4, stopwords={"frank"})
+    assert(list(results) == [("doc0", []), ("doc1", ["llama"])])
+
+
+def test_simple_processes():
+    assert(list(simple(sample_data, processes=2, chunksize=4)) == list(simple(sample_data)))
+
+
+def test_ngrams_processes():
+    freq_bounds = [(2, 100), (2, 100), (2, 100)]
+    assert(list(ngrams(sample_data, freq_bounds=freq_bounds, processes=2, chunksize=3)) ==
+           list(ngrams(sample_data, freq_bounds=freq_bounds)))
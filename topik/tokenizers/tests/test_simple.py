@@ -1,4 +1,4 @@
-from topik.tokenizers.simple import simple, _simple_document
+from topik.tokenizers.simple import simple, _simple_document, _get_tokenizer, SimpleTokenizer
 
 sample_data = [("doc1", "frank FRANK the frank dog cat"),
                 ("doc2", "frank a dog of the llama"),
@@ -11,4 +11,26 @@ def test__simple_document():
 def test_simple():
     tokenized_corpora = simple(sample_data)
     assert(next(tokenized_corpora) == ("doc1", ["frank", "frank", "frank", "dog", "cat"]))
-    assert(next(tokenized_corpora) == ("doc2", ["frank", "dog", "llama"]))
\ No newline at end of file
+    assert(next(tokenized_corpora) == ("doc2", ["frank", "dog", "llama"]))
+
+def test_simple_tokenizer():
+    tokenizer = SimpleTokenizer(min_length=4, stopwords=["frank", "llama"])
+    assert(isinstance(tokenizer.stopwords, frozenset))
+    assert(tokenizer(u"Frank the llama ate 12 apples, 3rd time") == [u"apples", u"time"])
+    # defaults to gensim's STOPWORDS, like _simple_document always has
+    assert(SimpleTokenizer()(sample_data[1][1]) == _simple_document(sample_data[1][1]))
+
+
+def test__simple_document_reuses_tokenizer():
+    stopwords = ["frank"]
+    _simple_document(sample_data[0][1], stopwords=stopwords)
+    tokenizer = _get_tokenizer(stopwords=stopwords)
+    assert(_get_tokenizer(stopwords=stopwords) is tokenizer)
+    assert(_simple_document(sample_data[0][1], stopwords=stopwords) == ["the", "dog", "cat"])
+
+
+def test__simple_document_sees_changed_stopwords():
+    stopwords = ["the"]
+    assert(_simple_document("the cat sat", stopwords=stopwords) == ["cat", "sat"])
+    stopwords.append("cat")
+    assert(_simple_document("the cat sat", stopwords=stopwords) == ["sat"])
@@ -1,4 +1,6 @@
 from .bag_of_words import bag_of_words
+from .hashing import hashing, HashingVocabulary
 from .tfidf import tfidf
+from .vocabulary import Vocabulary
 
 from ._registry import registered_vectorizers, register, vectorize
@@ -1,14 +1,22 @@
-from collections import Counter
 from ._registry import register
-from vectorizer_output import VectorizerOutput
+from .vectorizer_output import VectorizerOutput
 
-def _count_words_in_docs(tokenized_corpora, vectorizer_output):
-    doc_counts = {}
-    for id, doc in tokenized_corpora:
-        doc_counts[id] = {vectorizer_output.term_id_map[key]: value
-                          for key, value in Counter(doc).items()}
+def _term_counts(doc_counts, vectorizer_output):
     return doc_counts
 
 @register
-def bag_of_words(tokenized_corpora):
-    return VectorizerOutput(tokenized_corpora, _count_words_in_docs)
\ No newline at end of file
+def bag_of_words(tokenized_corpora, vocabulary=None, min_df=1, max_df=1.0, max_features=None):
+    """Count the occurrences of each term in each document.
+
+    Parameters
+    ----------
+    tokenized_corpora : iterable of tuple of (doc_id, list of str)
+        tokenized documents
+    vocabulary : None or Vocabulary
+        Prebuilt vocabulary to use.  Terms missing from it are ignored.  If None,
+        a new vocabulary is built from the documents.
+    min_df, max_df, max_features :
+        pruning of a newly built vocabulary; see :meth:`~.Vocabulary.prune`
+    """
+    return VectorizerOutput(tokenized_corpora, _term_counts, vocabulary=vocabulary,
+                            min_df=min_df, max_df=max_df, max_features=max_features)
@@ -0,0 +1,155 @@
+import zlib
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from ._registry import register
+from .bag_of_words import _term_counts
+from .vectorizer_output import VectorizerOutput
+from .vocabulary import _encode
+
+
+def _bucket(term, n_features):
+    # crc32 is fast and, unlike hash(), the same in every process and python version
+    return (zlib.crc32(_encode(term)) & 0xffffffff) % n_features
+
+
+class _BucketLabels(Mapping):
+    """Read-only {bucket: label} mapping over every bucket of a HashingVocabulary.
+
+    A bucket is labelled by the terms sampled into it, joined by "|", or by its
+    number if no term was sampled."""
+    def __init__(self, samples, n_features):
+        self._samples = samples
+        self._n_features = n_features
+
+    def __getitem__(self, bucket):
+        if not 0 <= bucket < self._n_features:
+            raise KeyError(bucket)
+        terms = self._samples.get(bucket)
+        return u"|".join(terms) if terms else u"#{}".format(bucket)
+
+    def __iter__(self):
+        return iter(range(self._n_features))
+
+    def __len__(self):
+        return self._n_features
+
+    def __getstate__(self):
+        return {"n_features": self._n_features, "samples": sorted(self._samples.items())}
+
+    def __setstate__(self, state):
+        self.__init__(dict((bucket, terms) for bucket, terms in state["samples"]),
+                      state["n_features"])
+
+
+class HashingVocabulary(object):
+    """Maps terms to a fixed number of buckets by hashing, without a term dictionary.
+
+    Stands in for a :class:`~.Vocabulary` when the vocabulary is unbounded.  Bucket
+    ids can be computed for any term without seeing the corpus first, so memory
+    does not grow with the number of distinct terms.  To keep topics readable, up
+    to terms_per_bucket terms are recorded for each bucket as they are first seen;
+    buckets where several terms collide are labelled with all of their sampled
+    terms.  Set terms_per_bucket to 0 to record nothing.
+
+    Examples
+    --------
+    >>> vocab = HashingVocabulary(n_features=8)
+    >>> vocab.add("frank") == vocab["frank"] < 8
+    True
+    >>> print(vocab.id_term_map[vocab["frank"]])
+    frank
+    """
+    def __init__(self, n_features=2 ** 18, terms_per_bucket=3):
+        if n_features < 1:
+            raise ValueError("n_features must be a positive integer.")
+        self._n_features = n_features
+        self._terms_per_bucket = terms_per_bucket
+        self._samples = {}
+
+    def add(self, term):
+        """Return the bucket of term, sampling term as a label for it"""
+        bucket = _bucket(term, self._n_features)
+        if self._terms_per_bucket:
+            terms = self._samples.get(bucket)
+            if terms is None:
+                self._samples[bucket] = [term]
+            elif len(terms) < self._terms_per_bucket and term not in terms:
+                terms.append(term)
+        return bucket
+
+    # every term has a bucket, so lookups sample labels as well
+    get = add
+
+    def __getitem__(self, term):
+        return _bucket(term, self._n_features)
+
+    def __contains__(self, term):
+        return True
+
+    def __len__(self):
+        return self._n_features
+
+    def __eq__(self, other):
+        # terms land in the same buckets whatever labels have been sampled
+        return isinstance(other, HashingVocabulary) and other.n_features == self._n_features
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def n_features(self):
+        return self._n_features
+
+    @property
+    def id_term_map(self):
+        return _BucketLabels(self._samples, self._n_features)
+
+    @property
+    def term_id_map(self):
+        return self
+
+    @property
+    def collisions(self):
+        """{bucket: sampled terms} for buckets that more than one term hashed into"""
+        return {bucket: list(terms) for bucket, terms in self._samples.items()
+                if len(terms) > 1}
+
+    def __getstate__(self):
+        # list of pairs rather than a dict: json would turn int keys into strings
+        return {"n_features": self._n_features,
+                "terms_per_bucket": self._terms_per_bucket,
+                "samples": sorted([bucket, terms] for bucket, terms in self._samples.items())}
+
+    def __setstate__(self, state):
+        self.__init__(state["n_features"], state["terms_per_bucket"])
+        self._samples = {bucket: list(terms) for bucket, terms in state["samples"]}
+
+
+@register
+def hashing(tokenized_corpus, n_features=2 ** 18, terms_per_bucket=3, vocabulary=None):
+    """Count terms in a fixed number of hashed buckets, in one pass and without
+    holding a vocabulary.
+
+    Suited to streaming or very large corpora.  Distinct terms may share a bucket;
+    the chance of that falls as n_features grows.
+
+    Parameters
+    ----------
+    tokenized_corpus : iterable of tuple of (doc_id, list of str)
+        tokenized documents
+    n_features : int
+        Number of buckets (columns of the output matrix)
+    terms_per_bucket : int
+        Number of terms to record as labels for each bucket.  0 records none.
+    vocabulary : None or HashingVocabulary
+        Existing hashing vocabulary to use (for example, from an earlier output), so
+        that new documents land in the same buckets.  Overrides n_features and
+        terms_per_bucket.
+    """
+    if vocabulary is None:
+        vocabulary = HashingVocabulary(n_features=n_features,
+                                       terms_per_bucket=terms_per_bucket)
+    return VectorizerOutput(tokenized_corpus, _term_counts, vocabulary=vocabulary)
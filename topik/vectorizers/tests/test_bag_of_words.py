@@ -9,5 +9,13 @@ output = bag_of_words(sample_data)
 
 
 def test_vectorizer():
-    assert(output.vectors["doc1"] == {1: 3, 2: 1, 3: 1})
-    assert(output.vectors["doc2"] == {0: 1, 1: 1, 2: 1})
+    assert(output.vectors["doc1"] == {0: 3, 1: 1, 2: 1})
+    assert(output.vectors["doc2"] == {0: 1, 1: 1, 3: 1})
+
+
+def test_vectorizer_generator():
+    # the tokenized corpus is only iterated once, so generators work as well as lists
+    generator_output = bag_of_words(doc for doc in sample_data)
+    assert(generator_output.vectors["doc1"] == output.vectors["doc1"])
+    assert(generator_output.doc_lengths == {"doc1": 5, "doc2": 3})
+    assert(generator_output.term_frequency == {0: 4, 1: 2, 2: 1, 3: 1})
@@ -0,0 +1,50 @@
+import jsonpickle
+
+from topik.vectorizers.hashing import hashing, HashingVocabulary
+
+sample_data = [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
+               ("doc2", ["frank", "dog", "llama"]),
+               ]
+
+output = hashing(sample_data, n_features=64)
+
+
+def test_vectorizer():
+    vocab = output.vocabulary
+    assert(output.matrix.shape == (2, 64))
+    assert(output.vectors["doc1"][vocab["frank"]] == 3)
+    assert(output.vectors["doc2"][vocab["llama"]] == 1)
+    assert(output.matrix.sum() == 8)
+    # term frequencies of every bucket, held in an array rather than a dict
+    assert(output.term_frequency[vocab["frank"]] == 4)
+    assert(len(output.term_frequency) == 64)
+    assert(not isinstance(output.term_frequency, dict))
+
+
+def test_labels():
+    vocab = output.vocabulary
+    assert(output.id_term_map[vocab["dog"]] == "dog")
+    assert(len(output.id_term_map) == 64)
+
+
+def test_collisions():
+    # with one bucket, every term collides; labels keep the first terms seen
+    vocab = HashingVocabulary(n_features=1, terms_per_bucket=2)
+    collided = hashing(sample_data, vocabulary=vocab)
+    assert(collided.vectors["doc1"] == {0: 5})
+    assert(vocab.collisions == {0: ["frank", "dog"]})
+    assert(collided.id_term_map[0] == "frank|dog")
+
+
+def test_no_labels():
+    unlabelled = hashing(sample_data, n_features=64, terms_per_bucket=0)
+    bucket = unlabelled.vocabulary["frank"]
+    assert(unlabelled.id_term_map[bucket] == "#{}".format(bucket))
+
+
+def test_stable_across_outputs():
+    restored = jsonpickle.decode(jsonpickle.encode(output.vocabulary))
+    new_output = hashing([("doc3", ["llama", "dog"])], vocabulary=restored)
+    assert(new_output.vectors["doc3"] == {output.vocabulary["llama"]: 1,
+                                          output.vocabulary["dog"]: 1})
+    assert(restored.id_term_map[restored["cat"]] == "cat")
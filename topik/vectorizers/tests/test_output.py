@@ -1,3 +1,5 @@
+import numpy as np
+
 from topik.vectorizers.vectorizer_output import VectorizerOutput
 
 sample_data = [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
@@ -17,3 +19,21 @@ def test_document_term_count():
 def test_term_frequency():
     # TODO: is there a better place to put this such that it gets tested on all vectorization methods?
     assert(type(output.term_frequency[1]) == int)
+
+
+def test_matrix():
+    assert(output.matrix.shape == (2, 4))
+    assert(output.doc_ids == ["doc1", "doc2"])
+    assert(output.matrix.indices.dtype == np.int32)
+    assert(output.matrix.sum() == 8)
+
+
+def test_vectors_from_dict():
+    from_dicts = VectorizerOutput(id_term_map=output.id_term_map,
+                                  document_term_counts=output.document_term_counts,
+                                  doc_lengths=output.doc_lengths,
+                                  term_frequency=output.term_frequency,
+                                  vectors=dict(output.get_vectors()))
+    assert(len(from_dicts) == 2)
+    for doc_id, vector in output.get_vectors():
+        assert(from_dicts.vectors[doc_id] == vector)
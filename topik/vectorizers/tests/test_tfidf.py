@@ -1,6 +1,8 @@
 import nose.tools as nt
+import numpy as np
 
-from topik.vectorizers.tfidf import tfidf
+from topik.vectorizers.bag_of_words import bag_of_words
+from topik.vectorizers.tfidf import tfidf, _count_document_occurences
 
 sample_data = [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
                 ("doc2", ["frank", "dog", "llama"]),
@@ -9,8 +11,34 @@ sample_data = [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
 output = tfidf(sample_data)
 
 def test_vectorize():
-    reference = {"doc1": {1: 0.0, 2: 0.0, 3: 0.69314718056},
-                 "doc2": {0: 0.69314718056, 1: 0.0, 2: 0.0}}
+    reference = {"doc1": {0: 0.0, 1: 0.0, 2: 0.69314718056},
+                 "doc2": {0: 0.0, 1: 0.0, 3: 0.69314718056}}
     for doc_id, doc in output.vectors.items():
         for word, val in doc.items():
             nt.assert_almost_equal(val, reference[doc_id][word])
+
+
+def test_document_occurrences():
+    counts = bag_of_words(sample_data).matrix
+    nt.assert_equal(sorted(_count_document_occurences(counts, 4).tolist()), [1, 1, 2, 2])
+
+
+def test_sublinear_tf():
+    sublinear = tfidf(sample_data, sublinear_tf=True)
+    cat_id = sublinear.term_id_map["cat"]
+    frank_id = sublinear.term_id_map["frank"]
+    nt.assert_almost_equal(sublinear.vectors["doc1"][cat_id], 0.69314718056)
+    nt.assert_almost_equal(sublinear.vectors["doc1"].get(frank_id, 0), 0)
+
+
+def test_smooth_idf():
+    smoothed = tfidf(sample_data, smooth_idf=True)
+    cat_id = smoothed.term_id_map["cat"]
+    nt.assert_almost_equal(smoothed.vectors["doc1"][cat_id], np.log(3 / 2.))
+
+
+def test_l2_norm():
+    normalized = tfidf(sample_data, sublinear_tf=True, smooth_idf=True, norm='l2')
+    for doc_id, doc in normalized.get_vectors():
+        nt.assert_almost_equal(sum(val ** 2 for val in doc.values()), 1, places=6)
+    nt.assert_raises(ValueError, tfidf, sample_data, norm='l1')
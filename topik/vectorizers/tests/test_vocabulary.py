@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+import numpy as np
+
+from topik.vectorizers import Vocabulary
+from topik.vectorizers.vocabulary import _IdTermView
+from topik.vectorizers.bag_of_words import bag_of_words
+from topik.vectorizers.tfidf import tfidf
+
+sample_data = [("doc1", ["frank", "frank", "frank", "dog", "cat"]),
+               ("doc2", ["frank", "dog", "llama"]),
+               ]
+
+
+def test_ids_in_order_of_appearance():
+    vocab = Vocabulary(["frank", "dog", "frank", "cat"])
+    assert(list(vocab) == ["frank", "dog", "cat"])
+    assert(vocab.id_term_map == {0: "frank", 1: "dog", 2: "cat"})
+    assert(vocab.add("llama") == 3)
+    assert(vocab.add("dog") == 1)
+
+
+def test_ids_stable_across_runs():
+    assert(bag_of_words(sample_data).vocabulary == bag_of_words(sample_data).vocabulary)
+    # in order of first appearance, whatever the hashes of the terms
+    assert(list(bag_of_words(sample_data).vocabulary) == ["frank", "dog", "cat", "llama"])
+    fruit = ["zebra", "apple", "mango", "kiwi", "banana"]
+    assert(list(bag_of_words([("doc1", fruit)]).vocabulary) == fruit)
+
+
+def test_prune():
+    vocab = Vocabulary(["frank", "dog", "cat", "llama"])
+    df = np.array([2, 2, 1, 1])
+    pruned, kept_ids = vocab.prune(df, ndocs=2, max_df=0.5)
+    assert(list(pruned) == ["cat", "llama"])
+    assert(kept_ids.tolist() == [2, 3])
+    pruned, kept_ids = vocab.prune(df, ndocs=2, max_features=3,
+                                   term_frequency=np.array([4, 2, 1, 3]))
+    assert(list(pruned) == ["frank", "dog", "llama"])
+
+
+def test_save_load():
+    vocab = Vocabulary([u"frank", u"dog", u"caf\xe9", u"llama"])
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        vocab.save(filename)
+        for mmap in (True, False):
+            loaded = Vocabulary.load(filename, mmap=mmap)
+            assert(loaded == vocab)
+            assert(loaded[u"caf\xe9"] == 2)
+            assert(loaded.term(3) == u"llama")
+            assert(u"cat" not in loaded)
+        loaded = Vocabulary.load(filename)
+        assert(loaded.add(u"cat") == 4)
+        assert(loaded[u"dog"] == 1)
+    finally:
+        os.remove(filename)
+
+
+def test_merge():
+    vocab = Vocabulary(["frank", "dog"])
+    remap = vocab.merge(Vocabulary(["llama", "dog"]))
+    assert(remap.tolist() == [2, 1])
+    assert(list(vocab) == ["frank", "dog", "llama"])
+
+
+def test_prebuilt_vocabulary():
+    vocab = Vocabulary(["dog", "frank"])
+    output = bag_of_words(sample_data, vocabulary=vocab)
+    assert(output.vectors["doc1"] == {0: 1, 1: 3})
+    assert(output.vectors["doc2"] == {0: 1, 1: 1})
+    assert(len(vocab) == 2)
+    assert(tfidf(sample_data, vocabulary=Vocabulary(["cat", "zebra"])).matrix.shape == (2, 2))
+
+
+def test_pruned_vectorizer():
+    output = bag_of_words(sample_data, min_df=2)
+    assert(list(output.vocabulary) == ["frank", "dog"])
+    assert(output.vectors["doc1"] == {0: 3, 1: 1})
+    assert(output.term_frequency == {0: 4, 1: 2})
+    # document lengths still count every token
+    assert(output.doc_lengths["doc1"] == 5)
+
+
+def test_id_term_view():
+    view = _IdTermView([u"frank", u"dog"])
+    assert(view[1] == u"dog")
+    for missing in (-1, 2, u"dog"):
+        assert(missing not in view)
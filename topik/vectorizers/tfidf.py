@@ -1,29 +1,99 @@
-from math import log
+from functools import partial
+
+import numpy as np
+from scipy import sparse
+
 from ._registry import register
-from vectorizer_output import VectorizerOutput
-from .bag_of_words import _count_words_in_docs
+from .vectorizer_output import VectorizerOutput
 
 
 def _count_document_occurences(doc_counts, total_words):
-    return {word_id: sum(1 for doc in doc_counts.values() if word_id in doc)
-            for word_id in range(total_words)}
-
-
-def _calculate_tfidf(tokenized_corpus, vectorizer_output):
-    tokens = list(tokenized_corpus)
-    doc_counts = _count_words_in_docs(tokens, vectorizer_output)
-    document_occurrences = _count_document_occurences(doc_counts, vectorizer_output.global_term_count)
-    idf = {word_id: log(len(tokens) / (document_occurrences[word_id]))
-           for word_id in range(vectorizer_output.global_term_count)}
-    tf_idf = {}
-    # TODO: this is essentially a sparse matrix multiply and could be done much more efficiently
-    for id, doc in doc_counts.items():
-        tf_idf[id] = {}
-        for word_id, count in doc.items():
-            tf_idf[id].update({word_id: count*idf[word_id]})
+    """Number of documents each term occurs in: the nonzero count of each column"""
+    return np.bincount(doc_counts.indices, minlength=total_words)
+
+
+def _inverse_document_frequency(document_occurrences, ndocs, smooth_idf=False):
+    document_occurrences = document_occurrences.astype(np.float64)
+    if smooth_idf:
+        # as if one extra document contained every term once; avoids division by zero
+        #    for terms that never occur (e.g. when using a prebuilt vocabulary)
+        return np.log((ndocs + 1.0) / (document_occurrences + 1.0))
+    # terms with no occurrences get an infinite idf, but have no entries to scale
+    with np.errstate(divide='ignore'):
+        return np.log(float(ndocs) / document_occurrences)
+
+
+def _tfidf_matrix(doc_counts, sublinear_tf=False, smooth_idf=False, norm=None):
+    """Weight a CSR matrix of term counts by inverse document frequency.
+
+    Parameters
+    ----------
+    doc_counts : scipy.sparse.csr_matrix
+        documents x terms matrix of raw term counts
+    sublinear_tf : bool
+        Replace term counts with 1 + log(count)
+    smooth_idf : bool
+        Use log((1 + ndocs) / (1 + df)) rather than log(ndocs / df)
+    norm : None or 'l2'
+        Normalize each document vector to unit length
+
+    Examples
+    --------
+    >>> counts = sparse.csr_matrix(np.array([[0, 3, 1, 1], [1, 1, 1, 0]]))
+    >>> weights = _tfidf_matrix(counts)
+    >>> weights.nnz
+    2
+    >>> np.allclose(weights.toarray(), [[0, 0, 0, np.log(2)], [np.log(2), 0, 0, 0]])
+    True
+    """
+    ndocs, nterms = doc_counts.shape
+    idf = _inverse_document_frequency(_count_document_occurences(doc_counts, nterms),
+                                      ndocs, smooth_idf=smooth_idf)
+    tf = doc_counts.astype(np.float64)
+    if sublinear_tf:
+        tf.data = 1 + np.log(tf.data)
+    # column scaling by idf is a product with a diagonal matrix
+    tf_idf = tf * sparse.diags(idf, 0)
+    if norm == 'l2':
+        row_norms = np.sqrt(np.asarray(tf_idf.multiply(tf_idf).sum(axis=1)).ravel())
+        row_norms[row_norms == 0] = 1
+        tf_idf = sparse.diags(1 / row_norms, 0) * tf_idf
+    elif norm is not None:
+        raise ValueError("Unsupported norm: {}.  Use 'l2' or None.".format(norm))
+    tf_idf = tf_idf.astype(np.float32).tocsr()
+    tf_idf.sort_indices()
     return tf_idf
 
 
+def _calculate_tfidf(doc_counts, vectorizer_output, sublinear_tf=False,
+                     smooth_idf=False, norm=None):
+    return _tfidf_matrix(doc_counts, sublinear_tf=sublinear_tf,
+                         smooth_idf=smooth_idf, norm=norm)
+
+
 @register
-def tfidf(tokenized_corpus):
-    return VectorizerOutput(tokenized_corpus, _calculate_tfidf)
+def tfidf(tokenized_corpus, sublinear_tf=False, smooth_idf=False, norm=None,
+          vocabulary=None, min_df=1, max_df=1.0, max_features=None):
+    """Weight term counts by inverse document frequency.
+
+    Parameters
+    ----------
+    tokenized_corpus : iterable of tuple of (doc_id, list of str)
+        tokenized documents
+    sublinear_tf : bool
+        Replace term counts with 1 + log(count)
+    smooth_idf : bool
+        Use log((1 + ndocs) / (1 + df)) rather than log(ndocs / df)
+    norm : None or 'l2'
+        Normalize each document vector to unit length
+    vocabulary : None or Vocabulary
+        Prebuilt vocabulary to use.  Terms missing from it are ignored.  If None,
+        a new vocabulary is built from the documents.
+    min_df, max_df, max_features :
+        pruning of a newly built vocabulary; see :meth:`~.Vocabulary.prune`
+    """
+    return VectorizerOutput(tokenized_corpus,
+                            partial(_calculate_tfidf, sublinear_tf=sublinear_tf,
+                                    smooth_idf=smooth_idf, norm=norm),
+                            vocabulary=vocabulary, min_df=min_df, max_df=max_df,
+                            max_features=max_features)
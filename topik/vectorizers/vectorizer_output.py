@@ -1,81 +1,280 @@
+from array import array
 from collections import Counter
-import itertools
+import numbers
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
-def _accumulate_terms(tokenized_corpus):
-    global_terms=set()
-    document_term_counts = {}
-    doc_lengths = {}
-    global_term_frequency_counter = Counter()
+import numpy as np
+from scipy import sparse
+from six.moves import range
+
+from .vocabulary import Vocabulary
+
+
+def _count_terms(tokenized_corpus, vocabulary, grow_vocabulary=True):
+    """Count terms for each document in a single pass over the tokenized corpus.
+
+    New terms are added to vocabulary as they are first seen, unless
+    grow_vocabulary is False, in which case terms missing from the vocabulary are
+    ignored.  Returns the list of doc ids, a CSR matrix of term counts (rows follow
+    doc ids) and an array of document lengths.  Token lists are discarded as soon as
+    they are counted.
+    """
+    doc_ids = []
+    doc_lengths = array('l')
+    indptr = array('l', [0])
+    indices = array('i')
+    counts = array('i')
     for doc_id, doc in tokenized_corpus:
-        doc_terms = set(doc)
-        global_terms.update(doc_terms)
-        doc_lengths[doc_id] = len(doc)
-        document_term_counts[doc_id] = len(doc_terms)
-        global_term_frequency_counter.update(doc)
-    id_term_map = {}
-    global_term_frequency = {}
-    for term_id, term in enumerate(global_terms):
-        id_term_map[term_id] = term
-        global_term_frequency[term_id] = global_term_frequency_counter[term]
+        doc_ids.append(doc_id)
+        doc_lengths.append(len(doc))
+        if grow_vocabulary:
+            # ids follow the order terms first appear in, not the order of the Counter
+            for term in doc:
+                vocabulary.add(term)
+        for term, count in Counter(doc).items():
+            term_id = vocabulary.get(term)
+            if term_id is None:
+                continue
+            indices.append(term_id)
+            counts.append(count)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix((np.frombuffer(counts, dtype=np.intc).astype(np.int32),
+                                np.frombuffer(indices, dtype=np.intc).astype(np.int32),
+                                np.frombuffer(indptr, dtype=np.int_).astype(np.int64)),
+                               shape=(len(doc_ids), len(vocabulary)))
+    # distinct terms can share an id in a hashing vocabulary
+    matrix.sum_duplicates()
+    return doc_ids, matrix, np.frombuffer(doc_lengths, dtype=np.int_).astype(np.int64)
+
+
+def _dict_to_csr(vectors, ncols, dtype=None):
+    """Convert a mapping of doc id to {term id: weight} into (doc_ids, csr_matrix).
+
+    Rows of the returned matrix follow the iteration order of ``vectors``."""
+    doc_ids = []
+    indptr = [0]
+    indices = []
+    data = []
+    for doc_id, vector in vectors.items():
+        doc_ids.append(doc_id)
+        indices.extend(int(term_id) for term_id in vector.keys())
+        data.extend(vector.values())
+        indptr.append(len(indices))
+    if dtype is None:
+        dtype = np.int32 if all(isinstance(value, numbers.Integral) for value in data) \
+            else np.float32
+    matrix = sparse.csr_matrix((np.asarray(data, dtype=dtype),
+                                np.asarray(indices, dtype=np.int32),
+                                np.asarray(indptr, dtype=np.int64)),
+                               shape=(len(doc_ids), ncols))
+    matrix.sort_indices()
+    return doc_ids, matrix
+
+
+def _csr_bow(matrix):
+    """Yield each row of a CSR matrix as a list of (column, value) pairs"""
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+    for row in range(matrix.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        yield list(zip(indices[start:end].tolist(), data[start:end].tolist()))
+
+
+class IndexedArrayView(Mapping):
+    """Read-only mapping of ids to the rows of an array.
+
+    Lets array-backed outputs keep their dict-like interface; the id -> row
+    index is only built when a value is looked up by id."""
+    def __init__(self, ids, values):
+        self._ids = ids
+        self._values = values
+        self._row_index = None
+
+    def row(self, row_number):
+        value = self._values[row_number]
+        return value.item() if np.ndim(value) == 0 else value
+
+    def __getitem__(self, key):
+        if self._row_index is None:
+            self._row_index = {id: row for row, id in enumerate(self._ids)}
+        return self.row(self._row_index[key])
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def iteritems(self):
+        for row_number, id in enumerate(self._ids):
+            yield id, self.row(row_number)
+
 
-    return id_term_map, document_term_counts, doc_lengths, global_term_frequency
+class PositionalArrayView(IndexedArrayView):
+    """Read-only mapping of the ids 0..n-1 to the items of an array"""
+    def __init__(self, values):
+        super(PositionalArrayView, self).__init__(range(len(values)), values)
+
+    def __getitem__(self, key):
+        if not 0 <= key < len(self._values):
+            raise KeyError(key)
+        return self.row(key)
+
+
+class SparseRowsView(IndexedArrayView):
+    """Read-only mapping of doc id to a {term id: weight} dict, backed by the rows
+    of a CSR matrix.  Rows are only expanded into dicts when they are accessed."""
+    def row(self, row_number):
+        start, end = self._values.indptr[row_number], self._values.indptr[row_number + 1]
+        return dict(zip(self._values.indices[start:end].tolist(),
+                        self._values.data[start:end].tolist()))
 
 
 class VectorizerOutput(object):
+    """Vectorized representation of a tokenized corpus.
+
+    Document vectors are held in a scipy CSR matrix (int32 term ids as column
+    indices, int32 counts or float32 weights as data), with one row per document.
+    Row order is given by ``doc_ids``.  Per-document statistics are stored as
+    arrays aligned with the rows.
+
+    The tokenized corpus is consumed in a single pass that assigns term ids and
+    counts terms.  vectorizer_func is then called with the resulting CSR matrix of
+    raw term counts and this object, and must return a CSR matrix of the same shape.
+
+    Term ids come from a :class:`~.Vocabulary`.  If a prebuilt vocabulary is given,
+    it is used as-is: terms it does not contain are ignored, so new documents can be
+    vectorized consistently with an earlier corpus.  Otherwise a new vocabulary is
+    built, optionally pruned with min_df, max_df and max_features (see
+    :meth:`~.Vocabulary.prune`).
+    """
     def __init__(self, tokenized_corpus=None, vectorizer_func=None,
                  id_term_map=None, document_term_counts=None, doc_lengths=None,
-                 term_frequency=None, vectors=None):
-        if tokenized_corpus and vectorizer_func and not vectors:
-            iter1, iter2 = itertools.tee(tokenized_corpus)
-            self._id_term_map, self._document_term_counts, self._doc_lengths, \
-                self._term_frequency = _accumulate_terms(iter1)
-            self._term_id_map = {term: id
-                                 for id, term in self._id_term_map.items()}
-            self._vectors = vectorizer_func(iter2, self)
-        elif id_term_map and document_term_counts and doc_lengths and \
-                term_frequency and vectors:
-            self._id_term_map = id_term_map
-            self._term_id_map = {term: id for id, term in self._id_term_map.items()}
-            self._document_term_counts = document_term_counts
-            self._doc_lengths = doc_lengths
+                 term_frequency=None, vectors=None, doc_ids=None, vocabulary=None,
+                 min_df=1, max_df=1.0, max_features=None):
+        if tokenized_corpus and vectorizer_func and vectors is None:
+            prebuilt = vocabulary is not None
+            self._vocabulary = vocabulary if prebuilt else Vocabulary()
+            self._doc_ids, counts, self._doc_lengths = _count_terms(
+                tokenized_corpus, self._vocabulary, grow_vocabulary=not prebuilt)
+            if not prebuilt and (min_df != 1 or max_df != 1.0 or max_features is not None):
+                counts = self._prune(counts, min_df, max_df, max_features)
+            self._document_term_counts = np.diff(counts.indptr)
+            self._term_frequency = PositionalArrayView(
+                np.bincount(counts.indices, weights=counts.data,
+                            minlength=counts.shape[1]).astype(np.int64))
+            self._matrix = vectorizer_func(counts, self)
+        elif (id_term_map or vocabulary is not None) and document_term_counts and \
+                doc_lengths and term_frequency and vectors is not None:
+            self._vocabulary = vocabulary if vocabulary is not None else \
+                Vocabulary.from_id_term_map(id_term_map)
             self._term_frequency = term_frequency
-            self._vectors = vectors
+            if sparse.issparse(vectors):
+                if doc_ids is None or len(doc_ids) != vectors.shape[0]:
+                    raise ValueError("doc_ids must be given for each row of a sparse vectors matrix.")
+                self._doc_ids = list(doc_ids)
+                self._matrix = vectors.tocsr()
+            else:
+                self._doc_ids, self._matrix = _dict_to_csr(vectors, len(self._vocabulary))
+            self._document_term_counts = np.array([document_term_counts[doc_id]
+                                                   for doc_id in self._doc_ids])
+            self._doc_lengths = np.array([doc_lengths[doc_id] for doc_id in self._doc_ids])
         else:
             raise ValueError(
                 "Must provide either tokenized corpora and vectorizer func, "
                 "or global term collection, document term counts, and vectors.")
+        self._views = {}
+
+    @classmethod
+    def from_arrays(cls, vocabulary, doc_ids, matrix, document_term_counts, doc_lengths,
+                    term_frequency):
+        """Wrap already computed data, such as memory-mapped arrays, without copying it.
+
+        matrix is a CSR matrix; document_term_counts and doc_lengths are arrays aligned
+        with its rows, and doc_ids is any sequence of ids for them.  term_frequency
+        maps term ids to corpus-wide counts.
+        """
+        output = cls.__new__(cls)
+        output._vocabulary = vocabulary
+        output._doc_ids = doc_ids
+        output._matrix = matrix
+        output._document_term_counts = document_term_counts
+        output._doc_lengths = doc_lengths
+        output._term_frequency = term_frequency
+        output._views = {}
+        return output
+
+    def _prune(self, counts, min_df, max_df, max_features):
+        term_frequency = np.bincount(counts.indices, weights=counts.data,
+                                     minlength=counts.shape[1])
+        self._vocabulary, kept_ids = self._vocabulary.prune(
+            np.bincount(counts.indices, minlength=counts.shape[1]), counts.shape[0],
+            min_df=min_df, max_df=max_df, max_features=max_features,
+            term_frequency=term_frequency)
+        counts = counts[:, kept_ids].tocsr()
+        counts.sort_indices()
+        return counts
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_views"] = {}
+        return state
+
+    def _view(self, name, view_class, values):
+        if name not in self._views:
+            self._views[name] = view_class(self._doc_ids, values)
+        return self._views[name]
 
     def get_vectors(self):
-        for doc_id, vector in self._vectors.items():
-            yield doc_id, vector
+        return self.vectors.iteritems()
+
+    def iter_bow(self):
+        """Yield the vector of each document, in doc_ids order, as a list of
+        (term_id, weight) pairs"""
+        return _csr_bow(self._matrix)
 
     def __len__(self):
-        return len(self._vectors)
+        return len(self._doc_ids)
+
+    @property
+    def vocabulary(self):
+        return self._vocabulary
 
     @property
     def id_term_map(self):
-        return self._id_term_map
+        return self._vocabulary.id_term_map
 
     @property
     def term_id_map(self):
-        return self._term_id_map
+        return self._vocabulary.term_id_map
 
     @property
     def global_term_count(self):
-        return len(self.id_term_map)
+        return len(self._vocabulary)
 
     @property
     def document_term_counts(self):
-        return self._document_term_counts
+        return self._view("document_term_counts", IndexedArrayView, self._document_term_counts)
 
     @property
     def doc_lengths(self):
-        return self._doc_lengths
+        return self._view("doc_lengths", IndexedArrayView, self._doc_lengths)
 
     @property
     def term_frequency(self):
         return self._term_frequency
 
+    @property
+    def doc_ids(self):
+        return self._doc_ids
+
+    @property
+    def matrix(self):
+        """CSR matrix of shape (documents, global_term_count); rows follow doc_ids"""
+        return self._matrix
+
     @property
     def vectors(self):
-        return self._vectors
+        return self._view("vectors", SparseRowsView, self._matrix)
@@ -0,0 +1,291 @@
+import numbers
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+import numpy as np
+
+_MAGIC = b"TPKVOCAB"
+_VERSION = 1
+# magic, then version, number of terms and size of the string blob as int64
+_HEADER_SIZE = len(_MAGIC) + 3 * 8
+
+
+def _encode(term):
+    return term if isinstance(term, bytes) else term.encode("utf-8")
+
+
+class _PackedTerms(Sequence):
+    """id -> term lookup over the sorted string blob of a saved vocabulary"""
+    def __init__(self, offsets, positions, blob):
+        self._offsets = offsets
+        self._positions = positions
+        self._blob = blob
+
+    def sorted_term(self, position):
+        return self._blob[self._offsets[position]:self._offsets[position + 1]].tobytes()
+
+    def __getitem__(self, term_id):
+        if not 0 <= term_id < len(self):
+            raise IndexError(term_id)
+        return self.sorted_term(self._positions[term_id]).decode("utf-8")
+
+    def __len__(self):
+        return len(self._positions)
+
+
+class _PackedIndex(Mapping):
+    """term -> id lookup by binary search over the sorted string blob"""
+    def __init__(self, packed_terms, sorted_ids):
+        self._packed_terms = packed_terms
+        self._sorted_ids = sorted_ids
+
+    def __getitem__(self, term):
+        key = _encode(term)
+        low, high = 0, len(self._sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self._packed_terms.sorted_term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._sorted_ids) and self._packed_terms.sorted_term(low) == key:
+            return int(self._sorted_ids[low])
+        raise KeyError(term)
+
+    def __iter__(self):
+        for position in range(len(self._sorted_ids)):
+            yield self._packed_terms.sorted_term(position).decode("utf-8")
+
+    def __len__(self):
+        return len(self._sorted_ids)
+
+
+class _IdTermView(Mapping):
+    """Read-only {term id: term} mapping over a sequence of terms, such as the packed
+    terms of a memory-mapped vocabulary, so that they are not decoded into a dict"""
+    def __init__(self, terms):
+        self._terms = terms
+
+    def __getitem__(self, term_id):
+        # negative indices would count from the end of the terms
+        if isinstance(term_id, numbers.Integral) and term_id < 0:
+            raise KeyError(term_id)
+        try:
+            return self._terms[term_id]
+        except (IndexError, TypeError):
+            raise KeyError(term_id)
+
+    def __iter__(self):
+        return iter(range(len(self._terms)))
+
+    def __len__(self):
+        return len(self._terms)
+
+
+class Vocabulary(object):
+    """Stable mapping between terms and integer ids.
+
+    Ids are assigned in order of first appearance, so the same documents in the
+    same order always produce the same ids, independent of hashing or process.
+    A saved vocabulary can be memory-mapped back in; lookups then binary search the
+    file rather than building dicts, until a new term is added.
+
+    Examples
+    --------
+    >>> vocab = Vocabulary(["frank", "dog", "frank", "cat"])
+    >>> vocab["dog"], vocab.term(2), len(vocab)
+    (1, 'cat', 3)
+    >>> vocab.get("llama") is None
+    True
+    """
+    def __init__(self, terms=None):
+        self._terms = []
+        self._ids = {}
+        self._mapped = False
+        self._id_term_map = None
+        if terms is not None:
+            for term in terms:
+                self.add(term)
+
+    @classmethod
+    def from_id_term_map(cls, id_term_map):
+        """Build a vocabulary from a {term_id: term} dict with ids 0..n-1"""
+        terms = [None] * len(id_term_map)
+        for term_id, term in id_term_map.items():
+            term_id = int(term_id)
+            if not 0 <= term_id < len(terms):
+                raise ValueError("Term ids must run from 0 to {}".format(len(terms) - 1))
+            terms[term_id] = term
+        vocab = cls()
+        vocab._terms = terms
+        vocab._ids = {term: term_id for term_id, term in enumerate(terms)}
+        return vocab
+
+    def _thaw(self):
+        """Turn a memory-mapped vocabulary into an in-memory one, so it can grow"""
+        self._terms = list(self._terms)
+        self._ids = {term: term_id for term_id, term in enumerate(self._terms)}
+        self._mapped = False
+        self._id_term_map = None
+
+    def add(self, term):
+        """Return the id of term, assigning the next free id if it is new"""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            if self._mapped:
+                self._thaw()
+            term_id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+            self._id_term_map = None
+        return term_id
+
+    def get(self, term, default=None):
+        return self._ids.get(term, default)
+
+    def term(self, term_id):
+        return self._terms[term_id]
+
+    def __getitem__(self, term):
+        return self._ids[term]
+
+    def __contains__(self, term):
+        return self._ids.get(term) is not None
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __eq__(self, other):
+        return isinstance(other, Vocabulary) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return {"terms": list(self._terms)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._terms = state["terms"]
+        self._ids = {term: term_id for term_id, term in enumerate(self._terms)}
+
+    @property
+    def id_term_map(self):
+        if self._id_term_map is None:
+            self._id_term_map = _IdTermView(self._terms) if self._mapped else \
+                dict(enumerate(self._terms))
+        return self._id_term_map
+
+    @property
+    def term_id_map(self):
+        return self._ids
+
+    def merge(self, other):
+        """Add the terms of another vocabulary (in its id order).
+
+        Returns an array mapping each id of other to its id in this vocabulary, for
+        remapping the columns of results computed against other.
+        """
+        return np.array([self.add(term) for term in other], dtype=np.int32)
+
+    def prune(self, document_frequency, ndocs, min_df=1, max_df=1.0, max_features=None,
+              term_frequency=None):
+        """Drop rare, overly common or surplus terms.
+
+        Parameters
+        ----------
+        document_frequency : array of int
+            number of documents containing each term, indexed by term id
+        ndocs : int
+            number of documents that document_frequency was counted over
+        min_df : int or float
+            Minimum number of documents (int) or proportion of documents (float)
+            a term must appear in
+        max_df : int or float
+            Maximum number (int) or proportion (float) of documents a term may appear in
+        max_features : None or int
+            Keep at most this many terms, preferring the most frequent ones
+        term_frequency : None or array of int
+            corpus-wide count of each term, used to rank terms for max_features.
+            Defaults to document_frequency.
+
+        Returns
+        -------
+        (Vocabulary, kept_ids): the pruned vocabulary, whose ids keep the relative
+        order of the original ids, and the sorted array of original ids that survived.
+
+        Examples
+        --------
+        >>> vocab = Vocabulary(["frank", "dog", "cat", "llama"])
+        >>> pruned, kept_ids = vocab.prune(np.array([2, 2, 1, 1]), ndocs=2, min_df=2)
+        >>> list(pruned), kept_ids.tolist()
+        (['frank', 'dog'], [0, 1])
+        """
+        document_frequency = np.asarray(document_frequency)
+        min_count = min_df if isinstance(min_df, numbers.Integral) else min_df * ndocs
+        max_count = max_df if isinstance(max_df, numbers.Integral) else max_df * ndocs
+        keep = (document_frequency >= min_count) & (document_frequency <= max_count)
+        kept_ids = np.flatnonzero(keep)
+        if max_features is not None and len(kept_ids) > max_features:
+            ranking = document_frequency if term_frequency is None else np.asarray(term_frequency)
+            # stable sort, so that ties are broken by term id
+            most_frequent = np.argsort(-ranking[kept_ids], kind="mergesort")[:max_features]
+            kept_ids = np.sort(kept_ids[most_frequent])
+        pruned = Vocabulary()
+        pruned._terms = [self._terms[term_id] for term_id in kept_ids]
+        pruned._ids = {term: term_id for term_id, term in enumerate(pruned._terms)}
+        return pruned, kept_ids.astype(np.int32)
+
+    def save(self, filename):
+        """Write the vocabulary in a compact binary layout that can be memory-mapped.
+
+        The file holds the terms sorted as utf-8 strings in one blob, with an
+        offsets array into the blob, the id of each sorted term and the sorted
+        position of each id.
+        """
+        encoded = [_encode(term) for term in self._terms]
+        order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        offsets[1:] = np.cumsum([len(encoded[term_id]) for term_id in order])
+        sorted_ids = np.array(order, dtype="<i4")
+        positions = np.empty(len(encoded), dtype="<i4")
+        positions[sorted_ids] = np.arange(len(encoded), dtype="<i4")
+        with open(filename, "wb") as f:
+            f.write(_MAGIC)
+            f.write(np.array([_VERSION, len(encoded), offsets[-1]], dtype="<i8").tobytes())
+            f.write(offsets.tobytes())
+            f.write(sorted_ids.tobytes())
+            f.write(positions.tobytes())
+            f.write(b"".join(encoded[term_id] for term_id in order))
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """Load a saved vocabulary.  With mmap, nothing is decoded up front."""
+        if mmap:
+            data = np.memmap(filename, dtype=np.uint8, mode="r")
+        else:
+            data = np.fromfile(filename, dtype=np.uint8)
+        if data[:len(_MAGIC)].tobytes() != _MAGIC:
+            raise ValueError("{} is not a saved topik vocabulary".format(filename))
+        version, nterms, blob_size = data[len(_MAGIC):_HEADER_SIZE].view("<i8").tolist()
+        if version != _VERSION:
+            raise ValueError("Unsupported vocabulary file version: {}".format(version))
+        position = _HEADER_SIZE
+        offsets = data[position:position + 8 * (nterms + 1)].view("<i8")
+        position += 8 * (nterms + 1)
+        sorted_ids = data[position:position + 4 * nterms].view("<i4")
+        position += 4 * nterms
+        positions = data[position:position + 4 * nterms].view("<i4")
+        position += 4 * nterms
+        blob = data[position:position + blob_size]
+        vocab = cls()
+        vocab._terms = _PackedTerms(offsets, positions, blob)
+        vocab._ids = _PackedIndex(vocab._terms, sorted_ids)
+        vocab._mapped = True
+        if not mmap:
+            vocab._thaw()
+        return vocab
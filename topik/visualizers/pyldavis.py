@@ -3,25 +3,19 @@ import logging
 from ._registry import register
 
 def _to_py_lda_vis(modeled_corpus):
-    vocab = pd.Series(modeled_corpus.vocab)
-    term_frequency = pd.Series(modeled_corpus.term_frequency)
-    topic_term_matrix = pd.DataFrame(modeled_corpus.topic_term_matrix)
-
-    doc_lengths = pd.Series(modeled_corpus.doc_lengths)
-    doc_topic_matrix = pd.DataFrame(modeled_corpus.doc_topic_matrix).T
-
-    term_data = topic_term_matrix
-    term_data['term_frequency'] = term_frequency
-    term_data['vocab'] = vocab
-
-    doc_data = doc_topic_matrix
-    doc_data['doc_length'] = doc_lengths
-
-    model_vis_data = {  'vocab': term_data['vocab'],
-                            'term_frequency': term_data['term_frequency'],
-                            'topic_term_dists': term_data.iloc[:,:-2].T,
-                            'doc_topic_dists': doc_data.iloc[:,:-1],
-                            'doc_lengths': doc_data['doc_length']}
+    topic_term = modeled_corpus.topic_term_array
+    term_ids = range(topic_term.shape[1])
+    vocab = modeled_corpus.vocab
+    term_frequency = modeled_corpus.term_frequency
+    doc_ids = modeled_corpus.doc_ids
+    doc_lengths = modeled_corpus.doc_lengths
+
+    model_vis_data = {  'vocab': pd.Series([vocab[term_id] for term_id in term_ids]),
+                            'term_frequency': pd.Series([term_frequency[term_id] for term_id in term_ids]),
+                            'topic_term_dists': pd.DataFrame(topic_term, index=modeled_corpus.topic_ids),
+                            'doc_topic_dists': pd.DataFrame(modeled_corpus.doc_topic_array, index=doc_ids),
+                            'doc_lengths': pd.Series([doc_lengths[doc_id] for doc_id in doc_ids],
+                                                     index=doc_ids)}
     return model_vis_data
 
 @register
@@ -12,11 +12,13 @@ from topik.models.tests.test_data import test_model_output
 
 def _get_top_words(modeled_corpus, topn):
     top_words = []
-    # each "topic" is a row of the dz matrix
-    for topic_id, topic_term_dist in modeled_corpus.topic_term_matrix.items():
-        word_ids = np.argpartition(topic_term_dist, -topn)[-topn:]
-        word_ids = reversed(np.array(word_ids)[np.argsort(np.array(topic_term_dist)[word_ids])])
-        top_words.append([(int(topic_id[5:]), topic_term_dist[word_id],
+    topic_term = modeled_corpus.topic_term_array
+    topn = min(topn, topic_term.shape[1])
+    # each "topic" is a row of the zw matrix; pick its topn largest weights, then order them
+    top_ids = np.argpartition(topic_term, -topn, axis=1)[:, -topn:]
+    for topic_no, word_ids in enumerate(top_ids):
+        word_ids = word_ids[np.argsort(topic_term[topic_no, word_ids])[::-1]]
+        top_words.append([(topic_no, topic_term[topic_no, word_id],
                            modeled_corpus.vocab[word_id]) for word_id in word_ids])
     return top_words
 